@@ -0,0 +1,768 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# File:     benchmark.py
+# Program:  trackademic
+# Desc:     Benchmarks for the trackademic API's storage and indexing. Run with the name of a
+#           benchmark, e.g. `python benchmark.py journal`, or with no arguments to run them all.
+#
+# Author:   Brendan Liang
+# Created:  16-10-2026
+# Modified: 17-10-2026
+
+from hashlib import sha256
+import datetime
+import os
+import subprocess
+import sys
+import tempfile
+import json
+import time
+import binary
+import indexes
+import storage
+
+# Function: make_dataset
+# Desc:    Generates a synthetic dataset of users, each with their own events, plus one group per school.
+# Input:   user_count (int): The number of users to generate.
+#          events_per_user (int): The number of events each user has.
+# Output:  tuple[dict, dict, dict]: The users, groups and events dictionaries.
+def make_dataset(user_count:int, events_per_user:int=10):
+    users = {}
+    groups = {}
+    all_events = {}
+    start = datetime.date(2025, 1, 1)
+    for i in range(user_count):
+        username = f"user{i}"
+        school = f"School {i % 50}"
+        group_id = sha256(f"Class{school}".encode()).hexdigest()
+        events = {}
+        for n in range(1, events_per_user + 1):
+            event_id = sha256(f"{username}{n}".encode()).hexdigest()
+            events[event_id] = {
+                "id": event_id,
+                "numerical_id": n,
+                "title": f"Event {n}",
+                "description": "Benchmark event",
+                "type": "SAC",
+                "date": (start + datetime.timedelta(days=(i + n) % 365)).isoformat(),
+                "start_time": n % 23,
+                "end_time": n % 23 + 1,
+                "group_id": "",
+                "colour": "#7B68EE",
+                "owner": username,
+                "visible": False,
+            }
+        all_events.update(events)
+        users[username] = {
+            "username": username,
+            "display_name": "",
+            "password_hash": sha256(username.encode()).hexdigest(),
+            "school": school,
+            "groups": {group_id: True},
+            "events": dict.fromkeys(events, True),
+            "saved": {},
+        }
+        group = groups.setdefault(group_id, {
+            "id": group_id,
+            "name": "Class",
+            "description": "Benchmark class",
+            "school": school,
+            "members": {},
+            "member_count": 0,
+            "events": {},
+            "colour": "#FF5722",
+            "owner": username,
+        })
+        group["members"][username] = True
+        group["member_count"] += 1
+    return users, groups, all_events
+
+# Function: all_changes
+# Desc:    Lists every document in a dataset as a change, for writing it in one commit.
+# Input:   users (dict): All users.
+#          groups (dict): All groups.
+#          events (dict): All events.
+# Output:  list[tuple[str, str]]: ("user" | "group" | "event", key) pairs.
+def all_changes(users, groups, events):
+    return [("user", key) for key in users] + [("group", key) for key in groups] + [("event", key) for key in events]
+
+# Function: edit_event
+# Desc:    Edits the title of a user's first event, as /users/{username}/events/edit does.
+# Input:   users (dict): All users.
+#          events (dict): All events.
+#          username (str): The user whose event to edit.
+#          i (int): The edit number, used in the new title.
+# Output:  list[tuple[str, str]]: The changes to commit.
+def edit_event(users, events, username:str, i:int):
+    event_id = next(iter(users[username]["events"]))
+    events[event_id]["title"] = f"Edited {i}"
+    return [("event", event_id)]
+
+# Function: time_per_call
+# Desc:    Times a function over several calls.
+# Input:   function (Callable): The function to time.
+#          repeat (int): The number of calls.
+# Output:  float: The mean time per call in milliseconds.
+def time_per_call(function, repeat:int):
+    start = time.perf_counter()
+    for i in range(repeat):
+        function(i)
+    return (time.perf_counter() - start) * 1000 / repeat
+
+# Function: response_bytes
+# Desc:    Returns the body a handler's result is sent as, whether it built its own response or returned a dict.
+# Input:   response (Response | dict): The handler's result.
+# Output:  bytes: The response body.
+def response_bytes(response):
+    if isinstance(response, dict):
+        return json.dumps(response).encode()
+    return response.body
+
+# Function: bench_journal
+# Desc:    Compares the per-write cost of full JSON dumps with journal appends as the dataset grows.
+#          Each write edits the title of one event.
+# Input:   None
+# Output:  None
+def bench_journal():
+    print("users  | json dump (ms/write) | journal (ms/write)")
+    for user_count in (100, 1000, 10000):
+        users, groups, events = make_dataset(user_count)
+        with tempfile.TemporaryDirectory() as directory:
+            paths = [os.path.join(directory, name) for name in ("users.json", "groups.json", "journal.log", "events.json")]
+            backends = [
+                storage.JSONStorage(paths[0], paths[1], events_file=paths[3]),
+                storage.JournalStorage(paths[0], paths[1], paths[2], compact_every=10**9, events_file=paths[3]),
+            ]
+            results = []
+            for backend in backends:
+                backend.snapshot(users, groups, events)
+                backend.load()
+                # Fewer repeats for full dumps; they get slow on big datasets
+                repeat = 20 if isinstance(backend, storage.JournalStorage) else 5
+                def write(i):
+                    backend.commit(users, groups, events, edit_event(users, events, f"user{i % user_count}", i))
+                results.append(time_per_call(write, repeat))
+                backend.close()
+        print(f"{user_count:<6} | {results[0]:>20.2f} | {results[1]:>17.2f}")
+
+# Function: percentile
+# Desc:    Returns a percentile of a list of samples.
+# Input:   samples (list[float]): The samples.
+#          percent (float): The percentile to return (0-100).
+# Output:  float: The percentile value.
+def percentile(samples:list, percent:float):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+# Function: measure_load
+# Desc:    Loads a storage backend in a fresh process and reports its startup time and peak RSS.
+# Input:   mode (str): The storage mode to load, or "binary" for a binary snapshot.
+#          directory (str): The directory holding the data files.
+#          lazy_budget (int | None): Byte budget for lazily loaded users, or None to load everything.
+#          touch (bool): Whether to access every user after loading.
+# Output:  tuple[float, float]: Startup time in milliseconds and peak RSS in MB.
+def measure_load(mode:str, directory:str, lazy_budget:int=None, touch:bool=False):
+    arguments = [sys.executable, os.path.abspath(__file__), "--load", mode, str(lazy_budget), str(touch)]
+    output = subprocess.run(arguments, cwd=directory, capture_output=True, text=True, check=True)
+    startup, rss = output.stdout.split()
+    return float(startup), float(rss)
+
+# Function: report_load
+# Desc:    Entry point for measure_load's child process.
+# Input:   mode (str): The storage mode to load.
+#          lazy_budget (str): Byte budget for lazily loaded users, or "None".
+#          touch (str): "True" to access every user after loading.
+# Output:  None
+def report_load(mode:str, lazy_budget:str="None", touch:str="False"):
+    start = time.perf_counter()
+    backend = storage.create("json", binary=True) if mode == "binary" else storage.create(mode)
+    users, groups, events = backend.load(None if lazy_budget == "None" else int(lazy_budget))
+    startup = (time.perf_counter() - start) * 1000
+    if touch == "True":
+        for username in list(users):
+            users[username]
+            if isinstance(users, storage.LazyDocuments):
+                users.trim()
+    # VmHWM is the peak RSS of this process image (ru_maxrss would include the forking parent)
+    with open("/proc/self/status") as f:
+        peak = next(int(line.split()[1]) for line in f if line.startswith("VmHWM"))
+    print(startup, peak / 1024)
+
+# Function: bench_sqlite
+# Desc:    Compares startup time, peak RSS and p99 write latency of the JSON, journal and SQLite modes.
+# Input:   None
+# Output:  None
+def bench_sqlite():
+    print("users  | mode    | startup (ms) | peak RSS (MB) | p99 write (ms)")
+    for user_count in (1000, 10000):
+        users, groups, events = make_dataset(user_count)
+        with tempfile.TemporaryDirectory() as directory:
+            paths = [os.path.join(directory, name) for name in ("users.json", "groups.json", "events.json")]
+            storage.JSONStorage(paths[0], paths[1], events_file=paths[2]).snapshot(users, groups, events)
+            storage.import_json(storage.SQLiteStorage(os.path.join(directory, "trackademic.db")), *paths)
+            for mode in ("json", "journal", "sqlite"):
+                startup, rss = measure_load(mode, directory)
+                cwd = os.getcwd()
+                os.chdir(directory)
+                backend = storage.create(mode)
+                backend.load()
+                samples = []
+                for i in range(5 if mode == "json" else 200):
+                    changes = edit_event(users, events, f"user{i % user_count}", i)
+                    start = time.perf_counter()
+                    backend.commit(users, groups, events, changes)
+                    samples.append((time.perf_counter() - start) * 1000)
+                backend.close()
+                os.chdir(cwd)
+                print(f"{user_count:<6} | {mode:<7} | {startup:>12.1f} | {rss:>13.1f} | {percentile(samples, 99):>14.2f}")
+
+# Function: bench_snapshot
+# Desc:    Compares how long the server is blocked by an in-process snapshot and by a forked one.
+# Input:   None
+# Output:  None
+def bench_snapshot():
+    print("users  | in-process (ms blocked) | fork (ms blocked) | fork child (ms)")
+    for user_count in (1000, 10000):
+        users, groups, events = make_dataset(user_count)
+        with tempfile.TemporaryDirectory() as directory:
+            backend = storage.JSONStorage(os.path.join(directory, "users.json"), os.path.join(directory, "groups.json"), fork=True, events_file=os.path.join(directory, "events.json"))
+            start = time.perf_counter()
+            backend.snapshot(users, groups, events)
+            blocking = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            backend.snapshot(users, groups, events, background=True)
+            forked = (time.perf_counter() - start) * 1000
+            backend.close()
+            child = backend.stats()["last_duration"] * 1000
+        print(f"{user_count:<6} | {blocking:>23.1f} | {forked:>17.1f} | {child:>15.1f}")
+
+# Function: bench_sharded
+# Desc:    Measures per-write cost of sharded storage as the dataset grows, and compares loading the
+#          shards with one thread and in parallel.
+# Input:   None
+# Output:  None
+def bench_sharded():
+    print("users  | write (ms/write) | serial load (ms) | parallel load (ms)")
+    for user_count in (1000, 10000, 50000):
+        users, groups, events = make_dataset(user_count)
+        with tempfile.TemporaryDirectory() as directory:
+            backend = storage.ShardedStorage(directory)
+            backend.clear()
+            backend.commit(users, groups, events, all_changes(users, groups, events))
+            def write(i):
+                backend.commit(users, groups, events, edit_event(users, events, f"user{i % user_count}", i))
+            write_time = time_per_call(write, 200)
+            loads = []
+            for workers in (1, storage.SHARD_WORKERS):
+                start = time.perf_counter()
+                storage.ShardedStorage(directory, workers).load()
+                loads.append((time.perf_counter() - start) * 1000)
+        print(f"{user_count:<6} | {write_time:>16.2f} | {loads[0]:>16.1f} | {loads[1]:>18.1f}")
+
+# Function: bench_lazy
+# Desc:    Compares cold start time and peak RSS of eager and lazy user loading, and the peak RSS
+#          after reading every user with a 4 MB cache budget.
+# Input:   None
+# Output:  None
+def bench_lazy():
+    budget = 4 * 1024 * 1024
+    print("users  | mode    | eager start (ms) | lazy start (ms) | eager RSS (MB) | lazy RSS (MB) | lazy RSS, all read (MB)")
+    for user_count in (10000, 50000):
+        users, groups, events = make_dataset(user_count)
+        with tempfile.TemporaryDirectory() as directory:
+            sharded = storage.ShardedStorage(os.path.join(directory, "data"))
+            sharded.clear()
+            sharded.commit(users, groups, events, all_changes(users, groups, events))
+            sqlite = storage.SQLiteStorage(os.path.join(directory, "trackademic.db"))
+            sqlite.commit(users, groups, events, all_changes(users, groups, events))
+            sqlite.close()
+            for mode in ("sharded", "sqlite"):
+                eager_start, eager_rss = measure_load(mode, directory)
+                lazy_start, lazy_rss = measure_load(mode, directory, budget)
+                _, touched_rss = measure_load(mode, directory, budget, touch=True)
+                print(f"{user_count:<6} | {mode:<7} | {eager_start:>16.1f} | {lazy_start:>15.1f} | {eager_rss:>14.1f} | {lazy_rss:>13.1f} | {touched_rss:>23.1f}")
+
+# Function: bench_binary
+# Desc:    Compares time-to-ready and peak RSS of loading JSON files and a binary snapshot.
+# Input:   None
+# Output:  None
+def bench_binary():
+    print("events  | json size (MB) | binary size (MB) | json ready (ms) | binary ready (ms) | json RSS (MB) | binary RSS (MB)")
+    for user_count in (100, 1000, 10000):
+        users, groups, events = make_dataset(user_count, events_per_user=100)
+        with tempfile.TemporaryDirectory() as directory:
+            backend = storage.JSONStorage(os.path.join(directory, "users.json"), os.path.join(directory, "groups.json"), events_file=os.path.join(directory, "events.json"))
+            backend.snapshot(users, groups, events)
+            binary.write_snapshot(os.path.join(directory, binary.SNAPSHOT_FILE), binary.encode_snapshot(users, groups, events))
+            json_size = sum(os.path.getsize(os.path.join(directory, name)) for name in ("users.json", "groups.json", "events.json")) / 1024 / 1024
+            binary_size = os.path.getsize(os.path.join(directory, binary.SNAPSHOT_FILE)) / 1024 / 1024
+            del users, groups, events
+            json_ready, json_rss = measure_load("json", directory)
+            binary_ready, binary_rss = measure_load("binary", directory)
+        print(f"{user_count * 100:<7} | {json_size:>14.1f} | {binary_size:>16.1f} | {json_ready:>15.1f} | {binary_ready:>17.1f} | {json_rss:>13.1f} | {binary_rss:>15.1f}")
+
+# Function: bench_dates
+# Desc:    Compares finding one week of a user's events by scanning all of them (as the client did after
+#          downloading the whole user) with a DateIndex range query, and the response sizes of both.
+# Input:   None
+# Output:  None
+def bench_dates():
+    print("events  | scan (ms/query) | index (ms/query) | index build (ms) | full user (KB) | one week (KB)")
+    for event_count in (10000, 100000, 500000):
+        users, _, events = make_dataset(1, events_per_user=event_count)
+        index = indexes.DateIndex()
+        build_start = time.perf_counter()
+        index.build("user0", events.values())
+        build_time = (time.perf_counter() - build_start) * 1000
+        def week(i):
+            start = datetime.date(2025, 1, 1) + datetime.timedelta(days=7 * (i % 52))
+            return start.isoformat(), (start + datetime.timedelta(days=6)).isoformat()
+        def scan(i):
+            start, end = week(i)
+            return [event_id for event_id, event in events.items() if start <= event["date"] <= end]
+        def query(i):
+            return index.range("user0", events.values(), *week(i))
+        scan_time = time_per_call(scan, 10)
+        index_time = time_per_call(query, 1000)
+        full_size = len(json.dumps(dict(users["user0"], events=events))) / 1024
+        week_size = len(json.dumps({event_id: events[event_id] for event_id in query(0)})) / 1024
+        print(f"{event_count:<7} | {scan_time:>15.2f} | {index_time:>16.3f} | {build_time:>16.1f} | {full_size:>14.0f} | {week_size:>13.1f}")
+
+# Function: bench_ids
+# Desc:    Compares allocating a numerical event ID by scanning all of a user's events for the highest
+#          one (as create_event used to) with reading the user's sequence counter.
+# Input:   None
+# Output:  None
+def bench_ids():
+    print("events  | max scan (ms/id) | counter (ms/id)")
+    for event_count in (10, 1000, 100000):
+        users, _, events = make_dataset(1, events_per_user=event_count)
+        user = users["user0"]
+        user["next_event_id"] = event_count + 1
+        def scan(i):
+            return max((events[event_id]["numerical_id"] for event_id in user["events"]), default=0) + 1
+        def counter(i):
+            numerical_id = user["next_event_id"]
+            user["next_event_id"] += 1
+            return numerical_id
+        print(f"{event_count:<7} | {time_per_call(scan, 20):>16.4f} | {time_per_call(counter, 10000):>15.4f}")
+
+# Function: bench_events
+# Desc:    Compares removing an event from a group that holds copies of its events in a list (rebuilt
+#          without the event, as delete_event used to) with removing a reference from the group.
+# Input:   None
+# Output:  None
+def bench_events():
+    print("group events | list rebuild (ms/remove) | reference (ms/remove)")
+    for event_count in (100, 10000, 100000):
+        _, _, events = make_dataset(1, events_per_user=event_count)
+        copies = list(events.values())
+        references = dict.fromkeys(events, True)
+        event_ids = list(events)
+        def rebuild(i):
+            event_id = event_ids[i]
+            return [event for event in copies if event["id"] != event_id]
+        def dereference(i):
+            references.pop(event_ids[i], None)
+        print(f"{event_count:<12} | {time_per_call(rebuild, 20):>24.4f} | {time_per_call(dereference, 100):>21.4f}")
+
+# Function: bench_subscribers
+# Desc:    Compares finding the users who saved a deleted event by probing every user's saved events
+#          with looking them up in the subscriber index, in a school where 1% of users saved it.
+# Input:   None
+# Output:  None
+def bench_subscribers():
+    print("users  | scan (ms/delete) | index (ms/delete)")
+    for user_count in (1000, 10000, 100000):
+        users = {f"user{i}": {"saved": {"event": True} if i % 100 == 0 else {}} for i in range(user_count)}
+        index = indexes.ReferenceIndex("saved")
+        index.build(users.items())
+        subscribers = list(index.entries["event"])
+        def scan(i):
+            return [username for username, user in users.items() if "event" in user["saved"]]
+        def lookup(i):
+            index.pop("event")
+            index.entries["event"] = dict.fromkeys(subscribers, True)
+        print(f"{user_count:<6} | {time_per_call(scan, 20):>16.4f} | {time_per_call(lookup, 1000):>16.4f}")
+
+# Function: bench_members
+# Desc:    Compares a member joining and leaving a group whose members are a list (checked with `in` and
+#          removed with .remove(), as join/leave used to) with an insertion-ordered set.
+# Input:   None
+# Output:  None
+def bench_members():
+    print("members | list (ms/join+leave) | set (ms/join+leave)")
+    for member_count in (5, 1000, 100000):
+        members_list = [f"user{i}" for i in range(member_count)]
+        members_set = dict.fromkeys(members_list, True)
+        def list_join_leave(i):
+            if "new" not in members_list:
+                members_list.append("new")
+            if "user0" in members_list:
+                members_list.remove("user0")
+                members_list.append("user0")
+            members_list.remove("new")
+        def set_join_leave(i):
+            if "new" not in members_set:
+                members_set["new"] = True
+            if members_set.pop("user0", None):
+                members_set["user0"] = True
+            members_set.pop("new", None)
+        print(f"{member_count:<7} | {time_per_call(list_join_leave, 100):>20.4f} | {time_per_call(set_join_leave, 1000):>19.4f}")
+
+# Function: bench_groups
+# Desc:    Compares the payload size and latency of listing every group in full (what the groups screen
+#          used to download before filtering by school) with listing one school's groups with just
+#          the fields the class tiles show.
+# Input:   None
+# Output:  None
+def bench_groups():
+    import asyncio
+    import main
+    print("groups | all groups (bytes, ms) | one school, tile fields (bytes, ms)")
+    for group_count in (1000, 10000):
+        users, groups, events = make_dataset(group_count * 2, events_per_user=1)
+        groups = {}
+        for i in range(group_count):
+            group_id = sha256(f"Class {i}".encode()).hexdigest()
+            members = {f"user{(i + n) % len(users)}": True for n in range(30)}
+            groups[group_id] = {
+                "id": group_id,
+                "name": f"Class {i}",
+                "description": "Benchmark class",
+                "school": f"School {i % 50}",
+                "members": members,
+                "member_count": len(members),
+                "events": {},
+                "colour": "#FF5722",
+                "owner": next(iter(members)),
+            }
+            event_id = next(iter(users[f"user{i}"]["events"]))
+            events[event_id].update(group_id=group_id, visible=True)
+            groups[group_id]["events"][event_id] = True
+        main.app.users, main.app.groups, main.app.events = users, groups, events
+        main.app.group_schools.build(groups)
+        def list_all():
+            return response_bytes(asyncio.run(main.get_all_groups("", "", "", None, "", None)))
+        def list_school():
+            listing = {}
+            cursor = ""
+            while True:
+                page = json.loads(response_bytes(asyncio.run(main.get_all_groups("School 0", "", cursor, main.MAX_PAGE_SIZE, "id,name,school,colour,member_count", None))))
+                listing.update(page["groups"])
+                cursor = page["next_cursor"]
+                if not cursor:
+                    return json.dumps(listing)
+        results = []
+        for function in (list_all, list_school):
+            size = len(function())
+            results += [size, time_per_call(lambda i: function(), 5)]
+        print(f"{group_count:<6} | {results[0]:>10} {results[1]:>11.2f} | {results[2]:>12} {results[3]:>22.2f}")
+
+# Function: bench_search
+# Desc:    Compares searching 50k groups by substring matching every group's name and school (what the
+#          groups screen used to do on each key press, after downloading them all) with the search index.
+# Input:   None
+# Output:  None
+def bench_search():
+    with open("subjects.json", "r") as f:
+        subjects = json.load(f)
+    groups = {}
+    for i in range(50000):
+        group_id = sha256(f"Class {i}".encode()).hexdigest()
+        groups[group_id] = {
+            "id": group_id,
+            "name": subjects[i % len(subjects)],
+            "school": f"{['Northern', 'Southern', 'Eastern', 'Western', 'Central'][i % 5]} Secondary College {i // 71}",
+            "description": f"Class {i} for {subjects[i % len(subjects)]}",
+        }
+    index = indexes.SearchIndex({"name": 4, "school": 2, "description": 1})
+    started = time.perf_counter()
+    index.build(groups)
+    print(f"built index over {len(groups)} groups in {(time.perf_counter() - started) * 1000:.0f} ms")
+    schools = indexes.FieldIndex("school")
+    schools.build(groups)
+    school = groups[next(iter(groups))]["school"]
+    print("query                  | substring scan (ms) | index (ms) | index, one school (ms)")
+    for query in ("m", "math", "english lang", "specialist 3/4", "northern 42", "physics central 60"):
+        def scan(i):
+            text = query.lower()
+            return [group for group in groups.values() if text in group["name"].lower() or text in group["school"].lower()]
+        def search(i):
+            return index.search(query, 50)
+        def search_school(i):
+            return index.search(query, 50, schools.get(school))
+        print(f"{query:<22} | {time_per_call(scan, 5):>19.3f} | {time_per_call(search, 50):>10.3f} | {time_per_call(search_school, 50):>22.3f}")
+
+# Function: bench_event_search
+# Desc:    Compares searching events by substring matching their titles and descriptions with the
+#          per-owner search indexes, with 1M events indexed: spread over 10k users, and held by one owner.
+# Input:   None
+# Output:  None
+def bench_event_search():
+    words = ["chemistry", "physics", "maths", "methods", "english", "history", "biology", "revision",
+             "test", "exam", "practice", "unit", "outcome", "essay", "lab", "report", "homework", "quiz"]
+    def make_event(i, owner):
+        return {
+            "id": f"{owner}-{i}",
+            "title": f"{words[i % 18]} {words[i * 7 % 18]} {i % 97}",
+            "description": f"{words[i * 5 % 18]} {words[i * 11 % 18]} {words[i * 13 % 18]} task {i % 1013}",
+            "type": ["SAC", "Exam", "Homework"][i % 3],
+            "date": (datetime.date(2025, 1, 1) + datetime.timedelta(days=i % 365)).isoformat(),
+        }
+    def scan(events, query):
+        terms = query.lower().split()
+        return [event for event in events if all(term in (event["title"] + " " + event["description"] + " " + event["type"]).lower() for term in terms)]
+    weights = {"title": 4, "type": 2, "description": 1}
+
+    # 1M events spread over 10k users
+    search = indexes.OwnerSearchIndex(weights)
+    calendars = {f"user{u}": [make_event(i, f"user{u}") for i in range(u, u + 100)] for u in range(10000)}
+    started = time.perf_counter()
+    for username, events in calendars.items():
+        search.build(username, events)
+    print(f"indexed 1M events over 10k users in {time.perf_counter() - started:.1f} s")
+    print("scope                    | query            | scan (ms) | index (ms)")
+    for query in ("chem", "maths exam", "lab report 42"):
+        print(f"{'one user (100 events)':<24} | {query:<16} | {time_per_call(lambda i: scan(calendars['user7'], query), 100):>9.4f} | {time_per_call(lambda i: search.entries['user7'].search(query, 50), 1000):>10.4f}")
+    del search, calendars
+
+    # 1M events held by one owner, e.g. a school-wide group
+    events = [make_event(i, "school") for i in range(1000000)]
+    started = time.perf_counter()
+    index = indexes.OwnerSearchIndex(weights).build("school", events)
+    print(f"indexed 1M events for one owner in {time.perf_counter() - started:.1f} s")
+    dates = indexes.DateIndex()
+    week = dates.range("school", events, "2025-03-03", "2025-03-09")
+    for query in ("chem", "maths exam", "lab report 42"):
+        print(f"{'one owner (1M events)':<24} | {query:<16} | {time_per_call(lambda i: scan(events, query), 1):>9.1f} | {time_per_call(lambda i: index.search(query, 50), 5):>10.4f}")
+        print(f"{'one owner, one week':<24} | {query:<16} | {time_per_call(lambda i: scan(events, query), 1):>9.1f} | {time_per_call(lambda i: index.search(query, 50, week), 20):>10.4f}")
+
+# Function: bench_changes
+# Desc:    Compares the payload size and latency of refreshing a user by fetching them in full (what
+#          pull_updates used to do) with fetching their changes since the last sync, with no changes and
+#          with one edited event.
+# Input:   None
+# Output:  None
+def bench_changes():
+    import asyncio
+    import main
+    print("events | full user (bytes, ms) | no changes (bytes, ms) | one edit (bytes, ms)")
+    for event_count in (100, 1000, 10000):
+        users, groups, events = make_dataset(1, events_per_user=event_count)
+        main.app.users, main.app.groups, main.app.events = users, groups, events
+        main.app.subscribers = indexes.ReferenceIndex("saved")
+        main.app.feed = main.feeds.ChangeFeed()
+        main.app.feed.record(["user0"], "profile")
+        edited = main.app.feed.cursor("user0")
+        main.app.feed.record(["user0"], "event", next(iter(events)))
+        results = []
+        for function in (lambda: main.check_user("user0", None), lambda: main.get_changes("user0", main.app.feed.cursor("user0")), lambda: main.get_changes("user0", edited)):
+            results += [len(response_bytes(asyncio.run(function()))), time_per_call(lambda i: response_bytes(asyncio.run(function())), 20)]
+        print(f"{event_count:<6} | {results[0]:>9} {results[1]:>10.3f} | {results[2]:>10} {results[3]:>10.3f} | {results[4]:>8} {results[5]:>10.3f}")
+
+# Function: bench_etag
+# Desc:    Compares fetching a user in full with revalidating an unchanged cached copy (304 Not Modified).
+# Input:   None
+# Output:  None
+def bench_etag():
+    import asyncio
+    import main
+    print("events | full user (bytes, ms) | revalidated (bytes, ms)")
+    for event_count in (100, 1000, 10000):
+        users, groups, events = make_dataset(1, events_per_user=event_count)
+        main.app.users, main.app.groups, main.app.events = users, groups, events
+        main.app.feed = main.feeds.ChangeFeed()
+        etag = asyncio.run(main.check_user("user0", None)).headers["ETag"]
+        results = []
+        for if_none_match in (None, etag):
+            function = lambda i: response_bytes(asyncio.run(main.check_user("user0", if_none_match)))
+            results += [len(function(0)), time_per_call(function, 20)]
+        print(f"{event_count:<6} | {results[0]:>9} {results[1]:>10.3f} | {results[2]:>11} {results[3]:>10.3f}")
+
+# Function: bench_responses
+# Desc:    Compares building and serialising a user and the group list on every fetch with serving their
+#          cached encoded bodies.
+# Input:   None
+# Output:  None
+def bench_responses():
+    import asyncio
+    import main
+    print("users  | events/user | user rebuilt (ms) | user cached (ms) | group list rebuilt (ms) | group list cached (ms)")
+    for user_count, event_count in ((100, 100), (1000, 1000), (10000, 100)):
+        users, groups, events = make_dataset(user_count, events_per_user=event_count)
+        main.app.users, main.app.groups, main.app.events = users, groups, events
+        main.app.feed = main.feeds.ChangeFeed()
+        main.app.revisions = main.feeds.Revisions()
+        main.app.revisions.build(groups)
+        results = []
+        for function in (lambda: main.check_user("user0", None), lambda: main.get_all_groups("", "", "", None, "", None)):
+            for budget in (0, main.RESPONSE_CACHE_BUDGET):
+                main.app.responses = main.feeds.ResponseCache(budget)
+                results.append(time_per_call(lambda i: response_bytes(asyncio.run(function())), 20))
+        print(f"{user_count:<6} | {event_count:<11} | {results[0]:>17.3f} | {results[1]:>16.3f} | {results[2]:>23.3f} | {results[3]:>21.3f}")
+
+# Function: read_load
+# Desc:    Load generator for bench_workers: fetches users over one keep-alive connection for a while.
+# Input:   arguments (tuple[str, int, int, float]): The host, port, number of users and seconds to run for.
+# Output:  int: The number of requests answered.
+def read_load(arguments):
+    import http.client
+    host, port, user_count, duration = arguments
+    connection = http.client.HTTPConnection(host, port, timeout=30)
+    count = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        connection.request("GET", f"/users/user{count * 7 % user_count}")
+        connection.getresponse().read()
+        count += 1
+    connection.close()
+    return count
+
+# Function: bench_workers
+# Desc:    Measures read throughput of the multi-worker setup (see workers.py) as readers are added, up to one
+#          per core, with two load generating processes per reader. The load generators share the cores, so
+#          the scaling shown is a lower bound.
+# Input:   None
+# Output:  None
+def bench_workers():
+    try:
+        import uvicorn
+    except ImportError:
+        print("Needs uvicorn")
+        return
+    import multiprocessing
+    import main
+    import workers
+    user_count, duration = 1000, 5
+    cores = os.cpu_count()
+    print(f"cores: {cores}")
+    print("readers | requests/s | speedup")
+    users, groups, events = make_dataset(user_count)
+    with tempfile.TemporaryDirectory() as directory:
+        paths = [os.path.join(directory, name) for name in ("users.json", "groups.json", "journal.log", "events.json")]
+        backend = storage.JournalStorage(paths[0], paths[1], paths[2], events_file=paths[3])
+        backend.snapshot(users, groups, events)
+        backend.close()
+        baseline = None
+        for readers in sorted({1, 2, 4, 8, 16, cores} & set(range(1, cores + 1))):
+            processes = workers.start(readers, directory)
+            try:
+                clients = 2 * readers
+                with multiprocessing.Pool(clients) as pool:
+                    # Warm up while the readers finish loading their replicas
+                    pool.map(read_load, [(main.HOST, main.PORT, user_count, 1)] * clients)
+                    counts = pool.map(read_load, [(main.HOST, main.PORT, user_count, duration)] * clients)
+            finally:
+                workers.stop(processes)
+            rate = sum(counts) / duration
+            baseline = baseline or rate
+            print(f"{readers:<7} | {rate:>10.0f} | {rate / baseline:>6.2f}x")
+
+# Function: call
+# Desc:    Sends a request over a keep-alive connection and decodes the JSON answer.
+# Input:   connection (http.client.HTTPConnection): The connection.
+#          method (str): The HTTP method.
+#          path (str): The path.
+#          body (dict | None): The JSON body, if any.
+# Output:  tuple[int, dict]: The status code and decoded body.
+def call(connection, method:str, path:str, body:dict=None):
+    headers = {"Content-Type": "application/json"} if body is not None else {}
+    connection.request(method, path, None if body is None else json.dumps(body), headers)
+    response = connection.getresponse()
+    return response.status, json.loads(response.read() or b"{}")
+
+# Function: bench_standby
+# Desc:    Runs a primary and a hot standby as two local processes sharing a data directory. Measures how long
+#          each write to the primary takes to become readable on the standby (bounded by the primary's flush
+#          interval, as the standby follows the journal), checks that the standby refuses writes, then kills
+#          the primary, promotes the standby and checks it accepts writes and persists them.
+# Input:   None
+# Output:  None
+def bench_standby():
+    try:
+        import uvicorn
+    except ImportError:
+        print("Needs uvicorn")
+        return
+    import http.client
+    import main
+    import workers
+    user_count, writes = 1000, 50
+    users, groups, events = make_dataset(user_count)
+    with tempfile.TemporaryDirectory() as directory:
+        paths = [os.path.join(directory, name) for name in ("users.json", "groups.json", "journal.log", "events.json")]
+        backend = storage.JournalStorage(paths[0], paths[1], paths[2], events_file=paths[3])
+        backend.snapshot(users, groups, events)
+        backend.close()
+        primary = workers.spawn("primary", main.PORT, directory)
+        processes = [primary]
+        try:
+            workers.wait_for_port(main.HOST, main.PORT, primary)
+            standby = workers.spawn("standby", main.STANDBY_PORT, directory)
+            processes.append(standby)
+            workers.wait_for_port(main.HOST, main.STANDBY_PORT, standby)
+            to_primary = http.client.HTTPConnection(main.HOST, main.PORT, timeout=30)
+            to_standby = http.client.HTTPConnection(main.HOST, main.STANDBY_PORT, timeout=30)
+            delays = []
+            for i in range(writes):
+                name = f"Name {i}"
+                call(to_primary, "POST", "/users/update", {"username": "user0", "display_name": name})
+                started = time.perf_counter()
+                while call(to_standby, "GET", "/users/user0")[1].get("display_name") != name:
+                    time.sleep(0.001)
+                delays.append((time.perf_counter() - started) * 1000)
+            refused, _ = call(to_standby, "POST", "/users/update", {"username": "user0", "display_name": "Standby"})
+            batched, batch = call(to_standby, "POST", "/batch", {"requests": [{"path": "users/user0"}, {"path": "groups"}]})
+            _, stats = call(to_standby, "GET", "/stats/replica")
+            # Simulate a crash: the primary gets no chance to flush or release its lock
+            primary.kill()
+            primary.wait()
+            started = time.perf_counter()
+            _, promoted = call(to_standby, "POST", "/promote")
+            promote_ms = (time.perf_counter() - started) * 1000
+            _, written = call(to_standby, "POST", "/users/update", {"username": "user0", "display_name": "Promoted"})
+            to_primary.close()
+            to_standby.close()
+        finally:
+            workers.stop(processes)
+        backend = storage.JournalStorage(paths[0], paths[1], paths[2], events_file=paths[3])
+        persisted = backend.load()[0]["user0"]["display_name"]
+        backend.close()
+    print(f"replication delay: median {percentile(delays, 50):.1f} ms, p99 {percentile(delays, 99):.1f} ms over {writes} writes")
+    batch_served = batched == 200 and all(result["status"] == 200 for result in batch.get("results", []))
+    print(f"standby write refused: {refused == 503}; read-only batch served: {batch_served}; lag reported: {stats.get('lag') or 0:.3f} s, {stats.get('behind_bytes')} bytes behind, {stats.get('records')} records applied")
+    print(f"promoted: {promoted.get('role') == 'primary'} in {promote_ms:.1f} ms; write accepted: {written.get('success') is True}; persisted: {persisted == 'Promoted'}")
+
+BENCHMARKS = {
+    "journal": bench_journal,
+    "sqlite": bench_sqlite,
+    "snapshot": bench_snapshot,
+    "sharded": bench_sharded,
+    "lazy": bench_lazy,
+    "binary": bench_binary,
+    "dates": bench_dates,
+    "ids": bench_ids,
+    "events": bench_events,
+    "subscribers": bench_subscribers,
+    "members": bench_members,
+    "groups": bench_groups,
+    "search": bench_search,
+    "event-search": bench_event_search,
+    "changes": bench_changes,
+    "etag": bench_etag,
+    "responses": bench_responses,
+    "workers": bench_workers,
+    "standby": bench_standby,
+}
+
+# Run the requested benchmarks
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--load"]:
+        report_load(*sys.argv[2:5])
+        sys.exit()
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        print(f"== {name} ==")
+        BENCHMARKS[name]()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# File:     binary.py
+# Program:  trackademic
+# Desc:     Compact binary snapshot format for users, groups and events, for fast cold starts. JSON stays the
+#           import/export format: run `python binary.py to-binary [users.json] [groups.json] [events.json] [snapshot.bin]`
+#           or `python binary.py to-json [snapshot.bin] [users.json] [groups.json] [events.json]` to convert.
+#
+#           Layout: an 8 byte header (b"TRAK", format version, marshal version, 2 reserved bytes),
+#           then one length-prefixed record per user/group/event: kind (b"u" | b"g" | b"v"), payload length (uint32),
+#           payload. The payload is the (key, document) pair serialised with marshal, which decodes in C
+#           with no per-object Python overhead. A b"e" record with no payload ends the file, so a
+#           truncated snapshot is detected rather than half-loaded. Version 1 snapshots (from before events
+#           were stored separately) have no event records and are still read.
+#
+# Author:   Brendan Liang
+# Created:  16-10-2026
+# Modified: 16-10-2026
+
+import json
+import marshal
+import os
+import struct
+import sys
+
+# Constants
+SNAPSHOT_FILE = "snapshot.bin"
+MAGIC = b"TRAK"
+FORMAT_VERSION = 2
+READABLE_VERSIONS = (1, 2)
+HEADER = struct.Struct("<4sBBxx")
+RECORD = struct.Struct("<cI")
+KINDS = {b"u": "user", b"g": "group", b"v": "event"}
+
+# Function: encode_snapshot
+# Desc:    Serialises all users, groups and events into the binary snapshot format.
+# Input:   users (dict): All users.
+#          groups (dict): All groups.
+#          events (dict): All events.
+# Output:  bytes: The encoded snapshot.
+def encode_snapshot(users, groups, events):
+    parts = [HEADER.pack(MAGIC, FORMAT_VERSION, marshal.version)]
+    for kind, documents in ((b"u", users), (b"g", groups), (b"v", events)):
+        for key, document in documents.items():
+            payload = marshal.dumps((key, document))
+            parts.append(RECORD.pack(kind, len(payload)))
+            parts.append(payload)
+    parts.append(RECORD.pack(b"e", 0))
+    return b"".join(parts)
+
+# Function: write_snapshot
+# Desc:    Writes a binary snapshot via a temporary file and an atomic rename.
+# Input:   path (str): The snapshot file.
+#          data (bytes): The encoded snapshot.
+# Output:  None
+def write_snapshot(path, data:bytes):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+# Function: iter_snapshot
+# Desc:    Streams the records of a binary snapshot one at a time, without reading the whole file.
+# Input:   path (str): The snapshot file.
+# Output:  Iterator[tuple[str, str, dict]]: ("user" | "group" | "event", key, document) for each record.
+def iter_snapshot(path):
+    with open(path, "rb") as f:
+        magic, version, marshal_version = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version not in READABLE_VERSIONS:
+            raise ValueError(f"{path} is not a trackademic snapshot this version can read")
+        if marshal_version != marshal.version:
+            raise ValueError(f"{path} was written by an incompatible Python; convert it with binary.py to-json")
+        while True:
+            header = f.read(RECORD.size)
+            if len(header) < RECORD.size:
+                raise ValueError(f"{path} is truncated")
+            kind, length = RECORD.unpack(header)
+            if kind == b"e":
+                return
+            payload = f.read(length)
+            if len(payload) < length:
+                raise ValueError(f"{path} is truncated")
+            key, document = marshal.loads(payload)
+            yield KINDS[kind], key, document
+
+# Function: read_snapshot
+# Desc:    Loads all users, groups and events from a binary snapshot.
+# Input:   path (str): The snapshot file.
+# Output:  tuple[dict, dict, dict]: The users, groups and events dictionaries.
+def read_snapshot(path):
+    documents = {"user": {}, "group": {}, "event": {}}
+    for kind, key, document in iter_snapshot(path):
+        documents[kind][key] = document
+    return documents["user"], documents["group"], documents["event"]
+
+# Convert between JSON and binary snapshots
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "to-binary":
+        users_file, groups_file, events_file, snapshot_file = (sys.argv[2:6] + ["users.json", "groups.json", "events.json", SNAPSHOT_FILE][len(sys.argv[2:6]):])
+        data = []
+        for path in (users_file, groups_file, events_file):
+            try:
+                with open(path, "r") as f:
+                    data.append(json.load(f))
+            except FileNotFoundError:
+                data.append({})
+        users, groups, events = data
+        write_snapshot(snapshot_file, encode_snapshot(users, groups, events))
+        print(f"Wrote {len(users)} users, {len(groups)} groups and {len(events)} events to {snapshot_file}")
+    elif command == "to-json":
+        snapshot_file, users_file, groups_file, events_file = (sys.argv[2:6] + [SNAPSHOT_FILE, "users.json", "groups.json", "events.json"][len(sys.argv[2:6]):])
+        users, groups, events = read_snapshot(snapshot_file)
+        for path, data in ((users_file, users), (groups_file, groups), (events_file, events)):
+            with open(path, "w") as f:
+                json.dump(data, f, indent=4)
+        print(f"Wrote {len(users)} users, {len(groups)} groups and {len(events)} events to {users_file}, {groups_file} and {events_file}")
+    else:
+        print("Usage: python binary.py to-binary [users.json] [groups.json] [events.json] [snapshot.bin]")
+        print("       python binary.py to-json [snapshot.bin] [users.json] [groups.json] [events.json]")
+        sys.exit(1)
@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# File:     feeds.py
+# Program:  trackademic
+# Desc:     Per-user change feeds and group revisions for the trackademic API, so clients can fetch
+#           what changed on a user's calendar and groups since their last sync instead of the whole user,
+#           and revalidate cached responses with ETags, plus a cache of encoded responses for those versions
+#           and the streams that push change notifications to connected clients.
+#
+# Author:   Brendan Liang
+# Created:  16-10-2026
+# Modified: 17-10-2026
+
+from collections import OrderedDict, deque
+from hashlib import sha256
+import asyncio
+import time
+
+# Constants
+# Number of changes kept per user; clients further behind than this are sent the whole user again
+FEED_LENGTH = 1000
+# Number of notifications buffered per stream; streams that fall further behind are disconnected
+STREAM_BUFFER = 100
+
+# Class:    ChangeFeed
+# Desc:     Records which events, groups and profile fields changed for each user, numbered by a per-user
+#           version that only ever increases. The feeds live in memory, so versions are handed out as
+#           "<epoch>.<version>" cursors; a cursor from an earlier run of the server (a different epoch), or
+#           one older than the changes still kept, can't be served incrementally and asks for a reset.
+# Properties:
+#   - epoch (str): Identifies this run of the server.
+#   - length (int): Number of changes kept per user.
+#   - versions (dict[str, int]): The current version of each user's feed.
+#   - entries (dict[str, deque[tuple[int, str, str]]]): Recent (version, kind, key) changes of each user.
+#   - streams (Streams | None): Where to push each change as it is recorded.
+#   - journal (list[tuple[str, int, str, str]] | None): (username, version, kind, key) entries waiting to be
+#     written to the journal for replicas, or None if the feed isn't replicated.
+#   - since (float | None): When the oldest commit waiting to be journaled was made, or None if there isn't one.
+class ChangeFeed:
+    def __init__(self, length:int=FEED_LENGTH, streams=None):
+        self.epoch = format(time.time_ns(), "x")
+        self.length = length
+        self.versions = {}
+        self.entries = {}
+        self.streams = streams
+        self.journal = None
+        self.since = None
+
+    # Method:  record
+    # Desc:    Records a change for some users.
+    # Input:   usernames (Iterable[str]): The users affected.
+    #          kind (str): "event", "group" or "profile".
+    #          key (str): The event or group ID ("" for the profile).
+    # Output:  None
+    def record(self, usernames, kind:str, key:str=""):
+        for username in usernames:
+            version = self.versions.get(username, 0) + 1
+            self.versions[username] = version
+            if username not in self.entries:
+                self.entries[username] = deque(maxlen=self.length)
+            self.entries[username].append((version, kind, key))
+            if self.journal is not None:
+                self.journal.append((username, version, kind, key))
+            if self.streams is not None:
+                self.streams.publish(username, {"version": f"{self.epoch}.{version}", "kind": kind, "key": key})
+
+    # Method:  drain
+    # Desc:    Returns and forgets the entries waiting to be journaled.
+    # Input:   None
+    # Output:  list[tuple[str, int, str, str]]: The (username, version, kind, key) entries, oldest first.
+    def drain(self):
+        if not self.journal:
+            return []
+        entries, self.journal = self.journal, []
+        return entries
+
+    # Method:  committed
+    # Desc:    Notes that a change was committed, so the batch it's journaled in can carry the time of its
+    #          oldest commit. Does nothing if the feed isn't replicated.
+    # Input:   None
+    # Output:  None
+    def committed(self):
+        if self.journal is not None and self.since is None:
+            self.since = time.time()
+
+    # Method:  drain_since
+    # Desc:    Returns and forgets when the oldest commit waiting to be journaled was made.
+    # Input:   None
+    # Output:  float | None: The commit time, or None if nothing was committed since the last batch.
+    def drain_since(self):
+        since, self.since = self.since, None
+        return since
+
+    # Method:  journaled
+    # Desc:    Returns each user's version as of the last journaled entry, leaving out entries still waiting
+    #          to be journaled (whose documents may not have been written yet).
+    # Input:   None
+    # Output:  dict[str, int]: The version of each user.
+    def journaled(self):
+        versions = dict(self.versions)
+        for username, version, _, _ in self.journal or ():
+            versions[username] = min(versions[username], version - 1)
+        return versions
+
+    # Method:  adopt
+    # Desc:    Starts following another process's feed (a replica following its writer), taking on its epoch
+    #          and versions. Earlier entries aren't known, so older cursors get a reset.
+    # Input:   epoch (str): The other feed's epoch.
+    #          versions (dict[str, int]): The version of each user in the other feed.
+    # Output:  None
+    def adopt(self, epoch:str, versions:dict):
+        self.epoch = epoch
+        self.versions = dict(versions)
+        self.entries = {}
+
+    # Method:  apply
+    # Desc:    Records an entry copied from the adopted feed, with its original version. If entries were
+    #          missed, the user's earlier entries are dropped so older cursors get a reset.
+    # Input:   username (str): The user.
+    #          version (int): The entry's version.
+    #          kind (str): "event", "group" or "profile".
+    #          key (str): The event or group ID ("" for the profile).
+    # Output:  None
+    def apply(self, username:str, version:int, kind:str, key:str):
+        if version <= self.versions.get(username, 0):
+            return
+        if version != self.versions.get(username, 0) + 1 or username not in self.entries:
+            self.entries[username] = deque(maxlen=self.length)
+        self.versions[username] = version
+        self.entries[username].append((version, kind, key))
+        if self.streams is not None:
+            self.streams.publish(username, {"version": f"{self.epoch}.{version}", "kind": kind, "key": key})
+
+    # Method:  cursor
+    # Desc:    Returns the cursor of a user's current version.
+    # Input:   username (str): The user.
+    # Output:  str: The cursor.
+    def cursor(self, username:str):
+        return f"{self.epoch}.{self.versions.get(username, 0)}"
+
+    # Method:  changes
+    # Desc:    Returns what changed for a user since a cursor, each changed event or group only once.
+    # Input:   username (str): The user.
+    #          since (str): A cursor previously returned for the user.
+    # Output:  list[tuple[str, str]] | None: The changed (kind, key) pairs, oldest first, or None if the
+    #          cursor can't be served incrementally and the client needs the whole user.
+    def changes(self, username:str, since:str):
+        epoch, _, version = since.partition(".")
+        if epoch != self.epoch or not version.isdigit():
+            return None
+        version = int(version)
+        current = self.versions.get(username, 0)
+        if version > current:
+            return None
+        entries = self.entries.get(username, ())
+        # Changes between the cursor and the oldest kept entry have been dropped
+        if version < current and (not entries or entries[0][0] > version + 1):
+            return None
+        changed = {}
+        for entry_version, kind, key in reversed(entries):
+            if entry_version <= version:
+                break
+            changed[(kind, key)] = True
+        return list(reversed(changed))
+
+# Class:    Stream
+# Desc:     One client's connection to /users/{username}/stream.
+# Properties:
+#   - queue (asyncio.Queue[dict | None]): Notifications waiting to be sent; None ends the stream.
+#   - dropped (bool): Whether the stream was disconnected for falling behind (or the server is stopping).
+class Stream:
+    def __init__(self, buffer:int):
+        self.queue = asyncio.Queue(maxsize=buffer)
+        self.dropped = False
+
+# Class:    Streams
+# Desc:     The open notification streams of each user. Each stream buffers a bounded number of
+#           notifications; a client that doesn't read them fast enough is disconnected rather than letting
+#           its buffer grow, and catches up from the change feed when it reconnects.
+# Properties:
+#   - buffer (int): Number of notifications buffered per stream.
+#   - connections (dict[str, set[Stream]]): The open streams of each user.
+#   - dropped (int): Number of streams disconnected for falling behind.
+class Streams:
+    def __init__(self, buffer:int=STREAM_BUFFER):
+        self.buffer = buffer
+        self.connections = {}
+        self.dropped = 0
+
+    # Method:  open
+    # Desc:    Opens a stream for a user.
+    # Input:   username (str): The user.
+    # Output:  Stream: The stream.
+    def open(self, username:str):
+        stream = Stream(self.buffer)
+        self.connections.setdefault(username, set()).add(stream)
+        return stream
+
+    # Method:  close
+    # Desc:    Closes one of a user's streams, if still open.
+    # Input:   username (str): The user.
+    #          stream (Stream): The stream.
+    # Output:  None
+    def close(self, username:str, stream:Stream):
+        streams = self.connections.get(username)
+        if streams is None:
+            return
+        streams.discard(stream)
+        if not streams:
+            del self.connections[username]
+
+    # Method:  count
+    # Desc:    Returns how many streams a user has open.
+    # Input:   username (str): The user.
+    # Output:  int: The number of streams.
+    def count(self, username:str):
+        return len(self.connections.get(username, ()))
+
+    # Method:  publish
+    # Desc:    Queues a notification on each of a user's streams, disconnecting any whose buffer is full.
+    # Input:   username (str): The user.
+    #          message (dict): The notification.
+    # Output:  None
+    def publish(self, username:str, message:dict):
+        for stream in list(self.connections.get(username, ())):
+            try:
+                stream.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # The stream's reader sees the flag as soon as it takes its next notification
+                stream.dropped = True
+                self.dropped += 1
+                self.close(username, stream)
+
+    # Method:  close_all
+    # Desc:    Ends every stream, e.g. when the server is stopping.
+    # Input:   None
+    # Output:  None
+    def close_all(self):
+        for streams in self.connections.values():
+            for stream in streams:
+                stream.dropped = True
+                try:
+                    stream.queue.put_nowait(None)
+                except asyncio.QueueFull:
+                    pass
+        self.connections = {}
+
+    # Method:  stats
+    # Desc:    Returns stream metrics.
+    # Input:   None
+    # Output:  dict: The stream metrics.
+    def stats(self):
+        return {
+            "users": len(self.connections),
+            "streams": sum(len(streams) for streams in self.connections.values()),
+            "buffer": self.buffer,
+            "dropped": self.dropped,
+        }
+
+# Class:    Revisions
+# Desc:     Builds the ETags of groups and of the group list from the "revision" stored in each group, which the
+#           writer bumps whenever the group or an event shared with it changes. Revisions are persisted and
+#           replicated with the groups, so every worker (and every run of the server) tags the same data the
+#           same way. The group list's tag is an order-independent digest of every group's revision, kept up
+#           to date as groups change.
+# Properties:
+#   - tags (dict[str, int]): Each group's contribution to the digest.
+#   - digest (int): Sum of the tags, modulo 2**64.
+#   - latest (int): The highest revision seen, from which the writer numbers the next one.
+class Revisions:
+    def __init__(self):
+        self.tags = {}
+        self.digest = 0
+        self.latest = 0
+
+    # Method:  build
+    # Desc:    Adds every group.
+    # Input:   groups (Mapping[str, dict]): All groups, keyed by ID.
+    # Output:  None
+    def build(self, groups):
+        for group_id, group in groups.items():
+            self.update(group_id, group)
+
+    # Method:  update
+    # Desc:    Records a group's current revision, or its deletion.
+    # Input:   group_id (str): The group.
+    #          group (dict | None): The group, or None if it was deleted.
+    # Output:  None
+    def update(self, group_id:str, group):
+        self.digest -= self.tags.pop(group_id, 0)
+        if group is not None:
+            revision = group.get("revision", 0)
+            tag = int.from_bytes(sha256(f"{group_id}.{revision}".encode()).digest()[:8], "big")
+            self.tags[group_id] = tag
+            self.digest += tag
+            self.latest = max(self.latest, revision)
+        self.digest %= 2 ** 64
+
+    # Method:  etag
+    # Desc:    Returns a strong ETag for a group's current revision.
+    # Input:   group (dict): The group.
+    # Output:  str: The quoted ETag.
+    def etag(self, group:dict):
+        return f'"{group.get("revision", 0)}"'
+
+    # Method:  list_etag
+    # Desc:    Returns a strong ETag for the current revisions of all groups.
+    # Input:   None
+    # Output:  str: The quoted ETag.
+    def list_etag(self):
+        return f'"{self.digest:016x}"'
+
+# Class:    ResponseCache
+# Desc:     Keeps the encoded JSON bodies of hot responses (e.g. ("user", username)), each tagged with the
+#           version (ETag) it was built from, so unchanged documents aren't rebuilt and re-serialised on every
+#           request. A body is only served while its tag matches the current version; once the cache exceeds
+#           its byte budget, the least recently used bodies are evicted.
+# Properties:
+#   - budget (int): Number of bytes of bodies to keep.
+#   - entries (OrderedDict[tuple[str, str], tuple[str, bytes]]): (tag, body) of each key, least recently used first.
+#   - resident_bytes (int): Size of all kept bodies.
+class ResponseCache:
+    def __init__(self, budget:int):
+        self.budget = budget
+        self.entries = OrderedDict()
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    # Method:  get
+    # Desc:    Returns a key's body if it was built from the current version.
+    # Input:   key (tuple[str, str]): The response.
+    #          tag (str): The current version.
+    # Output:  bytes | None: The body, or None if it isn't cached or is stale.
+    def get(self, key:tuple, tag:str):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] != tag:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[1]
+
+    # Method:  put
+    # Desc:    Caches a key's body, then evicts least recently used bodies until the cache fits its budget.
+    # Input:   key (tuple[str, str]): The response.
+    #          tag (str): The version the body was built from.
+    #          body (bytes): The encoded body.
+    # Output:  None
+    def put(self, key:tuple, tag:str, body:bytes):
+        self.discard(key)
+        if len(body) > self.budget:
+            return
+        self.entries[key] = (tag, body)
+        self.resident_bytes += len(body)
+        while self.resident_bytes > self.budget:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.resident_bytes -= len(evicted)
+
+    # Method:  discard
+    # Desc:    Drops a key's body, if cached, e.g. once it is known to be stale.
+    # Input:   key (tuple[str, str]): The response.
+    # Output:  None
+    def discard(self, key:tuple):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.resident_bytes -= len(entry[1])
+
+    # Method:  stats
+    # Desc:    Returns cache metrics.
+    # Input:   None
+    # Output:  dict: The cache metrics.
+    def stats(self):
+        return {
+            "resident": len(self.entries),
+            "resident_bytes": self.resident_bytes,
+            "budget": self.budget,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
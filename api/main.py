@@ -7,43 +7,115 @@
 #
 # Author:   Brendan Liang
 # Created:  19-07-2025
-# Modified: 18-08-2025
+# Modified: 17-10-2026
 
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
-from fastapi.responses import RedirectResponse
+from fastapi import FastAPI, Header, Query, Request
+from fastapi.responses import JSONResponse, RedirectResponse, Response, StreamingResponse
 from pydantic import BaseModel
+from starlette.routing import Match
 from time import sleep
 from hashlib import sha256
+from bisect import bisect_right
+from itertools import chain, islice
+from urllib.parse import unquote
+import asyncio
 import datetime
+import heapq
 import json
+import os
+import time
+import feeds
+import indexes
+import replica
+import storage
 
 # Function: lifespan
 # Desc:    Manages the lifespan of the FastAPI application (startup & shutdown), loading and saving all data.
+#          A reader or standby worker loads a replica of the writer's data instead, and only follows the journal
+#          (until a standby is promoted, after which it saves the data like a primary).
 # Input:   app (FastAPI): The FastAPI application instance.
 # Output:  None
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Load users from file
-    try:
-        with open("users.json", "r") as f:
-            app.users = json.load(f)
-    except (FileNotFoundError, json.decoder.JSONDecodeError):
-        app.users = {}
-        with open("users.json", "w") as f:
-            json.dump(app.users, f, indent=4)
-    # Load groups from file
-    try:
-        with open("groups.json", "r") as f:
-            app.groups = json.load(f)
-    except (FileNotFoundError, json.decoder.JSONDecodeError):
-        app.groups = {}
-        with open("groups.json", "w") as f:
-            json.dump(app.groups, f, indent=4)
+    if WORKER_ROLE not in WORKER_ROLES:
+        raise ValueError(f"Unknown worker role: {WORKER_ROLE}")
+    if WORKER_ROLE != "primary" and STORAGE_MODE != "journal":
+        raise ValueError("Running several workers needs journal storage")
+    app.role = WORKER_ROLE
+    app.storage = storage.create(STORAGE_MODE, SNAPSHOT_FORK, BINARY_SNAPSHOTS)
+    app.streams = feeds.Streams()
+    app.feed = feeds.ChangeFeed(streams=app.streams)
+    app.reference = {}
+    # Only one writer may append to the journal that replicas follow
+    app.writer_lock = replica.WriterLock(WRITER_LOCK_FILE)
+    if app.role in REPLICA_ROLES:
+        app.replica = replica.JournalTail(app.storage.journal_file)
+        app.writer_epoch = None
+        app.commit_lag = None
+        app.committed_at = None
+        load_replica()
+        if app.role == "reader":
+            import httpx
+            app.writer = httpx.AsyncClient(base_url=f"http://{HOST}:{WRITER_PORT}", timeout=FORWARD_TIMEOUT)
+        app.follower = asyncio.create_task(follow())
+    else:
+        if STORAGE_MODE == "journal" and not app.writer_lock.acquire():
+            raise RuntimeError("Another writer is already running")
+        # Load users, groups and events from storage
+        app.users, app.groups, app.events = app.storage.load(USER_CACHE_BUDGET if LAZY_USERS else None)
+        build_indexes()
+        # The writer only answers once a change is in the journal, so the reader that forwarded it can read it back
+        start_writing("flush" if app.role == "writer" else DURABILITY)
     yield
 
-    # Save users to file
+    # End change streams; replicas stop following the journal and leave saving the data to the writer
+    app.streams.close_all()
+    if app.role in REPLICA_ROLES:
+        app.follower.cancel()
+        if app.role == "reader":
+            await app.writer.aclose()
+        app.replica.close()
+        return
+    # Flush pending changes, then save all data to file
+    await app.flusher.stop()
     await dump()
+    app.storage.close()
+    app.writer_lock.release()
+
+# Function: start_writing
+# Desc:    Starts persisting changes once this process holds the writer lock. With journal storage the change
+#          feed is journaled too (with the feed's epoch first), so replicas following the journal hand out the
+#          same cursors.
+# Input:   durability (str): The flusher's durability mode (see DURABILITY).
+# Output:  None
+def start_writing(durability):
+    if STORAGE_MODE == "journal":
+        app.feed.journal = []
+        app.storage.feed = app.feed
+        app.storage.write_epoch()
+    app.flusher = storage.Flusher(app.storage, app.users, app.groups, app.events, FLUSH_INTERVAL, FLUSH_THRESHOLD, durability)
+    app.flusher.start()
+
+# Function: build_indexes
+# Desc:    Builds the indexes, versions and response cache for freshly loaded users, groups and events.
+# Input:   None
+# Output:  None
+def build_indexes():
+    app.user_dates = indexes.DateIndex()
+    app.group_dates = indexes.DateIndex()
+    app.user_event_search = indexes.OwnerSearchIndex(EVENT_SEARCH_WEIGHTS)
+    app.group_event_search = indexes.OwnerSearchIndex(EVENT_SEARCH_WEIGHTS)
+    app.subscribers = indexes.ReferenceIndex("saved")
+    app.group_schools = indexes.FieldIndex("school")
+    app.group_schools.build(app.groups)
+    app.group_members = indexes.KeyIndex()
+    app.group_order = indexes.KeyIndex()
+    app.group_search = indexes.SearchIndex(GROUP_SEARCH_WEIGHTS)
+    app.group_search.build(app.groups)
+    app.revisions = feeds.Revisions()
+    app.revisions.build(app.groups)
+    app.responses = feeds.ResponseCache(RESPONSE_CACHE_BUDGET)
 
 # Create FastAPI app
 app = FastAPI(lifespan=lifespan)
@@ -51,6 +123,65 @@ app = FastAPI(lifespan=lifespan)
 # Constants
 HOST = "127.0.0.1"
 PORT = 8000
+# Persistence mode: "json" rewrites users.json/groups.json/events.json on every change,
+# "journal" appends changed documents to journal.log and folds it into the JSON files periodically,
+# "sqlite" keeps everything in indexed tables in trackademic.db, and "sharded" keeps each user, group
+# and event in its own file under data/ (import existing data with `python storage.py import sqlite|sharded`)
+STORAGE_MODE = "journal"
+# Changes are written by a background task every FLUSH_INTERVAL seconds, or once FLUSH_THRESHOLD entities are dirty.
+# DURABILITY "flush" waits for the write before responding; "immediate" responds as soon as memory is updated.
+FLUSH_INTERVAL = 0.5
+FLUSH_THRESHOLD = 100
+DURABILITY = "immediate"
+# Write JSON snapshots from a forked child process so the server keeps serving while they are written
+SNAPSHOT_FORK = True
+# Write "json"/"journal" snapshots to snapshot.bin instead of the JSON files, for faster cold starts
+# (convert with `python binary.py to-binary` / `to-json`)
+BINARY_SNAPSHOTS = False
+# Only load username and event ID indexes at startup and load users and events on first access, keeping
+# about USER_CACHE_BUDGET bytes of each resident (needs "sqlite" or "sharded" storage)
+LAZY_USERS = False
+USER_CACHE_BUDGET = 64 * 1024 * 1024
+# Bytes of encoded user, group and group list responses kept to serve unchanged documents without re-serialising
+RESPONSE_CACHE_BUDGET = 32 * 1024 * 1024
+# Reference data (subjects and schools) files, and how long clients may reuse them before revalidating
+# (or, when fetched from /reference?version= with the current version, for good)
+REFERENCE_FILES = {"subjects": "subjects.json", "schools": "schools.json"}
+REFERENCE_MAX_AGE = 24 * 60 * 60
+REFERENCE_IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+# Largest number of sub-requests accepted by /batch
+MAX_BATCH_SIZE = 100
+# Change streams send a keep-alive comment after STREAM_HEARTBEAT idle seconds; each user can have up to
+# MAX_STREAMS_PER_USER open at once
+STREAM_HEARTBEAT = 15
+MAX_STREAMS_PER_USER = 5
+# Role of this process when the API runs as several workers (see workers.py): a "primary" serves everything
+# on its own; the single "writer" serves everything and journals its change feed; "reader"s serve reads
+# from a replica of the writer's journal and forward writes to the writer; a "standby" keeps a replica of
+# the primary's journal, serves reads from it and refuses writes until promoted (POST /promote) once the
+# primary is gone
+WORKER_ROLES = ("primary", "writer", "reader", "standby")
+WORKER_ROLE = os.environ.get("TRACKADEMIC_ROLE", "primary")
+# Roles that follow another process's journal
+REPLICA_ROLES = ("reader", "standby")
+WRITER_PORT = 8001
+STANDBY_PORT = 8002
+WRITER_LOCK_FILE = "writer.lock"
+# Seconds between a replica's checks of the journal (replicas also check before every request)
+REPLICA_INTERVAL = 0.1
+# Seconds a reader waits for the writer to answer a forwarded write
+FORWARD_TIMEOUT = 30
+# Response headers not copied from the writer's response, which apply to that connection only
+HOP_HEADERS = ("connection", "keep-alive", "transfer-encoding", "content-length", "content-encoding")
+# Default and largest page sizes for paginated listings
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# Fields that can be requested from group listings with ?fields=
+GROUP_FIELDS = ("id", "name", "description", "school", "members", "member_count", "events", "colour", "owner", "version")
+# Group fields covered by /groups/search, and how much a match in each counts towards a group's rank
+GROUP_SEARCH_WEIGHTS = {"name": 4, "school": 2, "description": 1}
+# Event fields covered by /users/{username}/events/search, and their weights
+EVENT_SEARCH_WEIGHTS = {"title": 4, "type": 2, "description": 1}
 
 # Class:    User
 # Desc:     Represents a user with username, display name, and password hash.
@@ -73,8 +204,9 @@ class User(BaseModel):
 #   - name (str): The group's name.
 #   - description (str): The group's description.
 #   - school (str): The school associated with the group.
-#   - members (list[str]): List of usernames of group members.
-#   - events (list[dict]): List of event details associated with the group.
+#   - members (list[str]): Usernames of the group's members, stored as an insertion-ordered set
+#     ({username: True}) with a member_count.
+#   - events (dict[str, dict]): Events shared with the group, keyed by ID.
 #   - colour (str): The group's colour, used for UI representation.
 class Group(BaseModel):
     id: str=""
@@ -100,34 +232,821 @@ class Event(BaseModel):
     owner: str = ""
     visible: bool = False
 
+# Class:    BatchItem
+# Desc:     Represents one sub-request of a batch.
+# Properties:
+#   - method (str): "GET" or "POST".
+#   - path (str): The endpoint, with any query string (e.g. "groups/abc?fields=name").
+#   - body (dict | None): The JSON request body, for POST requests.
+#   - headers (dict[str, str]): Extra request headers (e.g. If-None-Match).
+class BatchItem(BaseModel):
+    method: str = "GET"
+    path: str
+    body: dict | None = None
+    headers: dict[str, str] = {}
+
+# Class:    Batch
+# Desc:     Represents an ordered list of sub-requests to run in one round trip.
+# Properties:
+#   - requests (list[BatchItem]): The sub-requests, run in order.
+class Batch(BaseModel):
+    requests: list[BatchItem]
+
 # Globals
 app.users = {}
 app.groups = {}
+# Every event, keyed by ID. Users reference their own events in "events" and other users' events they
+# saved in "saved"; groups reference the events shared with them in "events" ({event_id: True}).
+app.events = {}
+# Date-sorted and full-text indexes of each user's own events and each group's shared events
+app.user_dates = indexes.DateIndex()
+app.group_dates = indexes.DateIndex()
+app.user_event_search = indexes.OwnerSearchIndex({})
+app.group_event_search = indexes.OwnerSearchIndex({})
+# Users who saved each event, the groups at each school, and a search index over groups
+app.subscribers = indexes.ReferenceIndex("saved")
+app.group_schools = indexes.FieldIndex("school")
+app.group_search = indexes.SearchIndex({})
+# Sorted members of each group, and sorted IDs of all groups (("all", "")) and of the groups at each school
+# (("school", school)), for paging with key-based cursors
+app.group_members = indexes.KeyIndex()
+app.group_order = indexes.KeyIndex()
+# Recent changes to each user's events, groups and profile, for /users/{username}/changes (and pushed to
+# /users/{username}/stream), and the revisions of the groups, for the ETags of each group and of the group
+# list
+app.streams = feeds.Streams()
+app.feed = feeds.ChangeFeed(streams=app.streams)
+app.revisions = feeds.Revisions()
+# Encoded bodies of recently fetched users, groups and the group list, for the versions they were built from
+app.responses = feeds.ResponseCache(0)
+# Subjects and schools, loaded from their files once and reloaded when the files change
+app.reference = {}
 
 # Function: dump
 # Desc:    Saves all globals to their respective JSON files.
 # Input:   None
 # Output:  None
 async def dump():
-    with open("users.json", "w") as f:
-        json.dump(app.users, f, indent=4)
-    with open("groups.json", "w") as f:
-        json.dump(app.groups, f, indent=4)
+    app.storage.snapshot(app.users, app.groups, app.events)
+
+# Function: commit
+# Desc:    Queues the users, groups and events modified by a request to be persisted by the flusher, bumps the
+#          "version" of each modified document (see conflict), and revises (and writes again) the modified groups
+#          and the groups the modified events are shared with, for their ETags. Entities that no longer exist are recorded as
+#          deleted, and empty keys are ignored.
+# Input:   users (list[str]): Usernames of the modified users.
+#          groups (list[str]): IDs of the modified groups.
+#          events (list[str]): IDs of the modified events.
+# Output:  None
+async def commit(users=(), groups=(), events=()):
+    app.feed.committed()
+    changes = [("user", username) for username in users if username]
+    changes += [("group", group_id) for group_id in groups if group_id]
+    changes += [("event", event_id) for event_id in events if event_id]
+    sources = {"user": app.users, "group": app.groups, "event": app.events}
+    for kind, key in dict.fromkeys(changes):
+        document = sources[kind].get(key)
+        if document is not None:
+            document["version"] = document.get("version", 0) + 1
+    changed_groups = {group_id for group_id in groups if group_id}
+    for event_id in events:
+        group = shared_group(app.events.get(event_id) or {})
+        if group is not None:
+            changed_groups.add(group["id"])
+    # Revise the changed groups (writing them again if only a shared event changed), for their ETags
+    revision = app.revisions.latest + 1
+    for group_id in changed_groups:
+        group = app.groups.get(group_id)
+        if group is not None:
+            group["revision"] = revision
+            changes.append(("group", group_id))
+    touch_groups(changed_groups)
+    for username in users:
+        app.responses.discard(("user", username))
+    await app.flusher.mark(changes)
+
+# Function: with_changes
+# Desc:    Adds what changed for the user making a request since their last sync to the request's response,
+#          if they sent their sync version.
+# Input:   result (dict): The response.
+#          username (str): The user making the request.
+#          since (str | None): The version returned by the user's previous sync (?since=), or None.
+# Output:  dict: The response.
+def with_changes(result, username, since):
+    user = app.users.get(username)
+    if since is not None and user:
+        result["changes"] = user_changes(username, user, since)
+    return result
+
+# Function: conflict
+# Desc:    Checks the version of a document a request is about to change against the version the client last
+#          saw, so a client can't overwrite changes made since (e.g. from another device). Every commit bumps
+#          the version of each document it changes.
+# Input:   document (dict): The stored document.
+#          expected (int | None): The version the client expects (?version=), or None not to check.
+# Output:  JSONResponse | None: A 409 Conflict response with the current version, or None if the versions match.
+def conflict(document, expected):
+    if expected is None or document.get("version", 0) == expected:
+        return None
+    return JSONResponse({"error": "Version conflict", "version": document.get("version", 0)}, status_code=409)
+
+# Function: touch_groups
+# Desc:    Records the revisions of changed groups (and so of the group list), drops their cached responses and tells
+#          members who are streaming changes.
+# Input:   group_ids (Collection[str]): IDs of the groups that changed, or whose shared events changed.
+# Output:  None
+def touch_groups(group_ids):
+    for group_id in group_ids:
+        app.revisions.update(group_id, app.groups.get(group_id))
+        app.responses.discard(("group", group_id))
+        # Tell members who are streaming changes that the group (or an event shared with it) changed
+        group = app.groups.get(group_id)
+        if group and app.streams.connections:
+            for member in group["members"]:
+                app.streams.publish(member, {"version": app.feed.cursor(member), "kind": "group", "key": group_id})
+    if group_ids:
+        app.responses.discard(("groups", ""))
+
+# Function: load_replica
+# Desc:    Loads a reader's replica of the writer's data: the snapshot plus the journal written since, which is
+#          opened first so nothing written while the snapshot is read is missed. Replaying records the snapshot
+#          already includes is harmless, as each holds a whole document.
+# Input:   None
+# Output:  None
+def load_replica():
+    while True:
+        app.replica.open()
+        users, groups, events = app.storage.read()
+        records, truncated = app.replica.read()
+        if not truncated:
+            break
+    app.users, app.groups, app.events = users, groups, events
+    feed_records = []
+    for record in records:
+        storage.apply(record, users, groups, events)
+        if record["type"] in ("epoch", "feed"):
+            feed_records.append(record)
+    storage.migrate(users, groups, events)
+    build_indexes()
+    for record in feed_records:
+        apply_record(record)
+
+# Function: catch_up
+# Desc:    Applies the records the writer has journaled since a replica last looked, reloading the replica if the
+#          journal was truncated under it.
+# Input:   None
+# Output:  None
+def catch_up():
+    records, truncated = app.replica.read()
+    if truncated:
+        load_replica()
+        return
+    for record in records:
+        apply_record(record)
+
+# Function: follow
+# Desc:    Background loop that keeps a replica (and the change streams connected to it) up to date
+#          between requests.
+# Input:   None
+# Output:  None
+async def follow():
+    while True:
+        await asyncio.sleep(REPLICA_INTERVAL)
+        try:
+            catch_up()
+        except Exception as error:
+            print("Replication failed:", error)
+
+# Function: apply_record
+# Desc:    Applies one journal record to a replica, keeping its indexes, versions and cached responses in step.
+#          Until the writer's epoch has been seen, feed entries are numbered by the replica's own feed. Each
+#          batch ends with the time its oldest change was committed, from which the replication lag is measured.
+# Input:   record (dict): The journal record.
+# Output:  None
+def apply_record(record):
+    kind, key, data = record["type"], record["key"], record["data"]
+    if kind == "epoch":
+        if app.writer_epoch != key:
+            app.writer_epoch = key
+            app.feed.adopt(key, data)
+            # Streams carry the old cursors; their clients reconnect and sync
+            app.streams.close_all()
+    elif kind == "feed":
+        if app.writer_epoch is None:
+            app.feed.record([key], data[1], data[2])
+        else:
+            app.feed.apply(key, *data)
+    elif kind == "commit":
+        app.committed_at = data
+        app.commit_lag = max(0.0, time.time() - data)
+    elif kind == "user":
+        replicate_user(key, data)
+    elif kind == "group":
+        replicate_group(key, data)
+    elif kind == "event":
+        replicate_event(key, data)
+
+# Function: replicate_user
+# Desc:    Replaces or deletes a user in a replica.
+# Input:   username (str): The user.
+#          user (dict | None): The new version of the user, or None if deleted.
+# Output:  None
+def replicate_user(username, user):
+    old_user = app.users.pop(username, None) or {}
+    if user is not None:
+        app.users[username] = user
+    for event_id in old_user.get("saved", {}):
+        app.subscribers.remove(event_id, username)
+    for event_id in (user or {}).get("saved", {}):
+        app.subscribers.add(event_id, username)
+    app.user_dates.invalidate(username)
+    app.user_event_search.invalidate(username)
+    app.responses.discard(("user", username))
+
+# Function: replicate_group
+# Desc:    Replaces or deletes a group in a replica.
+# Input:   group_id (str): The group.
+#          group (dict | None): The new version of the group, or None if deleted.
+# Output:  None
+def replicate_group(group_id, group):
+    old_group = app.groups.pop(group_id, None)
+    if old_group is not None:
+        app.group_schools.remove(group_id, old_group)
+        app.group_search.remove(group_id)
+        app.group_order.remove(("all", ""), group_id)
+        app.group_order.remove(("school", old_group["school"]), group_id)
+    if group is not None:
+        app.groups[group_id] = group
+        app.group_schools.add(group_id, group)
+        app.group_search.add(group_id, group)
+        app.group_order.add(("all", ""), group_id)
+        app.group_order.add(("school", group["school"]), group_id)
+    app.group_members.invalidate(group_id)
+    app.group_dates.invalidate(group_id)
+    app.group_event_search.invalidate(group_id)
+    touch_groups([group_id])
+
+# Function: replicate_event
+# Desc:    Replaces or deletes an event in a replica.
+# Input:   event_id (str): The event.
+#          event (dict | None): The new version of the event, or None if deleted.
+# Output:  None
+def replicate_event(event_id, event):
+    old_event = app.events.pop(event_id, None)
+    if event is not None:
+        app.events[event_id] = event
+    else:
+        app.subscribers.pop(event_id)
+    changed_groups = set()
+    for version in (old_event, event):
+        if version is None:
+            continue
+        app.user_dates.invalidate(version["owner"])
+        app.user_event_search.invalidate(version["owner"])
+        if version.get("group_id"):
+            app.group_dates.invalidate(version["group_id"])
+            app.group_event_search.invalidate(version["group_id"])
+        group = shared_group(version)
+        if group is not None:
+            changed_groups.add(group["id"])
+    touch_groups(changed_groups)
+
+# Class:    ReplicaRequests
+# Desc:     Middleware of replica workers: brings the replica up to date, then serves reads itself. A reader
+#           forwards writes to the writer, catching up again afterwards so the client can read its own write;
+#           a standby refuses them until it is promoted.
+# Properties:
+#   - app (ASGIApp): The wrapped application.
+class ReplicaRequests:
+    def __init__(self, app):
+        self.app = app
+
+    # Method:  __call__
+    # Desc:    Handles one ASGI connection.
+    # Input:   scope (dict): The connection's ASGI scope.
+    #          receive (Callable): Receives ASGI messages.
+    #          send (Callable): Sends ASGI messages.
+    # Output:  None
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or app.role not in REPLICA_ROLES:
+            return await self.app(scope, receive, send)
+        catch_up()
+        if scope["method"] == "POST" and scope["path"].rstrip("/") == "/batch":
+            # Batches are only writes if one of their sub-requests is, so read the body to find out and then
+            # hand it on again
+            body = await read_body(receive)
+            receive = replay(body, receive)
+            write = batch_writes(body)
+        else:
+            write = is_write(scope)
+        if not write:
+            return await self.app(scope, receive, send)
+        if app.role == "standby":
+            response = JSONResponse({"error": "Read-only standby"}, status_code=503)
+        else:
+            response = await forward(Request(scope, receive))
+        await response(scope, receive, send)
+
+# Function: forward
+# Desc:    Forwards a request to the writer.
+# Input:   request (Request): The request.
+# Output:  Response: The writer's response, or a 503 error if it couldn't be reached.
+async def forward(request):
+    import httpx
+    headers = {name: value for name, value in request.headers.items() if name not in ("host", "content-length")}
+    try:
+        response = await app.writer.request(request.method, request.url.path, params=request.query_params, content=await request.body(), headers=headers)
+    except httpx.HTTPError:
+        return JSONResponse({"error": "Writer unavailable"}, status_code=503)
+    catch_up()
+    headers = {name: value for name, value in response.headers.items() if name.lower() not in HOP_HEADERS}
+    return Response(response.content, status_code=response.status_code, headers=headers)
+
+# Function: is_write
+# Desc:    Checks whether a request is routed to an endpoint that changes data.
+# Input:   scope (dict): The request's ASGI scope.
+# Output:  bool: Whether the request is a write.
+def is_write(scope):
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return (scope["method"], route.path) in WRITE_ROUTES
+    return False
+
+# Function: batch_writes
+# Desc:    Checks whether a batch contains a sub-request routed to an endpoint that changes data. A body that
+#          isn't a valid batch is treated as a read, so it's rejected locally.
+# Input:   body (bytes): The batch's request body.
+# Output:  bool: Whether the batch contains a write.
+def batch_writes(body):
+    try:
+        items = Batch(**json.loads(body)).requests
+    except (ValueError, TypeError):
+        return False
+    for item in items:
+        path = item.path.lstrip("/").partition("?")[0]
+        if is_write({"type": "http", "method": item.method.upper(), "path": unquote(f"/{path}"), "root_path": ""}):
+            return True
+    return False
+
+# Function: read_body
+# Desc:    Reads a request's whole body from its ASGI messages.
+# Input:   receive (Callable): Receives ASGI messages.
+# Output:  bytes: The body.
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks)
+
+# Function: replay
+# Desc:    Wraps an ASGI receive callable so that a body already read from it is received again.
+# Input:   body (bytes): The body already read.
+#          receive (Callable): The original receive callable, used once the body has been received.
+# Output:  Callable: The wrapped receive callable.
+def replay(body, receive):
+    pending = [{"type": "http.request", "body": body, "more_body": False}]
+    async def replayed():
+        if pending:
+            return pending.pop()
+        return await receive()
+    return replayed
+
+# Function: conditional
+# Desc:    Builds a response tagged with an ETag, or a bodiless 304 Not Modified if the client already has
+#          that version, in which case the body is never built or serialised. Bodies given a cache key are
+#          kept encoded in app.responses and reused until the ETag changes.
+# Input:   etag (str): The quoted ETag of the current version.
+#          if_none_match (str | None): The request's If-None-Match header.
+#          build (Callable[[], dict]): Builds the response body.
+#          key (tuple[str, str] | None): The body's key in app.responses, or None not to cache it.
+# Output:  Response: The 304 or JSON response.
+def conditional(etag, if_none_match, build, key=None):
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if matches(etag, if_none_match):
+        return Response(status_code=304, headers=headers)
+    if key is None:
+        return JSONResponse(build(), headers=headers)
+    body = app.responses.get(key, etag)
+    if body is None:
+        body = JSONResponse(build()).body
+        app.responses.put(key, etag, body)
+    return Response(body, media_type="application/json", headers=headers)
+
+# Function: matches
+# Desc:    Checks whether a request's If-None-Match header matches an ETag.
+# Input:   etag (str): The quoted ETag of the current version.
+#          if_none_match (str | None): The request's If-None-Match header.
+# Output:  bool: Whether the client already has that version.
+def matches(etag, if_none_match):
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in (tag.strip() for tag in if_none_match.split(","))
+
+# Function: reference_data
+# Desc:    Returns a reference list with its encoded body and ETag, reading its file only when the file's
+#          modification time or size has changed since it was last read.
+# Input:   name (str): "subjects" or "schools" (see REFERENCE_FILES).
+# Output:  dict: The list's "stamp", "etag", "items" and encoded "body".
+def reference_data(name):
+    path = REFERENCE_FILES[name]
+    try:
+        status = os.stat(path)
+        stamp = (status.st_mtime_ns, status.st_size)
+    except FileNotFoundError:
+        stamp = (0, 0)
+    entry = app.reference.get(name)
+    if entry is None or entry["stamp"] != stamp:
+        try:
+            with open(path, "r") as f:
+                items = json.load(f)
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            items = []
+        entry = {
+            "stamp": stamp,
+            "etag": f'"{stamp[0]:x}-{stamp[1]:x}"',
+            "items": items,
+            "body": JSONResponse({name: items}).body,
+        }
+        app.reference[name] = entry
+    return entry
+
+# Function: reference_response
+# Desc:    Builds a response for reference data that clients may cache, or a bodiless 304 Not Modified.
+# Input:   etag (str): The quoted ETag of the current version.
+#          if_none_match (str | None): The request's If-None-Match header.
+#          body (bytes): The encoded body.
+#          cache_control (str): The Cache-Control header.
+# Output:  Response: The 304 or JSON response.
+def reference_response(etag, if_none_match, body, cache_control):
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if matches(etag, if_none_match):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+# Function: shared_group
+# Desc:     Returns the group an event is shared with: its group, if it is visible to the class and the group exists.
+# Input:    event (dict): The event.
+# Output:   dict | None: The group, or None if the event isn't shared.
+def shared_group(event):
+    if not event.get("visible") or not event.get("group_id"):
+        return None
+    return app.groups.get(event["group_id"])
+
+# Function: add_event
+# Desc:     Stores a new event and adds it to its owner's and group's references and date indexes.
+# Input:    event (dict): The event.
+# Output:   list[str]: IDs of the groups whose references changed.
+def add_event(event):
+    app.events[event["id"]] = event
+    owner = app.users.get(event["owner"])
+    if owner is not None:
+        owner["events"][event["id"]] = True
+        app.user_dates.add(event["owner"], event)
+        app.user_event_search.add(event["owner"], event)
+        app.feed.record([event["owner"]], "event", event["id"])
+    group = shared_group(event)
+    if group is None:
+        return []
+    group["events"][event["id"]] = True
+    app.group_dates.add(group["id"], event)
+    app.group_event_search.add(group["id"], event)
+    return [group["id"]]
+
+# Function: replace_event
+# Desc:     Replaces a stored event with a new version, moving it between groups if needed.
+# Input:    event (dict): The new version of the event.
+# Output:   list[str]: IDs of the groups whose references changed.
+def replace_event(event):
+    event_id = event["id"]
+    old_event = app.events[event_id]
+    event["version"] = old_event.get("version", 0)
+    app.events[event_id] = event
+    app.user_dates.remove(old_event["owner"], old_event)
+    app.user_dates.add(event["owner"], event)
+    app.user_event_search.add(event["owner"], event)
+    app.feed.record([event["owner"], *subscriber_index().get(event_id)], "event", event_id)
+    changed_groups = []
+    old_group = app.groups.get(old_event.get("group_id") or "")
+    if old_group is not None and event_id in old_group["events"]:
+        app.group_dates.remove(old_group["id"], old_event)
+        app.group_event_search.remove(old_group["id"], event_id)
+    else:
+        old_group = None
+    new_group = shared_group(event)
+    if old_group is not new_group:
+        if old_group is not None:
+            del old_group["events"][event_id]
+            changed_groups.append(old_group["id"])
+        if new_group is not None:
+            new_group["events"][event_id] = True
+            changed_groups.append(new_group["id"])
+    if new_group is not None:
+        app.group_dates.add(new_group["id"], event)
+        app.group_event_search.add(new_group["id"], event)
+    return changed_groups
+
+# Function: remove_event
+# Desc:     Deletes a stored event and removes it from its owner's and group's references, the date
+#           indexes and the calendars of the users who saved it.
+# Input:    event_id (str): The ID of the event.
+# Output:   tuple[list[str], list[str]]: IDs of the groups and usernames of the subscribers whose references changed.
+def remove_event(event_id):
+    event = app.events.pop(event_id, None)
+    if event is None:
+        return [], []
+    owner = app.users.get(event["owner"])
+    if owner is not None and owner["events"].pop(event_id, None):
+        app.user_dates.remove(event["owner"], event)
+        app.user_event_search.remove(event["owner"], event_id)
+    changed_users = []
+    subscribers = subscriber_index().pop(event_id)
+    for username in subscribers:
+        user = app.users.get(username)
+        if user is not None and user.get("saved", {}).pop(event_id, None):
+            changed_users.append(username)
+    app.feed.record([event["owner"], *subscribers], "event", event_id)
+    group = app.groups.get(event.get("group_id") or "")
+    if group is None or not group["events"].pop(event_id, None):
+        return [], changed_users
+    app.group_dates.remove(group["id"], event)
+    app.group_event_search.remove(group["id"], event_id)
+    return [group["id"]], changed_users
+
+# Function: subscriber_index
+# Desc:     Returns the index of the users who saved each event, building it from every user on first use.
+#           Lazily loaded users are scanned from the backend, so building it doesn't fill the user cache.
+# Input:    None
+# Output:   indexes.ReferenceIndex: The index.
+def subscriber_index():
+    if app.subscribers.entries is None:
+        app.subscribers.build(app.users.scan() if isinstance(app.users, storage.LazyDocuments) else app.users.items())
+    return app.subscribers
+
+# Function: replace_calendar
+# Desc:     Replaces the events on a user's calendar with the full event copies the client sends. New events
+#           the user owns are stored, stored ones are left as they are (edits go through /events/edit) and
+#           ones missing from the calendar are deleted. Other users' events become saved references.
+# Input:    username (str): The user, who must already exist.
+#           events (dict): The events on the user's calendar, keyed by ID.
+# Output:   tuple[list[str], list[str], list[str]]: IDs of the groups, other users and events that changed.
+def replace_calendar(username, events):
+    user = app.users[username]
+    changed_groups = []
+    changed_users = []
+    changed_events = []
+    for event_id in list(user["events"]):
+        if event_id not in events:
+            groups, users = remove_event(event_id)
+            changed_groups += groups
+            changed_users += users
+            changed_events.append(event_id)
+    saved = {}
+    for event_id, event in events.items():
+        if event_id in user["events"]:
+            continue
+        if event.get("owner", username) == username and event_id not in app.events:
+            event = dict(event, id=event_id, owner=username)
+            event.pop("group_name", None)
+            changed_groups += add_event(event)
+            changed_events.append(event_id)
+        elif event_id in app.events:
+            saved[event_id] = True
+    for event_id in user.get("saved", {}):
+        if event_id not in saved:
+            app.subscribers.remove(event_id, username)
+            app.feed.record([username], "event", event_id)
+    for event_id in saved:
+        if event_id not in user.get("saved", {}):
+            app.subscribers.add(event_id, username)
+            app.feed.record([username], "event", event_id)
+    user["saved"] = saved
+    return changed_groups, changed_users, changed_events
+
+# Function: stored_events
+# Desc:     Looks up events by ID, skipping any that have been deleted.
+# Input:    event_ids (Iterable[str]): The IDs of the events.
+# Output:   Iterator[dict]: The stored events.
+def stored_events(event_ids):
+    for event_id in event_ids:
+        event = app.events.get(event_id)
+        if event is not None:
+            yield event
+
+# Function: user_view
+# Desc:     Returns a copy of a user in the shape the client expects, with every event on their calendar
+#           (their own and the ones they saved) inlined under "events".
+# Input:    user (dict): The user.
+# Output:   dict: The copy.
+def user_view(user):
+    view = dict(user)
+    # Users saved before documents were versioned are at version 0
+    view.setdefault("version", 0)
+    view["events"] = {event["id"]: event for event in stored_events(chain(user["events"], user.get("saved", {})))}
+    return view
+
+# Function: group_view
+# Desc:     Returns a copy of a group with its members as a list and the events shared with it inlined under "events".
+# Input:    group (dict): The group.
+# Output:   dict: The copy.
+def group_view(group):
+    view = dict(group)
+    view.setdefault("version", 0)
+    view["members"] = list(group["members"])
+    view["events"] = {event["id"]: event for event in stored_events(group["events"])}
+    return view
+
+# Function: snapshot_stats
+# Desc:    Returns metrics about the most recent snapshot.
+# Input:   None
+# Output:  JSON response with whether a snapshot is running, and the last one's status, duration (s),
+#          bytes written and Unix success time
+@app.get("/stats/snapshot")
+async def snapshot_stats():
+    return app.storage.stats()
+
+# Function: user_cache_stats
+# Desc:    Returns metrics about the lazily loaded user cache.
+# Input:   None
+# Output:  JSON response with user count, resident users and bytes, budget, and hit/miss counters,
+#          or an error message if users are not loaded lazily
+@app.get("/stats/users")
+async def user_cache_stats():
+    if not isinstance(app.users, storage.LazyDocuments):
+        return {"error": "Users are not loaded lazily"}
+    return app.users.stats()
+
+# Function: response_cache_stats
+# Desc:    Returns metrics about the cache of encoded user, group and group list responses.
+# Input:   None
+# Output:  JSON response with resident responses and bytes, budget, and hit/miss counters
+@app.get("/stats/responses")
+async def response_cache_stats():
+    return app.responses.stats()
+
+# Function: stream_stats
+# Desc:    Returns metrics about the open change streams.
+# Input:   None
+# Output:  JSON response with users and streams connected, per-stream buffer size, and streams dropped for falling behind
+@app.get("/stats/streams")
+async def stream_stats():
+    return app.streams.stats()
+
+# Function: replica_stats
+# Desc:    Returns metrics about replication from the journal.
+# Input:   None
+# Output:  JSON response with this worker's role and, on a replica, the records applied, bytes of journal not
+#          yet applied, the replication lag (s) of the last applied batch (from the commit of its oldest change,
+#          so including the time it waited to be flushed) and the age (s) of that commit
+@app.get("/stats/replica")
+async def replica_stats():
+    if app.role not in REPLICA_ROLES:
+        return {"role": app.role}
+    return {
+        "role": app.role,
+        "records": app.replica.records,
+        "behind_bytes": app.replica.behind(),
+        "lag": app.commit_lag,
+        "age": None if app.committed_at is None else max(0.0, time.time() - app.committed_at),
+    }
+
+# Function: promote
+# Desc:    Promotes a standby to primary once the primary has stopped: takes the writer lock, applies the rest
+#          of the journal, then takes over appending to it.
+# Input:   None
+# Output:  JSON response with the new role, or an error message if this worker isn't a standby or the primary
+#          is still running
+@app.post("/promote")
+async def promote():
+    if app.role != "standby":
+        return {"error": "Not a standby"}
+    if not app.writer_lock.acquire():
+        return JSONResponse({"error": "Primary is still running"}, status_code=409)
+    app.follower.cancel()
+    catch_up()
+    app.replica.close()
+    app.storage.resume()
+    start_writing(DURABILITY)
+    app.role = "primary"
+    return {"success": True, "role": app.role}
+
+# Function: event_cache_stats
+# Desc:    Returns metrics about the lazily loaded event cache.
+# Input:   None
+# Output:  JSON response with event count, resident events and bytes, budget, and hit/miss counters,
+#          or an error message if events are not loaded lazily
+@app.get("/stats/events")
+async def event_cache_stats():
+    if not isinstance(app.events, storage.LazyDocuments):
+        return {"error": "Events are not loaded lazily"}
+    return app.events.stats()
 
 # Function: check_user
 # Desc:    Checks if a user exists and returns their details, obscuring the password hash.
 # Input:   username (str): The username to check.
-# Output:  JSON response with user details or an error message if the user does not exist
+#          if_none_match (str | None): The ETag of the client's cached copy, if any.
+# Output:  JSON response with user details (or 304 Not Modified) or an error message if the user does not exist
 @app.get("/users/{username}")
-async def check_user(username: str):
+async def check_user(username: str, if_none_match: str | None = Header(None)):
     # Get user
     user = app.users.get(username)
     if not user:
         return {"error": "User not found"}
-    # Obscure password
-    user = user.copy()
-    user["password_hash"] = ""
-    return user
+    # The user's change feed version changes whenever anything in their view does, except the document's own
+    # version, which is also bumped by writes that change nothing else
+    etag = f'"{app.feed.cursor(username)}.{user.get("version", 0)}"'
+    return conditional(etag, if_none_match, lambda: dict(user_view(user), password_hash=""), ("user", username))
+
+# Function: get_changes
+# Desc:     Returns what changed on a user's calendar, groups and profile since a previous sync. Events
+#           and groups are sent in full when added or updated and by ID when removed; empty sections are
+#           left out, so a sync with no changes is just the version (and the user document's version, for
+#           requests that check it).
+# Input:    username (str): The user.
+#           since (str): The version returned by the previous sync, or "" for the first sync.
+# Output:   JSON response with the new version and the changes, or with "reset" and the whole user if the
+#           changes since that version are no longer known, or an error message if the user does not exist
+@app.get("/users/{username}/changes")
+async def get_changes(username: str, since: str = ""):
+    user = app.users.get(username)
+    if not user:
+        return {"error": "User not found"}
+    return user_changes(username, user, since)
+
+# Function: user_changes
+# Desc:     Builds the response of /users/{username}/changes, also returned by mutations so the client can
+#           patch its copy of the user without pulling the changes afterwards.
+# Input:    username (str): The user.
+#           user (dict): The user.
+#           since (str): The version returned by the previous sync, or "" for the first sync.
+# Output:   dict: The new version and the changes, or "reset" and the whole user.
+def user_changes(username, user, since):
+    version = app.feed.cursor(username)
+    changes = app.feed.changes(username, since) if since else None
+    if changes is None:
+        view = user_view(user)
+        view["password_hash"] = ""
+        return {"version": version, "reset": True, "user": view}
+    result = {"version": version, "user_version": user.get("version", 0)}
+    for kind, key in changes:
+        if kind == "event":
+            on_calendar = key in user["events"] or key in user.get("saved", {})
+            if on_calendar and key in app.events:
+                result.setdefault("events", {})[key] = app.events[key]
+            else:
+                result.setdefault("deleted_events", []).append(key)
+        elif kind == "group":
+            if key in user["groups"]:
+                result.setdefault("groups", {})[key] = True
+            else:
+                result.setdefault("left_groups", []).append(key)
+        elif kind == "profile":
+            result["profile"] = {"display_name": user["display_name"], "school": user["school"]}
+    return result
+
+# Function: stream_changes
+# Desc:     Streams notifications of changes to a user's calendar, groups and profile as Server-Sent Events,
+#           each with the user's change feed version as its ID and {"version", "kind", "key"} as its data.
+#           Clients fetch the changes themselves from /users/{username}/changes. A client reconnecting with
+#           Last-Event-ID is sent a "sync" notification first if it missed anything. Streams that fall
+#           behind are disconnected.
+# Input:    username (str): The user.
+#           last_event_id (str | None): The ID of the last notification the client received, if reconnecting.
+# Output:   Event stream of change notifications, or an error message
+@app.get("/users/{username}/stream")
+async def stream_changes(username: str, last_event_id: str | None = Header(None)):
+    if username not in app.users:
+        return {"error": "User not found"}
+    if app.streams.count(username) >= MAX_STREAMS_PER_USER:
+        return {"error": "Too many streams"}
+    stream = app.streams.open(username)
+    version = app.feed.cursor(username)
+
+    # Format a notification as a Server-Sent Event
+    def notify(message):
+        return f"id: {message['version']}\nevent: change\ndata: {json.dumps(message)}\n\n"
+
+    async def events():
+        try:
+            if last_event_id and last_event_id != version:
+                yield notify({"version": version, "kind": "sync", "key": ""})
+            while True:
+                try:
+                    message = await asyncio.wait_for(stream.queue.get(), STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if message is None or stream.dropped:
+                    return
+                yield notify(message)
+        finally:
+            app.streams.close(username, stream)
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 # Function: signin_user
 # Desc:     Reads user details from the request body and checks if provided credentials match.
@@ -140,7 +1059,7 @@ async def signin_user(user: User):
         return {"error": "User not found"}
     if saved_user["password_hash"] != user.password_hash:
         return {"error": "Incorrect password"}
-    return saved_user
+    return user_view(saved_user)
 
 # Function: create_user
 # Desc:     Creates a new user with the provided details and saves it to the users file.
@@ -148,27 +1067,43 @@ async def signin_user(user: User):
 # Output:   JSON response indicating success or failure of user creation
 @app.post("/users/signup")
 async def create_user(user: User):
+    # A signup can replace an existing user; keep counting its versions, and keep its events and saved
+    # references until replace_calendar has deleted (or unsubscribed from) the ones the new calendar drops
+    old_user = app.users.get(user.username, {})
     app.users[user.username] = {
         "username": user.username,
         "display_name": user.display_name,
         "password_hash": user.password_hash,
         "school": user.school,
         "groups": user.groups,
-        "events": user.events
+        "events": dict(old_user.get("events", {})),
+        "saved": dict(old_user.get("saved", {})),
+        "version": old_user.get("version", 0),
     }
+    app.user_dates.invalidate(user.username)
+    app.user_event_search.invalidate(user.username)
+    # A signup can replace an existing user, so their cached copies are stale
+    app.feed.record([user.username], "profile")
+    groups, users, events = replace_calendar(user.username, user.events)
 
-    await dump()
-    return {"success": True}
+    await commit(users=[user.username, *users], groups=groups, events=events)
+    return {"success": True, "version": app.users[user.username]["version"]}
 
 # Function: update_user
 # Desc:     Updates an existing user's details with the provided information and saves it to the users file.
 # Input:    user (User): The user details from the request body.
-# Output:   JSON response indicating success or failure of user update
+#           version (int | None): The version of the user the client last saw, or None not to check.
+#           since (str | None): The client's sync version, to return the user's changes since (see with_changes).
+# Output:   JSON response with the user's new version, or an error message (409 if the user changed since)
 @app.post("/users/update")
-async def update_user(user: User):
+async def update_user(user: User, version: int | None = None, since: str | None = None):
     # Check if user exists
     if user.username not in app.users:
         return {"error": "User not found"}
+    saved_user = app.users[user.username]
+    response = conflict(saved_user, version)
+    if response:
+        return response
     # Update user details
     app.users[user.username] = {
         "username": user.username,
@@ -176,31 +1111,139 @@ async def update_user(user: User):
         "password_hash": user.password_hash or app.users[user.username]["password_hash"],
         "school": user.school or app.users[user.username]["school"],
         "groups": user.groups or app.users[user.username]["groups"],
-        "events": user.events or app.users[user.username]["events"],
+        "events": saved_user["events"],
+        "saved": saved_user.get("saved", {}),
     }
+    # Keep the event ID counter and version; the client doesn't send them
+    for field in ("next_event_id", "version"):
+        if field in saved_user:
+            app.users[user.username][field] = saved_user[field]
+    # Record what changed for the user's change feed
+    new_user = app.users[user.username]
+    if (new_user["display_name"], new_user["school"]) != (saved_user["display_name"], saved_user["school"]):
+        app.feed.record([user.username], "profile")
+    for group_id in new_user["groups"].keys() ^ saved_user["groups"].keys():
+        app.feed.record([user.username], "group", group_id)
+    groups, users, events = replace_calendar(user.username, user.events) if user.events else ([], [], [])
     
-    await dump()
-    return {"success": True}
+    await commit(users=[user.username, *users], groups=groups, events=events)
+    return with_changes({"success": True, "version": new_user["version"]}, user.username, since)
 
+# Function: get_events
+# Desc:     Returns a user's events (their own and the ones they saved) between two dates (inclusive),
+#           with each event's group name resolved.
+# Input:    username (str): The user whose events to return.
+#           start (date): The first date (?from=YYYY-MM-DD), or None for no lower bound.
+#           end (date): The last date (?to=YYYY-MM-DD), or None for no upper bound.
+# Output:   JSON response with the matching events keyed by ID, or an error message if the user does not exist
+@app.get("/users/{username}/events")
+async def get_events(username: str, start: datetime.date | None = Query(None, alias="from"), end: datetime.date | None = Query(None, alias="to")):
+    user = app.users.get(username)
+    if not user:
+        return {"error": "User not found"}
+    start = start.isoformat() if start else ""
+    end = end.isoformat() if end else ""
+    event_ids = app.user_dates.range(username, stored_events(user["events"]), start, end)
+    # Saved events are few, so they are filtered directly
+    for event in stored_events(user.get("saved", {})):
+        if start <= event.get("date", "") and (not end or event.get("date", "") <= end):
+            event_ids.append(event["id"])
+    return {"events": with_group_names(event_ids)}
+
+# Function: get_group_events
+# Desc:     Returns the events shared with a group between two dates (inclusive), with the group name resolved.
+# Input:    group_id (str): The group whose events to return.
+#           start (date): The first date (?from=YYYY-MM-DD), or None for no lower bound.
+#           end (date): The last date (?to=YYYY-MM-DD), or None for no upper bound.
+# Output:   JSON response with the matching events keyed by ID, or an error message if the group does not exist
+@app.get("/groups/{group_id}/events")
+async def get_group_events(group_id: str, start: datetime.date | None = Query(None, alias="from"), end: datetime.date | None = Query(None, alias="to")):
+    group = app.groups.get(group_id)
+    if not group:
+        return {"error": "Group not found"}
+    event_ids = app.group_dates.range(group_id, stored_events(group["events"]), start.isoformat() if start else "", end.isoformat() if end else "")
+    return {"events": with_group_names(event_ids)}
+
+# Function: search_events
+# Desc:     Searches the titles, descriptions and types of a user's own events and the events shared with
+#           their groups, optionally between two dates (inclusive). Every word of the query must match the
+#           start of a word in the event.
+# Input:    username (str): The user whose events to search.
+#           q (str): The query.
+#           start (date): The first date (?from=YYYY-MM-DD), or None for no lower bound.
+#           end (date): The last date (?to=YYYY-MM-DD), or None for no upper bound.
+#           limit (int): The maximum number of events to return.
+# Output:   JSON response with the matching events keyed by ID, best match first, or an error message if
+#           the user does not exist
+@app.get("/users/{username}/events/search")
+async def search_events(username: str, q: str = "", start: datetime.date | None = Query(None, alias="from"), end: datetime.date | None = Query(None, alias="to"), limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)):
+    user = app.users.get(username)
+    if not user:
+        return {"error": "User not found"}
+    start = start.isoformat() if start else ""
+    end = end.isoformat() if end else ""
+    # Search the user's own index and each of their groups' indexes, limited to the date range if given
+    sources = [(app.user_event_search, app.user_dates, username, user["events"])]
+    for group_id in user["groups"]:
+        group = app.groups.get(group_id)
+        if group is not None:
+            sources.append((app.group_event_search, app.group_dates, group_id, group["events"]))
+    scores = {}
+    for search_index, dates, key, event_ids in sources:
+        index = search_index.build(key, stored_events(event_ids))
+        allowed = dates.range(key, stored_events(event_ids), start, end) if start or end else None
+        scores.update(index.scores(q, allowed))
+    return {"events": with_group_names(heapq.nlargest(limit, scores, key=scores.get))}
+
+# Function: with_group_names
+# Desc:     Copies a selection of stored events, adding the name of each event's group as group_name.
+# Input:    event_ids (list[str]): The IDs of the events to copy.
+# Output:   dict: The copied events keyed by ID.
+def with_group_names(event_ids):
+    result = {}
+    for event in stored_events(event_ids):
+        event = dict(event)
+        group = app.groups.get(event.get("group_id") or "")
+        event["group_name"] = group["name"] if group else ""
+        result[event["id"]] = event
+    return result
+
+# Function: event_counter
+# Desc:     Returns the next free numerical event ID from a user's persisted sequence counter.
+# Input:    user (dict): The user.
+# Output:   int: The next numerical ID; the caller advances next_event_id once it is used.
+def event_counter(user):
+    if "next_event_id" not in user:
+        # Seed the counter once for users saved before it existed
+        user["next_event_id"] = max((e.get("numerical_id") or 0 for e in stored_events(user["events"])), default=0) + 1
+    return user["next_event_id"]
+
+# Function: create_event
+# Desc:     Creates an event on a user's calendar, numbered by the user's event counter.
+# Input:    username (str): The owner of the event.
+#           event (Event): The event details.
+#           since (str | None): The client's sync version, to return the user's changes since (see with_changes).
+# Output:   JSON response with the event, its IDs and version, or an error message
 @app.post("/users/{username}/events/create")
-async def create_event(username: str, event: Event):
+async def create_event(username: str, event: Event, since: str | None = None):
     # Check if user exists
     user = app.users.get(username)
     if not user:
         return {"error": "User not found"}
     
-    # Check if event_id was provided
+    # Check if event_id was provided (older clients compute their own)
     event_id = event.id
     numerical_id = event.numerical_id
     if not event.id or not numerical_id:
-        # Previous event IDs
-        previous_event_ids = [e["numerical_id"] for e in user["events"].values()]
-        # Create event ID
-        numerical_id = max(previous_event_ids, default=0) + 1
+        # Create event ID from the user's sequence counter
+        numerical_id = event_counter(user)
         event_id = sha256(f"{username}{numerical_id}".encode()).hexdigest()
+    elif app.events.get(event_id, {}).get("owner", username) != username:
+        return {"error": "Event already exists"}
+    user["next_event_id"] = max(event_counter(user), numerical_id + 1)
     
-    # Add event to user
-    user["events"][event_id] = {
+    # Add event, replacing any event with the same ID (keeping the users who saved it)
+    event = {
         "id": event_id,
         "numerical_id": numerical_id,
         "title": event.title,
@@ -214,48 +1257,38 @@ async def create_event(username: str, event: Event):
         "owner": username,
         "visible": event.visible,
     }
-    # Create event in group if needed
-    if event.group_id:
-        group = app.groups.get(event.group_id)
-        if group:
-            if not group.get("events"):
-                # Add event to group
-                group["events"].append({
-                    "id": event_id,
-                    "numerical_id": numerical_id,
-                    "title": event.title,
-                    "description": event.description,
-                    "type": event.type,
-                    "date": event.date.isoformat(),
-                    "start_time": event.start_time,
-                    "end_time": event.end_time,
-                    "colour": event.colour,
-                    "owner": username,
-                    "visible": event.visible,
-                })
-            app.groups[event.group_id] = group
+    groups = replace_event(event) if event_id in app.events else add_event(event)
     
     # Save changes
-    app.users[username] = user
-    await dump()
+    await commit(users=[username], groups=groups, events=[event_id])
     
-    return {"success": True, "event_id": event_id}
+    event = app.events[event_id]
+    return with_changes({"success": True, "event_id": event_id, "numerical_id": numerical_id, "version": event["version"], "event": event}, username, since)
 
+# Function: edit_event
+# Desc:     Updates one of a user's events.
+# Input:    username (str): The owner of the event.
+#           event (Event): The new details of the event.
+#           version (int | None): The version of the event the client last saw, or None not to check.
+#           since (str | None): The client's sync version, to return the user's changes since (see with_changes).
+# Output:   JSON response with the event and its new version, or an error message (409 if the event changed since)
 @app.post("/users/{username}/events/edit")
-async def edit_event(username: str, event: Event):
+async def edit_event(username: str, event: Event, version: int | None = None, since: str | None = None):
     # Check if user exists
     user = app.users.get(username)
     if not user:
         return {"error": "User not found"}
     
     # Find event by ID
-    existing_event = user["events"].get(event.id)
+    existing_event = app.events.get(event.id) if event.id in user["events"] else None
     if not existing_event:
         return {"error": "Event not found"}
+    response = conflict(existing_event, version)
+    if response:
+        return response
     
-    # Update event details
-
-    new_event = {
+    # Update event details, moving it to its new group if needed
+    groups = replace_event({
         "id": existing_event["id"],
         "numerical_id": existing_event["numerical_id"],
         "title": event.title,
@@ -268,171 +1301,279 @@ async def edit_event(username: str, event: Event):
         "colour": event.colour,
         "owner": username,
         "visible": event.visible,
-    }
-
-    # Create event in group if needed
-    print("hello", event.group_id)
-    if event.group_id and event.visible:
-        if existing_event.get("group_id") and existing_event["group_id"] != event.group_id:
-            # Remove from old group
-            old_group = app.groups.get(existing_event["group_id"])
-            if old_group:
-                old_group["events"] = [e for e in old_group["events"] if e["id"] != event.id]
-                app.groups[existing_event["group_id"]] = old_group
-        group = app.groups.get(event.group_id)
-        if group:
-        # Add event to new group if not already present
-            if event.id not in group["events"]:
-                app.groups[event.group_id]["events"][event.id] = new_event
-            else:
-                # Update existing group event details
-                group_event = group["events"][event.id]
-                group_event.update(new_event)
-                app.groups[event.group_id]["events"][event.id] = group_event
-
-    print(existing_event)
+    })
 
     # Save changes
-    app.users[username]["events"][event.id] = new_event
-    await dump()
+    await commit(groups=groups, events=[event.id])
     
-    return {"success": True, "message": "Event updated successfully"}
+    event = app.events[event.id]
+    return with_changes({"success": True, "message": "Event updated successfully", "version": event["version"], "event": event}, username, since)
 
+# Function: delete_event
+# Desc:     Deletes one of a user's events, or removes an event they saved from their calendar.
+# Input:    username (str): The user.
+#           event_id (str): The ID of the event.
+#           version (int | None): The version of the event the client last saw, or None not to check.
+#           since (str | None): The client's sync version, to return the user's changes since (see with_changes).
+# Output:   JSON response indicating success, or an error message (409 if the event changed since)
 @app.get("/users/{username}/events/delete/{event_id}")
-async def delete_event(username: str, event_id: str):
+async def delete_event(username: str, event_id: str, version: int | None = None, since: str | None = None):
     # Check if user exists
     user = app.users.get(username)
     if not user:
         return {"error": "User not found"}
+    response = conflict(app.events.get(event_id, {}), version)
+    if response:
+        return response
     
-    # Find event by ID
-    event = user["events"].get(event_id)
-    if not event:
+    # Delete the user's own event, or remove a saved one from their calendar
+    if event_id in user["events"]:
+        groups, users = remove_event(event_id)
+    elif event_id in user.get("saved", {}):
+        del user["saved"][event_id]
+        app.subscribers.remove(event_id, username)
+        app.feed.record([username], "event", event_id)
+        groups, users = [], []
+    else:
         return {"error": "Event not found"}
     
-    # Remove event from user
-    del user["events"][event_id]
-    
-    # Remove event from group if it exists
-    if event.get("group_id"):
-        group = app.groups.get(event["group_id"])
-        if group:
-            group["events"] = [e for e in group["events"] if e["id"] != event_id]
-            app.groups[event["group_id"]] = group
-    
     # Save changes
-    app.users[username] = user
-    await dump()
+    await commit(users=[username, *users], groups=groups, events=[event_id])
     
-    return {"success": True, "message": "Event deleted successfully"}
+    return with_changes({"success": True, "message": "Event deleted successfully"}, username, since)
+
+# Function: save_event
+# Desc:     Saves another user's event (e.g. one shared with a class) to a user's calendar.
+# Input:    username (str): The user saving the event.
+#           event_id (str): The ID of the event.
+#           version (int | None): The version of the user the client last saw, or None not to check.
+#           since (str | None): The client's sync version, to return the user's changes since (see with_changes).
+# Output:   JSON response with the user's new version, or an error message (409 if the user changed since)
+@app.get("/users/{username}/events/save/{event_id}")
+async def save_event(username: str, event_id: str, version: int | None = None, since: str | None = None):
+    user = app.users.get(username)
+    if not user:
+        return {"error": "User not found"}
+    response = conflict(user, version)
+    if response:
+        return response
+    if event_id not in app.events:
+        return {"error": "Event not found"}
+    if event_id in user["events"] or event_id in user.get("saved", {}):
+        return {"error": "Event already saved"}
+    user.setdefault("saved", {})[event_id] = True
+    app.subscribers.add(event_id, username)
+    app.feed.record([username], "event", event_id)
+    await commit(users=[username])
+    return with_changes({"success": True, "message": "Event saved successfully", "version": user["version"]}, username, since)
+
+# Function: unsave_event
+# Desc:     Removes a saved event from a user's calendar.
+# Input:    username (str): The user unsaving the event.
+#           event_id (str): The ID of the event.
+#           version (int | None): The version of the user the client last saw, or None not to check.
+#           since (str | None): The client's sync version, to return the user's changes since (see with_changes).
+# Output:   JSON response with the user's new version, or an error message (409 if the user changed since)
+@app.get("/users/{username}/events/unsave/{event_id}")
+async def unsave_event(username: str, event_id: str, version: int | None = None, since: str | None = None):
+    user = app.users.get(username)
+    if not user:
+        return {"error": "User not found"}
+    response = conflict(user, version)
+    if response:
+        return response
+    if event_id not in user.get("saved", {}):
+        return {"error": "Event not found"}
+    del user["saved"][event_id]
+    app.subscribers.remove(event_id, username)
+    app.feed.record([username], "event", event_id)
+    await commit(users=[username])
+    return with_changes({"success": True, "message": "Event unsaved successfully", "version": user["version"]}, username, since)
+
+# Function: get_subscriber_count
+# Desc:     Returns how many users have saved an event to their calendar.
+# Input:    event_id (str): The ID of the event.
+# Output:   JSON response with the event ID and subscriber count, or an error message if the event does not exist
+@app.get("/events/{event_id}/subscribers")
+async def get_subscriber_count(event_id: str):
+    if event_id not in app.events:
+        return {"error": "Event not found"}
+    return {"event_id": event_id, "subscribers": subscriber_index().count(event_id)}
 
 # Function: create_group
 # Desc:     Creates a new group with the provided details and saves it to the groups file.
 # Input:    group (Group): The group details from the request body.
-# Output:   JSON response indicating success or failure of group creation
+#           since (str | None): The owner's sync version, to return their changes since (see with_changes).
+# Output:   JSON response with the group and its version, or an error message
 @app.post("/groups/create")
-async def create_group(group: Group):
+async def create_group(group: Group, since: str | None = None):
     # Check if group exists
     group_id = sha256(f"{group.name}{group.school}".encode()).hexdigest()
     if group_id in app.groups:
         return {"error": "Group already exists"}
     # Create group
+    members = dict.fromkeys(group.members, True)
     app.groups[group_id] = {
         "id": group_id,
         "name": group.name,
         "description": group.description,
         "school": group.school,
-        "members": group.members,
-        "events": group.events,
+        "members": members,
+        "member_count": len(members),
+        "events": {event_id: True for event_id in group.events if event_id in app.events},
         "colour": group.colour,
         "owner": group.owner
     }
+    app.group_dates.invalidate(group_id)
+    app.group_event_search.invalidate(group_id)
+    app.group_schools.add(group_id, app.groups[group_id])
+    app.group_search.add(group_id, app.groups[group_id])
+    app.group_order.add(("all", ""), group_id)
+    app.group_order.add(("school", group.school), group_id)
+    app.group_members.invalidate(group_id)
     # Add to user
     for member in group.members:
         app.users[member]["groups"][group_id] = True
-    await dump()
-    return {"success": True, "group_id": group_id}
+    app.feed.record(group.members, "group", group_id)
+    await commit(users=group.members, groups=[group_id])
+    created = app.groups[group_id]
+    return with_changes({"success": True, "group_id": group_id, "version": created["version"], "group": group_view(created)}, group.owner, since)
+
+# Function: search_groups
+# Desc:     Searches group names, schools and descriptions. Every word of the query must match the start of
+#           a word in the group, so partially typed queries match too.
+# Input:    q (str): The query.
+#           school (str): Only return groups at this school, or "" for any school.
+#           limit (int): The maximum number of groups to return.
+#           fields (str): Comma-separated fields to return for each group (see GROUP_FIELDS).
+# Output:   JSON response with the matching groups keyed by ID, best match first, or an error message
+@app.get("/groups/search")
+async def search_groups(q: str = "", school: str = "", limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), fields: str = "id,name,school,colour,member_count"):
+    selected = parse_fields(fields)
+    if selected is None:
+        return {"error": f"Unknown fields: {fields}"}
+    group_ids = app.group_search.search(q, limit, app.group_schools.get(school) if school else None)
+    return {"groups": {group_id: group_fields(app.groups[group_id], selected) for group_id in group_ids}}
 
 # Function: get_group
 # Desc:     Retrieves a group by its ID and returns its details.
 # Input:    group_id (str): The ID of the group to retrieve.
-# Output:   JSON response with group details or an error message if the group does not exist
+#           if_none_match (str | None): The ETag of the client's cached copy, if any.
+# Output:   JSON response with group details (or 304 Not Modified) or an error message if the group does not exist
 @app.get("/groups/{group_id}")
-async def get_group(group_id: str):
+async def get_group(group_id: str, if_none_match: str | None = Header(None)):
     # Get group
     group = app.groups.get(group_id)
     if not group:
         return {"error": "Group not found"}
-    return group
+    return conditional(app.revisions.etag(group), if_none_match, lambda: group_view(group), ("group", group_id))
+
+# Function: get_group_members
+# Desc:     Returns a page of a group's members, ordered by username (not join order, so the cursor means the
+#           same to every worker; see indexes.KeyIndex).
+# Input:    group_id (str): The ID of the group.
+#           cursor (str): The next_cursor of the previous page, or "" for the first page.
+#           limit (int): The maximum number of members to return.
+# Output:   JSON response with the members, member count and the cursor of the next page ("" after the last
+#           page), or an error message if the group does not exist
+@app.get("/groups/{group_id}/members")
+async def get_group_members(group_id: str, cursor: str = "", limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)):
+    group = app.groups.get(group_id)
+    if not group:
+        return {"error": "Group not found"}
+    # The cursor is the last member of the previous page; fetch one extra member to tell whether there is another page
+    members = app.group_members.page(group_id, group["members"], cursor, limit + 1)
+    return {
+        "members": members[:limit],
+        "member_count": group["member_count"],
+        "next_cursor": members[limit - 1] if len(members) > limit else "",
+    }
 
 # Function: leave_group
-# Desc:     Allows a user to leave a group by removing them from the group's members list.
+# Desc:     Allows a user to leave a group by removing them from the group's members.
 # Input:    group_id (str): The ID of the group to leave.
 #           user (User): The user who is leaving the group.
-# Output:   JSON response indicating success or failure of leaving the group
+#           version (int | None): The version of the group the client last saw, or None not to check.
+#           since (str | None): The client's sync version, to return the user's changes since (see with_changes).
+# Output:   JSON response with the group and its new version, or an error message (409 if the group changed since)
 @app.post("/groups/{group_id}/leave")
-async def leave_group(group_id: str, user: User):
+async def leave_group(group_id: str, user: User, version: int | None = None, since: str | None = None):
     # Check if group exists
     group = app.groups.get(group_id)
     if not group:
         return {"error": "Group not found"}
+    response = conflict(group, version)
+    if response:
+        return response
     
     # Remove user from group members
-    if user.username in group["members"]:
-        group["members"].remove(user.username)
+    if group["members"].pop(user.username, None):
+        group["member_count"] -= 1
+        app.group_members.remove(group_id, user.username)
 
     # Remove group from user
     if group_id in app.users.get(user.username, {}).get("groups", {}):
         del app.users[user.username]["groups"][group_id]
+        app.feed.record([user.username], "group", group_id)
 
     # Change owner if the user leaving is the owner
     if group["owner"] == user.username:
-        # Find a new owner (first member in the list)
-        if group["members"]:
-            group["owner"] = group["members"][0]
-        else:
-            group["owner"] = None
+        # Find a new owner (the longest-standing member)
+        group["owner"] = next(iter(group["members"]), None)
     
     # Save changes
     app.groups[group_id] = group
-    await dump()
+    await commit(users=[user.username], groups=[group_id])
     
-    return {"success": True, "message": "User left the group successfully"}
+    return with_changes({"success": True, "message": "User left the group successfully", "version": group["version"], "group": group_view(group)}, user.username, since)
 
 # Function: delete_group
 # Desc:     Deletes a group by its ID, removing it from the groups file.
 # Input:    group_id (str): The ID of the group to delete.
-# Output:   JSON response indicating success or failure of group deletion
+#           version (int | None): The version of the group the client last saw, or None not to check.
+# Output:   JSON response indicating success, or an error message (409 if the group changed since)
 @app.get("/groups/{group_id}/delete")
-async def delete_group(group_id: str):
+async def delete_group(group_id: str, version: int | None = None):
     group = app.groups.get(group_id)
     if not group:
         return {"error": "Group not found"}
-    # Force remove frm all users
+    response = conflict(group, version)
+    if response:
+        return response
+    # Force remove from all members
     for member in group["members"]:
-        if member in app.users:
-            user = app.users[member]
-            if group_id in user["groups"]:
-                print("Removing group from user:", member)
-                del user["groups"][group_id]
-            app.users[member] = user
+        user = app.users.get(member)
+        if user is not None and user["groups"].pop(group_id, None):
+            app.feed.record([member], "group", group_id)
     # Remove group
     del app.groups[group_id]
+    app.group_dates.invalidate(group_id)
+    app.group_event_search.invalidate(group_id)
+    app.group_schools.remove(group_id, group)
+    app.group_search.remove(group_id)
+    app.group_order.remove(("all", ""), group_id)
+    app.group_order.remove(("school", group["school"]), group_id)
+    app.group_members.invalidate(group_id)
     # Save changes
-    await dump()
+    await commit(users=group["members"], groups=[group_id])
     return {"success": True, "message": "Group deleted successfully"}
 
 # Function: join_group
-# Desc:     Allows a user to join a group by adding them to the group's members list.
+# Desc:     Allows a user to join a group by adding them to the group's members.
 # Input:    group_id (str): The ID of the group to join.
 #           user (User): The user who is joining the group.
-# Output:   JSON response indicating success or failure of joining the group
+#           version (int | None): The version of the group the client last saw, or None not to check.
+#           since (str | None): The client's sync version, to return the user's changes since (see with_changes).
+# Output:   JSON response with the group and its new version, or an error message (409 if the group changed since)
 @app.post("/groups/{group_id}/join")
-async def join_group(group_id: str, user: User):
+async def join_group(group_id: str, user: User, version: int | None = None, since: str | None = None):
     # Check if group exists
     group = app.groups.get(group_id)
     if not group:
         return {"error": "Group not found"}
+    response = conflict(group, version)
+    if response:
+        return response
     
     # Add group to user
     target_user = app.users.get(user.username)
@@ -440,80 +1581,232 @@ async def join_group(group_id: str, user: User):
         # Check if user is already in the group
         if group_id not in target_user["groups"]:
             target_user["groups"][group_id] = True
+            app.feed.record([user.username], "group", group_id)
 
     # Add user to group members
-    if not user.username in group["members"]:
-        group["members"].append(user.username)
+    if user.username not in group["members"]:
+        group["members"][user.username] = True
+        group["member_count"] += 1
+        app.group_members.add(group_id, user.username)
     
     # Make user owner if they are the first member
-    if len(group["members"]) == 1:
+    if group["member_count"] == 1:
         group["owner"] = user.username
     
     # Save changes
     app.groups[group_id] = group
-    app.users[user.username] = target_user
-    await dump()
+    if target_user:
+        app.users[user.username] = target_user
+    await commit(users=[user.username], groups=[group_id])
     
-    return {"success": True, "message": "User joined the group successfully"}
+    return with_changes({"success": True, "message": "User joined the group successfully", "version": group["version"], "group": group_view(group)}, user.username, since)
 
 # Function: get_all_groups
-# Desc:     Returns a list of all groups.
-# Input:    None
-# Output:   JSON response with a list of all groups
+# Desc:     Returns groups, optionally only those at a school and/or with a member, a page at a time (ordered
+#           by ID) and with only the requested fields. Without any parameters, every group is returned in full
+#           as before.
+# Input:    school (str): Only return groups at this school, or "" for any school.
+#           member (str): Only return groups this user is a member of, or "" for any groups.
+#           cursor (str): The next_cursor of the previous page, or "" for the first page.
+#           limit (int): The maximum number of groups to return.
+#           fields (str): Comma-separated fields to return for each group (see GROUP_FIELDS), or "" for all.
+#           if_none_match (str | None): The ETag of the client's cached copy, if any.
+# Output:   JSON response with the groups keyed by ID and the cursor of the next page ("" after the last page),
+#           or all groups keyed by ID if no parameters were given, or 304 Not Modified, or an error message
 @app.get("/groups")
-async def get_all_groups():
-    # Return all groups
-    return app.groups
+async def get_all_groups(school: str = "", member: str = "", cursor: str = "", limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE), fields: str = "", if_none_match: str | None = Header(None)):
+    # Any group change bumps the group list's version; filtering by member also depends on the member's groups
+    etag = app.revisions.list_etag()
+    if member:
+        etag = f'{etag[:-1]}.{app.feed.cursor(member)}"'
+    if not (school or member or cursor or limit or fields):
+        # Return all groups
+        return conditional(etag, if_none_match, lambda: {group_id: group_view(group) for group_id, group in app.groups.items()}, ("groups", ""))
+
+    # Check parameters
+    selected = parse_fields(fields)
+    if selected is None:
+        return {"error": f"Unknown fields: {fields}"}
+    limit = limit or PAGE_SIZE
+
+    # The cursor is the last group of the previous page; find the matching groups after it, using the member's
+    # own group list or the sorted IDs of all groups or of the school's groups, and fetch one extra group to
+    # tell whether there is another page
+    def build():
+        if member:
+            user = app.users.get(member)
+            group_ids = sorted(group_id for group_id in (user["groups"] if user else ()) if group_id in app.groups)
+            group_ids = group_ids[bisect_right(group_ids, cursor):] if cursor else group_ids
+            if school:
+                group_ids = (group_id for group_id in group_ids if app.groups[group_id]["school"] == school)
+            page = list(islice(group_ids, limit + 1))
+        elif school:
+            page = app.group_order.page(("school", school), app.group_schools.get(school), cursor, limit + 1)
+        else:
+            page = app.group_order.page(("all", ""), app.groups, cursor, limit + 1)
+        groups = {group_id: group_fields(app.groups[group_id], selected) for group_id in page[:limit]}
+        return {"groups": groups, "next_cursor": page[limit - 1] if len(page) > limit else ""}
+    return conditional(etag, if_none_match, build)
 
+# Function: parse_fields
+# Desc:     Parses a ?fields= list of group fields.
+# Input:    fields (str): Comma-separated fields, or "" for all fields.
+# Output:   list[str] | None: The fields, or None if any of them aren't in GROUP_FIELDS.
+def parse_fields(fields):
+    selected = [field for field in fields.split(",") if field] or list(GROUP_FIELDS)
+    if any(field not in GROUP_FIELDS for field in selected):
+        return None
+    return selected
+
+# Function: group_fields
+# Desc:     Returns the selected fields of a group, only building the member list and inlining events if requested.
+# Input:    group (dict): The group.
+#           fields (list[str]): The fields to return.
+# Output:   dict: The selected fields.
+def group_fields(group, fields):
+    result = {}
+    for field in fields:
+        if field == "members":
+            result[field] = list(group["members"])
+        elif field == "events":
+            result[field] = {event["id"]: event for event in stored_events(group["events"])}
+        elif field == "version":
+            result[field] = group.get(field, 0)
+        else:
+            result[field] = group.get(field)
+    return result
+
+# Function: delete_event
+# Desc:     Deletes an event shared with a group.
+# Input:    group_id (str): The group.
+#           event_id (str): The ID of the event.
+#           version (int | None): The version of the event the client last saw, or None not to check.
+# Output:   JSON response indicating success, or an error message (409 if the event changed since)
 @app.get("/groups/{group_id}/events/delete/{event_id}")
-async def delete_event(group_id: str, event_id: str):
+async def delete_event(group_id: str, event_id: str, version: int | None = None):
     # Check if group exists
     group = app.groups.get(group_id)
     if not group:
         return {"error": "Group not found"}
     
     # Find event by ID
-    event = group["events"].get(event_id)
+    event = app.events.get(event_id) if event_id in group["events"] else None
     if not event:
         return {"error": "Event not found"}
+    response = conflict(event, version)
+    if response:
+        return response
     
-    # Remove event from group
-    if event_id in group["events"]:
-        del group["events"][event_id]
-    # Remove event from all users in the group
-    for member in group["members"]:
-        user = app.users.get(member)
-        if user and event_id in user["events"]:
-            del user["events"][event_id]
-            app.users[member] = user
+    # Delete the event, removing it from the calendars of the members who saved it
+    _, users = remove_event(event_id)
     
     # Save changes
-    app.groups[group_id] = group
-    await dump()
+    await commit(users=[event["owner"], *users], groups=[group_id], events=[event_id])
     
     return {"success": True, "message": "Event deleted successfully"}
 
+# Function: get_subjects
+# Desc:    Returns the list of subjects classes can be created for.
+# Input:   if_none_match (str | None): The ETag of the client's cached copy, if any.
+# Output:  JSON response with the subjects, or 304 Not Modified
 @app.get("/subjects")
-async def get_subjects():
-    # Load subjects from file
-    try:
-        with open("subjects.json", "r") as f:
-            subjects = json.load(f)
-    except (FileNotFoundError, json.decoder.JSONDecodeError):
-        subjects = []
-    
-    return {"subjects": subjects}
+async def get_subjects(if_none_match: str | None = Header(None)):
+    subjects = reference_data("subjects")
+    return reference_response(subjects["etag"], if_none_match, subjects["body"], f"public, max-age={REFERENCE_MAX_AGE}")
 
+# Function: get_schools
+# Desc:    Returns the list of schools users can belong to.
+# Input:   if_none_match (str | None): The ETag of the client's cached copy, if any.
+# Output:  JSON response with the schools, or 304 Not Modified
 @app.get("/schools")
-async def get_schools():
-    # Load schools from file
+async def get_schools(if_none_match: str | None = Header(None)):
+    schools = reference_data("schools")
+    return reference_response(schools["etag"], if_none_match, schools["body"], f"public, max-age={REFERENCE_MAX_AGE}")
+
+# Function: get_reference
+# Desc:    Returns the subjects and schools in one response, stamped with a version that changes whenever
+#          either does. Requests for the current version may be cached indefinitely.
+# Input:   version (str): The version the client has cached, if any.
+#          if_none_match (str | None): The ETag of the client's cached copy, if any.
+# Output:  JSON response with the version, subjects and schools, or 304 Not Modified
+@app.get("/reference")
+async def get_reference(version: str = "", if_none_match: str | None = Header(None)):
+    lists = {name: reference_data(name) for name in REFERENCE_FILES}
+    stamp = tuple(data["stamp"] for data in lists.values())
+    # Re-encode the combined body only when one of the lists changed
+    entry = app.reference.get("")
+    if entry is None or entry["stamp"] != stamp:
+        current = sha256("".join(data["etag"] for data in lists.values()).encode()).hexdigest()[:16]
+        body = {"version": current, **{name: data["items"] for name, data in lists.items()}}
+        entry = {"stamp": stamp, "version": current, "etag": f'"{current}"', "body": JSONResponse(body).body}
+        app.reference[""] = entry
+    if version == entry["version"]:
+        cache_control = f"public, max-age={REFERENCE_IMMUTABLE_MAX_AGE}, immutable"
+    else:
+        cache_control = f"public, max-age={REFERENCE_MAX_AGE}"
+    return reference_response(entry["etag"], if_none_match, entry["body"], cache_control)
+
+# Function: dispatch
+# Desc:    Runs a sub-request through the app's routes in-process, exactly as if it had been sent on its own.
+# Input:   item (BatchItem): The sub-request.
+# Output:  tuple[int, dict[str, str], bytes]: The response status, headers and body.
+async def dispatch(item):
+    path, _, query = item.path.lstrip("/").partition("?")
+    body = json.dumps(item.body).encode() if item.body is not None else b""
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    headers += [(name.lower().encode(), value.encode()) for name, value in item.headers.items()]
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": item.method.upper(),
+        "scheme": "http",
+        "path": unquote(f"/{path}"),
+        "raw_path": f"/{path}".encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": headers,
+        "client": None,
+        "server": None,
+    }
+    response = {"status": 500, "headers": {}, "body": b""}
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = {name.decode(): value.decode() for name, value in message.get("headers", [])}
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
     try:
-        with open("schools.json", "r") as f:
-            schools = json.load(f)
-    except (FileNotFoundError, json.decoder.JSONDecodeError):
-        schools = []
-    
-    return {"schools": schools}
+        await app(scope, receive, send)
+    except Exception:
+        # The error response has already been sent; don't fail the rest of the batch
+        pass
+    return response["status"], response["headers"], response["body"]
+
+# Function: batch
+# Desc:    Runs an ordered list of sub-requests in one round trip, each seeing the changes made by the ones
+#          before it. Sub-requests can't be batches themselves.
+# Input:   batch (Batch): The sub-requests.
+# Output:  JSON response with each sub-request's status, ETag (if any) and JSON body (None for a 304),
+#          in order, or an error message
+@app.post("/batch")
+async def batch(batch: Batch):
+    if len(batch.requests) > MAX_BATCH_SIZE:
+        return {"error": f"Batches are limited to {MAX_BATCH_SIZE} requests"}
+    results = []
+    for item in batch.requests:
+        if item.path.lstrip("/").partition("?")[0].rstrip("/") == "batch":
+            results.append({"status": 400, "etag": "", "body": {"error": "Batches can't be nested"}})
+            continue
+        status, headers, body = await dispatch(item)
+        try:
+            body = json.loads(body) if body else None
+        except json.decoder.JSONDecodeError:
+            body = {"error": body.decode(errors="replace")}
+        results.append({"status": status, "etag": headers.get("etag", ""), "body": body})
+    return {"results": results}
 
 # Function: not_found
 # Desc:    Handles requests to a non-existent route, returning a 404 error message.
@@ -522,6 +1815,25 @@ async def get_schools():
 @app.api_route("/404", methods=["GET", "POST"])
 async def not_found():
     return {"error": "404 Not Found"}
+
+# Endpoints that change data, which reader workers forward to the writer. Batches containing any of them
+# are forwarded whole (see batch_writes); other batches run on the reader.
+WRITE_ROUTES = {
+    ("POST", "/users/signup"),
+    ("POST", "/users/update"),
+    ("POST", "/users/{username}/events/create"),
+    ("POST", "/users/{username}/events/edit"),
+    ("GET", "/users/{username}/events/delete/{event_id}"),
+    ("GET", "/users/{username}/events/save/{event_id}"),
+    ("GET", "/users/{username}/events/unsave/{event_id}"),
+    ("POST", "/groups/create"),
+    ("POST", "/groups/{group_id}/leave"),
+    ("GET", "/groups/{group_id}/delete"),
+    ("POST", "/groups/{group_id}/join"),
+    ("GET", "/groups/{group_id}/events/delete/{event_id}"),
+}
+if WORKER_ROLE in REPLICA_ROLES:
+    app.add_middleware(ReplicaRequests)
             
 # 404 Redirecting was disabled so that user not found can be handled by the API
 # @app.exception_handler(404)
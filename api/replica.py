@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# File:     replica.py
+# Program:  trackademic
+# Desc:     Follows the journal written by the trackademic API's writer (or primary) process, so reader and
+#           standby processes can keep their in-memory copy of the users, groups and events up to date. The
+#           journal is the replicated log: every committed change is appended to it as a full document, so
+#           applying the records in order reproduces the writer's state.
+#
+# Author:   Brendan Liang
+# Created:  17-10-2026
+# Modified: 17-10-2026
+
+import json
+import os
+import storage
+# File locks are taken with fcntl on POSIX and msvcrt on Windows
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+# Class:    JournalTail
+# Desc:     Reads the records appended to a journal since the last read. Follows the writer's journal
+#           rotation (journal.log is renamed to journal.log.1 when a snapshot starts, and a fresh journal
+#           is created): the rotated file is read to its end before moving on to the new one. If the
+#           journal is truncated in place, the records read so far can no longer be trusted and the
+#           reader has to reload from the snapshot.
+# Properties:
+#   - journal_file (str): Path to the journal.
+#   - files (list[TextIO]): Journals still being read, oldest first; the last is the current journal.
+#   - inode (int | None): Inode of the current journal, to detect rotation.
+#   - partial (str): An incomplete last line, completed by the next read.
+#   - records (int): Number of records read since the journal was opened.
+class JournalTail:
+    def __init__(self, journal_file:str=storage.JOURNAL_FILE):
+        self.journal_file = journal_file
+        self.files = []
+        self.inode = None
+        self.partial = ""
+        self.records = 0
+
+    # Method:  open
+    # Desc:    Opens the rotated and current journals. Call before reading the snapshot, so any records
+    #          written while it is read are still in the open files.
+    # Input:   None
+    # Output:  None
+    def open(self):
+        self.close()
+        rotated = f"{self.journal_file}.1"
+        if os.path.exists(rotated):
+            self.files.append(open(rotated, "r"))
+        self.open_current()
+
+    # Method:  open_current
+    # Desc:    Opens the current journal, creating it if the writer hasn't yet.
+    # Input:   None
+    # Output:  None
+    def open_current(self):
+        current = open(self.journal_file, "a+")
+        current.seek(0)
+        self.files.append(current)
+        self.inode = os.fstat(current.fileno()).st_ino
+
+    # Method:  read
+    # Desc:    Returns the complete records appended since the last read.
+    # Input:   None
+    # Output:  tuple[list[dict], bool]: The records, oldest first, and whether the journal was truncated
+    #          (in which case the caller must reload everything).
+    def read(self):
+        records = []
+        while len(self.files) > 1:
+            # A rotated journal won't grow any more; finish it and move on
+            self.parse(self.files[0].read(), records)
+            self.partial = ""
+            self.files.pop(0).close()
+        if not self.files:
+            return records, False
+        current = self.files[0]
+        self.parse(current.read(), records)
+        try:
+            status = os.stat(self.journal_file)
+        except FileNotFoundError:
+            return records, False
+        if status.st_ino != self.inode:
+            # Rotated: whatever the writer appended before renaming it is still readable through our handle
+            self.parse(current.read(), records)
+            self.partial = ""
+            current.close()
+            self.files = []
+            self.open_current()
+            self.parse(self.files[0].read(), records)
+        elif status.st_size < current.tell():
+            return records, True
+        return records, False
+
+    # Method:  parse
+    # Desc:    Parses the complete lines of some journal text, keeping any incomplete last line.
+    # Input:   text (str): The text read.
+    #          records (list[dict]): The list to append the records to.
+    # Output:  None
+    def parse(self, text:str, records:list):
+        if not text:
+            return
+        lines = (self.partial + text).split("\n")
+        self.partial = lines.pop()
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except json.decoder.JSONDecodeError:
+                continue
+            self.records += 1
+
+    # Method:  position
+    # Desc:    Returns how far into the current journal has been read, e.g. for measuring replication lag.
+    # Input:   None
+    # Output:  int: The offset of the next unread byte.
+    def position(self):
+        return self.files[-1].tell() - len(self.partial) if self.files else 0
+
+    # Method:  behind
+    # Desc:    Returns how many bytes have been written to the journal but not yet read.
+    # Input:   None
+    # Output:  int: The number of unread bytes.
+    def behind(self):
+        unread = len(self.partial)
+        for f in self.files:
+            unread += os.fstat(f.fileno()).st_size - f.tell()
+        try:
+            status = os.stat(self.journal_file)
+        except FileNotFoundError:
+            return unread
+        if status.st_ino != self.inode:
+            # Rotated since the last read, so the new journal hasn't been opened yet
+            unread += status.st_size
+        return unread
+
+    # Method:  close
+    # Desc:    Closes the open journals.
+    # Input:   None
+    # Output:  None
+    def close(self):
+        for f in self.files:
+            f.close()
+        self.files = []
+        self.partial = ""
+
+# Class:    WriterLock
+# Desc:     An exclusive lock on a file held by the writer (or primary) process for as long as it runs, so a
+#           second writer (e.g. from a misconfigured launch, or a standby promoted while the primary is still
+#           up) can't append to the same journal and corrupt it. The lock goes with the process, so it is
+#           released even if the writer crashes. Uses flock() where available, or a lock on the file's first
+#           byte on Windows.
+# Properties:
+#   - path (str): The lock file.
+#   - file (TextIO | None): The open lock file while the lock is held.
+class WriterLock:
+    def __init__(self, path:str):
+        self.path = path
+        self.file = None
+
+    # Method:  acquire
+    # Desc:    Takes the lock without waiting.
+    # Input:   None
+    # Output:  bool: Whether the lock was taken (False if another process holds it).
+    def acquire(self):
+        self.file = open(self.path, "a+")
+        try:
+            if fcntl:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            self.file.close()
+            self.file = None
+            return False
+        return True
+
+    # Method:  release
+    # Desc:    Releases the lock, if held.
+    # Input:   None
+    # Output:  None
+    def release(self):
+        if self.file:
+            if fcntl:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+            else:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+            self.file.close()
+            self.file = None
@@ -0,0 +1,1495 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# File:     storage.py
+# Program:  trackademic
+# Desc:     Persistence backends for the trackademic API (full JSON dumps, an append-only journal,
+#           SQLite tables and per-document shards), and the background flusher that writes them off
+#           the event loop. Events are stored once, keyed by ID; users and groups hold references to them.
+#           Run `python storage.py import sqlite|sharded [users.json] [groups.json] [events.json]` to import
+#           the JSON files into a SQLite database or shard directory.
+#
+# Author:   Brendan Liang
+# Created:  16-10-2026
+# Modified: 17-10-2026
+
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from urllib.parse import quote, unquote
+import asyncio
+import binary as binary_format
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import time
+
+# Constants
+USERS_FILE = "users.json"
+GROUPS_FILE = "groups.json"
+EVENTS_FILE = "events.json"
+# Records the digest of each file of the last JSON snapshot written, so a set torn by a crash is detected
+MANIFEST_FILE = "manifest.json"
+JOURNAL_FILE = "journal.log"
+DATABASE_FILE = "trackademic.db"
+SHARDS_DIRECTORY = "data"
+SHARD_WORKERS = 8
+# Format version of a shard directory; older directories are upgraded on load (see migrate)
+SHARDS_VERSION_FILE = "VERSION"
+SHARDS_VERSION = "3"
+# Approximate bytes of user (and, separately, event) documents LazyDocuments keeps resident
+USER_CACHE_BUDGET = 64 * 1024 * 1024
+# Number of journal records to collect before folding them into the snapshot
+COMPACT_EVERY = 1000
+# Bytes read at a time when looking for the end of a journal's last complete line
+REPAIR_BLOCK = 64 * 1024
+# Flusher defaults: seconds between flushes, and the dirty count that forces an early flush
+FLUSH_INTERVAL = 0.5
+FLUSH_THRESHOLD = 100
+
+# Function: read_json
+# Desc:    Reads a JSON file, creating it with a default value if it is missing or corrupt.
+# Input:   path (str): The file to read.
+#          default: The value to use (and write) if the file cannot be read.
+# Output:  The parsed JSON data.
+def read_json(path, default):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.decoder.JSONDecodeError):
+        write_json(path, default)
+        return default
+
+# Function: write_json
+# Desc:    Writes data to a JSON file via a temporary file and an atomic rename,
+#          so a crash mid-write never leaves a half-written file behind.
+# Input:   path (str): The file to write.
+#          data: The data to serialise.
+# Output:  None
+def write_json(path, data):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(data, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+# Function: write_json_set
+# Desc:    Replaces several JSON files as one generation. Each file is first written (and synced) next to
+#          its target as <path>.tmp; the manifest listing their digests is then atomically replaced, which
+#          commits the generation, and only then are the files renamed into place. A crash part way through
+#          the renames leaves the rest in their .tmp files, which recover_json_set moves into place.
+# Input:   manifest_path (str): The manifest file.
+#          texts (dict[str, str]): The serialised contents of each file, by path.
+# Output:  None
+def write_json_set(manifest_path, texts):
+    digests = {}
+    for path, text in texts.items():
+        data = text.encode()
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        digests[os.path.basename(path)] = sha256(data).hexdigest()
+    try:
+        with open(manifest_path, "r") as f:
+            generation = json.load(f).get("generation", 0) + 1
+    except (FileNotFoundError, json.decoder.JSONDecodeError):
+        generation = 1
+    write_json(manifest_path, {"generation": generation, "files": digests})
+    for path in texts:
+        os.replace(f"{path}.tmp", path)
+
+# Function: recover_json_set
+# Desc:    Completes the last generation written by write_json_set if a crash interrupted its renames: any
+#          file whose digest doesn't match the manifest is replaced by its .tmp copy, if that one matches.
+#          Does nothing for data written before manifests were kept.
+# Input:   manifest_path (str): The manifest file.
+#          paths (list[str]): The files of the set.
+# Output:  None
+def recover_json_set(manifest_path, paths):
+    try:
+        with open(manifest_path, "r") as f:
+            digests = json.load(f)["files"]
+    except (FileNotFoundError, json.decoder.JSONDecodeError, KeyError):
+        return
+    for path in paths:
+        expected = digests.get(os.path.basename(path))
+        if expected is None or file_digest(path) == expected:
+            continue
+        if file_digest(f"{path}.tmp") == expected:
+            os.replace(f"{path}.tmp", path)
+        else:
+            print(f"{path} doesn't match the last snapshot written")
+
+# Function: file_digest
+# Desc:    Returns the SHA-256 digest of a file's contents.
+# Input:   path (str): The file.
+# Output:  str | None: The hex digest, or None if the file doesn't exist.
+def file_digest(path):
+    try:
+        with open(path, "rb") as f:
+            return sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+# Class:    Snapshotter
+# Desc:     Writes snapshots from a forked child process, Redis BGSAVE style. The child gets a
+#           copy-on-write view of the parent's memory at the moment of the fork, so it can serialise
+#           a consistent snapshot while the parent keeps serving requests. Falls back to writing
+#           in-process on platforms without fork().
+# Properties:
+#   - pid (int | None): Process ID of the running snapshot child, if any.
+#   - pipe (int | None): Read end of the pipe the running child reports its duration through.
+#   - paths (list[str]): The files written by the running snapshot.
+#   - last_duration (float | None): Duration of the last successful snapshot in seconds.
+#   - last_bytes (int | None): Bytes written by the last successful snapshot.
+#   - last_success (float | None): Unix time the last successful snapshot finished.
+#   - last_status (str | None): "ok" or "failed" for the last finished snapshot.
+class Snapshotter:
+    def __init__(self):
+        self.pid = None
+        self.pipe = None
+        self.paths = []
+        self.on_success = None
+        self.last_duration = None
+        self.last_bytes = None
+        self.last_success = None
+        self.last_status = None
+
+    # Method:  running
+    # Desc:    Whether a snapshot child is still running. Reaps the child if it has finished.
+    # Input:   None
+    # Output:  bool: True if a snapshot is in progress.
+    def running(self):
+        if self.pid is None:
+            return False
+        pid, status = os.waitpid(self.pid, os.WNOHANG)
+        if pid == 0:
+            return True
+        self.collect(status)
+        return False
+
+    # Method:  wait
+    # Desc:    Blocks until the running snapshot child (if any) has finished.
+    # Input:   None
+    # Output:  None
+    def wait(self):
+        if self.pid is None:
+            return
+        _, status = os.waitpid(self.pid, 0)
+        self.collect(status)
+
+    # Method:  start
+    # Desc:    Starts a snapshot, forking a child that runs the write function and exits.
+    #          The child reports its write duration back through a pipe.
+    # Input:   write (Callable): Writes the snapshot files.
+    #          paths (list[str]): The files written, used to count bytes.
+    #          on_success (Callable): Called in the parent once the snapshot has succeeded.
+    #          fork (bool): Whether to fork; if False the files are written before returning.
+    # Output:  None
+    def start(self, write, paths, on_success=None, fork:bool=True):
+        self.paths = paths
+        self.on_success = on_success
+        if not fork or not hasattr(os, "fork"):
+            self.finish(True, self.timed(write))
+            return
+        self.pipe, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # Child: write the snapshot and exit without running any of the parent's cleanup
+            try:
+                os.close(self.pipe)
+                os.write(write_end, str(self.timed(write)).encode())
+                os._exit(0)
+            except BaseException:
+                os._exit(1)
+        os.close(write_end)
+        self.pid = pid
+
+    # Method:  timed
+    # Desc:    Runs a write function in-process and times it.
+    # Input:   write (Callable): Writes the snapshot files.
+    # Output:  float: The time taken in seconds.
+    def timed(self, write):
+        start = time.monotonic()
+        write()
+        return time.monotonic() - start
+
+    # Method:  collect
+    # Desc:    Reads the duration reported by a finished child and records its outcome.
+    # Input:   status (int): The child's wait status.
+    # Output:  None
+    def collect(self, status:int):
+        report = os.read(self.pipe, 64)
+        os.close(self.pipe)
+        success = os.waitstatus_to_exitcode(status) == 0 and report
+        self.finish(bool(success), float(report) if success else None)
+
+    # Method:  finish
+    # Desc:    Records the outcome of a snapshot.
+    # Input:   success (bool): Whether the snapshot succeeded.
+    #          duration (float | None): How long the snapshot took to write, in seconds.
+    # Output:  None
+    def finish(self, success:bool, duration:float=None):
+        self.pid = None
+        self.last_status = "ok" if success else "failed"
+        if success:
+            self.last_duration = duration
+            self.last_bytes = sum(os.path.getsize(path) for path in self.paths)
+            self.last_success = time.time()
+            if self.on_success:
+                self.on_success()
+
+    # Method:  stats
+    # Desc:    Returns the snapshot metrics.
+    # Input:   None
+    # Output:  dict: The snapshot metrics.
+    def stats(self):
+        return {
+            "in_progress": self.running(),
+            "last_status": self.last_status,
+            "last_duration": self.last_duration,
+            "last_bytes": self.last_bytes,
+            "last_success": self.last_success,
+        }
+
+# Class:    JSONStorage
+# Desc:     Stores all users, groups and events in users.json, groups.json and events.json, rewriting them
+#           on every commit. The three files are replaced as one generation (see write_json_set), so a crash
+#           never leaves users and groups referring to events from another generation. With fork enabled, the files are written by a forked Snapshotter child instead of
+#           the server. With binary enabled, they are written to a single binary snapshot file instead (see
+#           binary.py); the JSON files are still read if no binary snapshot exists yet.
+# Properties:
+#   - users_file (str): Path to the users file.
+#   - groups_file (str): Path to the groups file.
+#   - events_file (str): Path to the events file.
+#   - manifest_file (str): Path to the manifest of the last snapshot written.
+#   - fork (bool): Whether background snapshots are written from a forked child.
+#   - binary (bool): Whether snapshots use the binary format.
+#   - snapshot_file (str): Path to the binary snapshot.
+#   - snapshotter (Snapshotter): Runs and measures snapshots.
+#   - stale (bool): Whether a background snapshot is owed (e.g. because one was already running).
+class JSONStorage:
+    def __init__(self, users_file:str=USERS_FILE, groups_file:str=GROUPS_FILE, fork:bool=False, binary:bool=False, snapshot_file:str=binary_format.SNAPSHOT_FILE, events_file:str=EVENTS_FILE):
+        self.users_file = users_file
+        self.groups_file = groups_file
+        self.events_file = events_file
+        self.manifest_file = os.path.join(os.path.dirname(users_file), MANIFEST_FILE)
+        self.fork = fork
+        self.binary = binary
+        self.snapshot_file = snapshot_file
+        self.snapshotter = Snapshotter()
+        self.stale = False
+
+    # Method:  load
+    # Desc:    Loads all users, groups and events from disk, upgrading documents from before events were
+    #          stored separately. An upgrade is written back by the next snapshot.
+    # Input:   lazy_budget (int | None): Must be None; whole-file storage can't load users on demand.
+    # Output:  tuple[dict, dict, dict]: The users, groups and events dictionaries.
+    def load(self, lazy_budget:int=None):
+        users, groups, events = self.read(lazy_budget)
+        if migrate(users, groups, events):
+            self.stale = True
+        return users, groups, events
+
+    # Method:  read
+    # Desc:    Reads the latest snapshot, preferring the binary one if enabled and present.
+    # Input:   lazy_budget (int | None): Must be None; whole-file storage can't load users on demand.
+    # Output:  tuple[dict, dict, dict]: The users, groups and events dictionaries.
+    def read(self, lazy_budget:int=None):
+        if lazy_budget is not None:
+            raise ValueError("Lazy user loading needs sqlite or sharded storage")
+        if self.binary and os.path.exists(self.snapshot_file):
+            return binary_format.read_snapshot(self.snapshot_file)
+        recover_json_set(self.manifest_file, [self.users_file, self.groups_file, self.events_file])
+        users = read_json(self.users_file, {})
+        groups = read_json(self.groups_file, {})
+        events = read_json(self.events_file, {})
+        return users, groups, events
+
+    # Method:  encode
+    # Desc:    Serialises whatever needs to be written for a set of changes. In fork mode nothing is
+    #          serialised here; the next background snapshot writes everything.
+    # Input:   users (dict): All users.
+    #          groups (dict): All groups.
+    #          events (dict): All events.
+    #          changes (list[tuple[str, str]]): ("user" | "group" | "event", key) pairs that were modified.
+    # Output:  The payload to pass to write().
+    def encode(self, users, groups, events, changes):
+        if self.fork:
+            return None
+        if self.binary:
+            return binary_format.encode_snapshot(users, groups, events)
+        return self.encode_json(users, groups, events)
+
+    # Method:  encode_json
+    # Desc:    Serialises the users, groups and events files.
+    # Input:   users (dict): All users.
+    #          groups (dict): All groups.
+    #          events (dict): All events.
+    # Output:  tuple[str, str, str]: The contents of the users, groups and events files.
+    def encode_json(self, users, groups, events):
+        return json.dumps(users, indent=4), json.dumps(groups, indent=4), json.dumps(events, indent=4)
+
+    # Method:  write
+    # Desc:    Writes a payload produced by encode() to disk.
+    # Input:   payload: The encoded payload.
+    # Output:  None
+    def write(self, payload):
+        if payload is None:
+            self.stale = True
+            return
+        if self.binary:
+            binary_format.write_snapshot(self.snapshot_file, payload)
+            return
+        self.write_json_files(payload)
+
+    # Method:  write_json_files
+    # Desc:    Replaces the users, groups and events files as one generation.
+    # Input:   texts (tuple[str, str, str]): The contents of the users, groups and events files.
+    # Output:  None
+    def write_json_files(self, texts):
+        write_json_set(self.manifest_file, dict(zip((self.users_file, self.groups_file, self.events_file), texts)))
+
+    # Method:  commit
+    # Desc:    Persists a set of changes.
+    # Input:   users (dict): All users.
+    #          groups (dict): All groups.
+    #          events (dict): All events.
+    #          changes (list[tuple[str, str]]): ("user" | "group" | "event", key) pairs that were modified.
+    # Output:  None
+    def commit(self, users, groups, events, changes):
+        self.write(self.encode(users, groups, events, changes))
+        if self.needs_snapshot():
+            self.snapshot(users, groups, events, background=True)
+
+    # Method:  needs_snapshot
+    # Desc:    Whether the backend wants a snapshot after the last write.
+    # Input:   None
+    # Output:  bool: True if snapshot() should be called.
+    def needs_snapshot(self):
+        return self.stale
+
+    # Method:  snapshot
+    # Desc:    Writes the complete state to disk. Background snapshots are written by a forked child
+    #          when fork is enabled; if one is already running, another is owed once it finishes.
+    # Input:   users (dict): All users.
+    #          groups (dict): All groups.
+    #          events (dict): All events.
+    #          background (bool): Whether the caller may return before the snapshot is written.
+    # Output:  None
+    def snapshot(self, users, groups, events, background:bool=False):
+        write = lambda: self.write_snapshot(users, groups, events)
+        paths = [self.snapshot_file] if self.binary else [self.users_file, self.groups_file, self.events_file]
+        if background and self.fork:
+            if self.snapshotter.running():
+                self.stale = True
+                return
+            self.stale = False
+            self.before_snapshot()
+            self.snapshotter.start(write, paths, self.after_snapshot)
+            return
+        self.snapshotter.wait()
+        self.stale = False
+        self.before_snapshot()
+        self.snapshotter.start(write, paths, self.after_snapshot, fork=False)
+
+    # Method:  write_snapshot
+    # Desc:    Writes the complete state in the configured format.
+    # Input:   users (dict): All users.
+    #          groups (dict): All groups.
+    #          events (dict): All events.
+    # Output:  None
+    def write_snapshot(self, users, groups, events):
+        if self.binary:
+            binary_format.write_snapshot(self.snapshot_file, binary_format.encode_snapshot(users, groups, events))
+        else:
+            self.write_json_files(self.encode_json(users, groups, events))
+
+    # Method:  before_snapshot
+    # Desc:    Hook run just before a snapshot starts.
+    # Input:   None
+    # Output:  None
+    def before_snapshot(self):
+        pass
+
+    # Method:  after_snapshot
+    # Desc:    Hook run once a snapshot has been written successfully.
+    # Input:   None
+    # Output:  None
+    def after_snapshot(self):
+        pass
+
+    # Method:  durable
+    # Desc:    Whether every write so far is on disk. In fork mode that means no snapshot is owed or running.
+    # Input:   None
+    # Output:  bool: True if all writes are durable.
+    def durable(self):
+        return not self.fork or (not self.stale and not self.snapshotter.running())
+
+    # Method:  poll
+    # Desc:    Reaps a finished snapshot child, if any.
+    # Input:   None
+    # Output:  None
+    def poll(self):
+        self.snapshotter.running()
+
+    # Method:  stats
+    # Desc:    Returns the snapshot metrics.
+    # Input:   None
+    # Output:  dict: The snapshot metrics.
+    def stats(self):
+        return self.snapshotter.stats()
+
+    # Method:  close
+    # Desc:    Waits for any running snapshot and releases open files.
+    # Input:   None
+    # Output:  None
+    def close(self):
+        self.snapshotter.wait()
+
+# Class:    JournalStorage
+# Desc:     Appends one compact record per changed user/group/event to a journal, periodically folding
+#           the journal into the users.json/groups.json/events.json snapshot. The cost of a commit depends only
+#           on the size of the changed documents, not on the size of the dataset.
+#           When a snapshot starts, the journal is rotated to journal.log.1; it is only deleted once
+#           the snapshot has been written, so a failed snapshot loses nothing.
+# Properties:
+#   - journal_file (str): Path to the append-only journal.
+#   - compact_every (int): Number of records after which the journal is folded into the snapshot.
+#   - fsync (bool): Whether to fsync the journal after every commit.
+#   - records (int): Number of records currently in the journal.
+#   - feed (ChangeFeed | None): A change feed whose entries (and the batch's commit time) are journaled
+#     after each batch of documents, so processes replicating the journal can follow it (see replica.py).
+class JournalStorage(JSONStorage):
+    def __init__(self, users_file:str=USERS_FILE, groups_file:str=GROUPS_FILE, journal_file:str=JOURNAL_FILE, compact_every:int=COMPACT_EVERY, fsync:bool=True, fork:bool=False, binary:bool=False, events_file:str=EVENTS_FILE):
+        super().__init__(users_file, groups_file, fork, binary, events_file=events_file)
+        self.journal_file = journal_file
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.records = 0
+        self.journal = None
+        self.feed = None
+
+    # Method:  load
+    # Desc:    Loads the snapshot and replays the rotated and current journals on top of it, then
+    #          upgrades documents from before events were stored separately. A torn final line from a crash
+    #          mid-append is truncated before the journal is reopened for appending.
+    # Input:   lazy_budget (int | None): Must be None; whole-file storage can't load users on demand.
+    # Output:  tuple[dict, dict, dict]: The users, groups and events dictionaries.
+    def load(self, lazy_budget:int=None):
+        users, groups, events = self.read(lazy_budget)
+        # Drop any torn line left by a crash, so the next record isn't glued onto it
+        repair(f"{self.journal_file}.1")
+        repair(self.journal_file)
+        self.records = replay(f"{self.journal_file}.1", users, groups, events)
+        self.records += replay(self.journal_file, users, groups, events)
+        self.journal = open(self.journal_file, "a")
+        if migrate(users, groups, events):
+            self.stale = True
+        return users, groups, events
+
+    # Method:  encode
+    # Desc:    Serialises one journal line per changed user/group/event, followed by the change feed entries
+    #          recorded since the last batch and the time the batch's oldest change was committed (if the feed
+    #          is journaled, for replicas). Deleted entities are recorded with null data.
+    # Input:   users (dict): All users.
+    #          groups (dict): All groups.
+    #          events (dict): All events.
+    #          changes (list[tuple[str, str]]): ("user" | "group" | "event", key) pairs that were modified.
+    # Output:  str: The journal lines to append.
+    def encode(self, users, groups, events, changes):
+        lines = []
+        sources = {"user": users, "group": groups, "event": events}
+        for kind, key in dict.fromkeys(changes):
+            record = {"type": kind, "key": key, "data": sources[kind].get(key)}
+            lines.append(json.dumps(record, separators=(",", ":")) + "\n")
+        # The documents come first, so a replica never sees a change before the data it refers to
+        if self.feed is not None:
+            committed = self.feed.drain_since() or time.time()
+            for username, version, kind, key in self.feed.drain():
+                record = {"type": "feed", "key": username, "data": [version, kind, key]}
+                lines.append(json.dumps(record, separators=(",", ":")) + "\n")
+            lines.append(json.dumps({"type": "commit", "key": "", "data": committed}, separators=(",", ":")) + "\n")
+        return "".join(lines)
+
+    # Method:  write_epoch
+    # Desc:    Appends the change feed's epoch and versions, so replicas that start reading from here can
+    #          take on the feed (see ChangeFeed.adopt). Does nothing if the feed isn't journaled.
+    # Input:   None
+    # Output:  None
+    def write_epoch(self):
+        if self.feed is None:
+            return
+        record = {"type": "epoch", "key": self.feed.epoch, "data": self.feed.journaled()}
+        self.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    # Method:  write
+    # Desc:    Appends encoded records to the journal.
+    # Input:   payload (str): The journal lines to append.
+    # Output:  None
+    def write(self, payload):
+        if not payload:
+            return
+        self.journal.write(payload)
+        self.journal.flush()
+        if self.fsync:
+            os.fsync(self.journal.fileno())
+        self.records += payload.count("\n")
+
+    # Method:  resume
+    # Desc:    Takes over the journal from the process that was writing it (when a standby that has applied
+    #          all of it is promoted), dropping a torn final line and opening the journal for appending.
+    # Input:   None
+    # Output:  None
+    def resume(self):
+        self.records = 0
+        for path in (f"{self.journal_file}.1", self.journal_file):
+            repair(path)
+            try:
+                with open(path, "rb") as f:
+                    self.records += f.read().count(b"\n")
+            except FileNotFoundError:
+                pass
+        self.journal = open(self.journal_file, "a")
+
+    # Method:  needs_snapshot
+    # Desc:    Whether the journal has grown long enough to be folded into the snapshot.
+    # Input:   None
+    # Output:  bool: True if snapshot() should be called.
+    def needs_snapshot(self):
+        return self.stale or self.records >= self.compact_every
+
+    # Method:  durable
+    # Desc:    Journal appends are durable as soon as they are written.
+    # Input:   None
+    # Output:  bool: Always True.
+    def durable(self):
+        return True
+
+    # Method:  before_snapshot
+    # Desc:    Rotates the journal so records written during a snapshot go to a fresh file, which starts
+    #          with the change feed's epoch for replicas. If an earlier snapshot failed, the current journal
+    #          is appended to the rotated one instead.
+    # Input:   None
+    # Output:  None
+    def before_snapshot(self):
+        if self.journal:
+            self.journal.close()
+        rotated = f"{self.journal_file}.1"
+        if os.path.exists(rotated):
+            with open(rotated, "a") as target, open(self.journal_file, "r") as source:
+                target.write(source.read())
+                target.flush()
+                os.fsync(target.fileno())
+        elif os.path.exists(self.journal_file):
+            os.replace(self.journal_file, rotated)
+        self.journal = open(self.journal_file, "w")
+        self.records = 0
+        self.write_epoch()
+
+    # Method:  after_snapshot
+    # Desc:    Deletes the rotated journal now that the snapshot includes it.
+    # Input:   None
+    # Output:  None
+    def after_snapshot(self):
+        try:
+            os.remove(f"{self.journal_file}.1")
+        except FileNotFoundError:
+            pass
+
+    # Method:  close
+    # Desc:    Waits for any running snapshot and closes the journal file.
+    # Input:   None
+    # Output:  None
+    def close(self):
+        super().close()
+        if self.journal:
+            self.journal.close()
+            self.journal = None
+
+# Class:    SQLiteStorage
+# Desc:     Stores users, groups, memberships and events in indexed SQLite tables. A commit only rewrites
+#           the rows belonging to the changed users/groups/events. Fields without a column of their own
+#           (including the event references held by users and groups) are kept in each row's extra JSON
+#           column, so new document fields don't need a schema change.
+# Properties:
+#   - database_file (str): Path to the SQLite database.
+#   - connection (sqlite3.Connection): The open database connection.
+class SQLiteStorage:
+    USER_COLUMNS = ("username", "display_name", "password_hash", "school")
+    GROUP_COLUMNS = ("id", "name", "description", "school", "colour", "owner")
+    EVENT_COLUMNS = ("id", "owner", "group_id", "date")
+
+    def __init__(self, database_file:str=DATABASE_FILE):
+        self.database_file = database_file
+        self.connection = None
+
+    # Method:  connect
+    # Desc:    Opens the database, creating the tables and indexes if needed. An events table from before
+    #          events were stored once (one row per holder) is set aside as legacy_events for load() to upgrade.
+    # Input:   None
+    # Output:  None
+    def connect(self):
+        if self.connection:
+            return
+        self.connection = sqlite3.connect(self.database_file, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(events)")]
+        if "holder_type" in columns:
+            self.connection.executescript("""
+                DROP INDEX IF EXISTS events_owner_date;
+                DROP INDEX IF EXISTS events_group_date;
+                ALTER TABLE events RENAME TO legacy_events;
+            """)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS users (
+                username TEXT PRIMARY KEY, display_name TEXT, password_hash TEXT, school TEXT, extra TEXT
+            );
+            CREATE TABLE IF NOT EXISTS groups (
+                id TEXT PRIMARY KEY, name TEXT, description TEXT, school TEXT, colour TEXT, owner TEXT, extra TEXT
+            );
+            CREATE TABLE IF NOT EXISTS memberships (
+                group_id TEXT, username TEXT, position INTEGER, PRIMARY KEY (group_id, username)
+            );
+            CREATE TABLE IF NOT EXISTS user_groups (
+                username TEXT, group_id TEXT, PRIMARY KEY (username, group_id)
+            );
+            CREATE TABLE IF NOT EXISTS events (
+                id TEXT PRIMARY KEY, owner TEXT, group_id TEXT, date TEXT, data TEXT
+            );
+            CREATE INDEX IF NOT EXISTS users_school ON users (school);
+            CREATE INDEX IF NOT EXISTS groups_school ON groups (school);
+            CREATE INDEX IF NOT EXISTS memberships_username ON memberships (username);
+            CREATE INDEX IF NOT EXISTS events_owner_date ON events (owner, date);
+            CREATE INDEX IF NOT EXISTS events_group_date ON events (group_id, date);
+        """)
+
+    # Method:  clear
+    # Desc:    Deletes every row.
+    # Input:   None
+    # Output:  None
+    def clear(self):
+        self.connect()
+        with self.connection:
+            for table in ("users", "groups", "memberships", "user_groups", "events"):
+                self.connection.execute(f"DELETE FROM {table}")
+            self.connection.execute("DROP TABLE IF EXISTS legacy_events")
+
+    # Method:  load
+    # Desc:    Loads all groups from the database, plus either all users and events or lazy views of them.
+    # Input:   lazy_budget (int | None): If set, users and events are loaded on demand by LazyDocuments with this byte budget each.
+    # Output:  tuple[dict | LazyDocuments, dict, dict | LazyDocuments]: The users, groups and events.
+    def load(self, lazy_budget:int=None):
+        self.connect()
+        if self.connection.execute("SELECT name FROM sqlite_master WHERE name = 'legacy_events'").fetchone():
+            self.upgrade()
+        groups = self.load_groups()
+        if lazy_budget is not None:
+            return LazyDocuments(self, "user", lazy_budget), groups, LazyDocuments(self, "event", lazy_budget)
+
+        users = self.load_users()
+        events = {}
+        for event_id, data in self.connection.execute("SELECT id, data FROM events"):
+            events[event_id] = json.loads(data)
+        return users, groups, events
+
+    # Method:  load_groups
+    # Desc:    Loads every group with its members.
+    # Input:   None
+    # Output:  dict: The groups.
+    def load_groups(self):
+        groups = {}
+        for row in self.connection.execute("SELECT id, name, description, school, colour, owner, extra FROM groups"):
+            group = dict(zip(self.GROUP_COLUMNS, row[:6]))
+            group.update(json.loads(row[6] or "{}"))
+            group["members"] = {}
+            group.setdefault("events", {})
+            groups[group["id"]] = group
+        for group_id, username in self.connection.execute("SELECT group_id, username FROM memberships ORDER BY group_id, position"):
+            if group_id in groups:
+                groups[group_id]["members"][username] = True
+        for group in groups.values():
+            group["member_count"] = len(group["members"])
+        return groups
+
+    # Method:  load_users
+    # Desc:    Loads every user with their groups.
+    # Input:   None
+    # Output:  dict: The users.
+    def load_users(self):
+        users = {}
+        for row in self.connection.execute("SELECT username, display_name, password_hash, school, extra FROM users"):
+            user = self.user_from_row(row)
+            users[user["username"]] = user
+        for username, group_id in self.connection.execute("SELECT username, group_id FROM user_groups"):
+            if username in users:
+                users[username]["groups"][group_id] = True
+        return users
+
+    # Method:  upgrade
+    # Desc:    Moves the events in legacy_events (a copy per user/group holding them) into the events table,
+    #          rewriting users and groups to reference them, then drops legacy_events.
+    # Input:   None
+    # Output:  None
+    def upgrade(self):
+        users = self.load_users()
+        groups = self.load_groups()
+        for holder_type, holder, event_id, data in self.connection.execute("SELECT holder_type, holder, id, data FROM legacy_events"):
+            holders = users if holder_type == "user" else groups
+            if holder in holders:
+                holders[holder]["events"][event_id] = json.loads(data)
+        events = {}
+        migrate(users, groups, events)
+        changes = [("user", key) for key in users] + [("group", key) for key in groups] + [("event", key) for key in events]
+        self.write(self.encode(users, groups, events, changes))
+        with self.connection:
+            self.connection.execute("DROP TABLE legacy_events")
+
+    # Method:  user_from_row
+    # Desc:    Builds a user document (without groups) from a users row.
+    # Input:   row (tuple): The username, display_name, password_hash, school and extra columns.
+    # Output:  dict: The user document.
+    def user_from_row(self, row):
+        user = dict(zip(self.USER_COLUMNS, row[:4]))
+        user.update(json.loads(row[4] or "{}"))
+        user["groups"] = {}
+        user.setdefault("events", {})
+        return user
+
+    # Method:  keys
+    # Desc:    Lists every username or event ID without loading any documents.
+    # Input:   kind (str): "user" or "event".
+    # Output:  list[str]: The keys.
+    def keys(self, kind:str):
+        self.connect()
+        query = "SELECT username FROM users" if kind == "user" else "SELECT id FROM events"
+        return [row[0] for row in self.connection.execute(query)]
+
+    # Method:  load_document
+    # Desc:    Loads one user's or event's rows.
+    # Input:   kind (str): "user" or "event".
+    #          key (str): The username or event ID.
+    # Output:  tuple[dict | None, int]: The document (None if missing) and its approximate size in bytes.
+    def load_document(self, kind:str, key:str):
+        if kind == "event":
+            row = self.connection.execute("SELECT data FROM events WHERE id = ?", (key,)).fetchone()
+            return (json.loads(row[0]), len(row[0])) if row else (None, 0)
+        row = self.connection.execute("SELECT username, display_name, password_hash, school, extra FROM users WHERE username = ?", (key,)).fetchone()
+        if not row:
+            return None, 0
+        user = self.user_from_row(row)
+        size = sum(len(str(value or "")) for value in row)
+        for (group_id,) in self.connection.execute("SELECT group_id FROM user_groups WHERE username = ?", (key,)):
+            user["groups"][group_id] = True
+            size += len(group_id)
+        return user, size
+
+    # Method:  encode
+    # Desc:    Converts each changed user/group/event into the rows that replace its old ones.
+    # Input:   users (dict): All users.
+    #          groups (dict): All groups.
+    #          events (dict): All events.
+    #          changes (list[tuple[str, str]]): ("user" | "group" | "event", key) pairs that were modified.
+    # Output:  list[tuple[str, str, dict | None]]: (kind, key, rows) for each change; rows is None for deletions.
+    def encode(self, users, groups, events, changes):
+        payload = []
+        sources = {"user": users, "group": groups, "event": events}
+        for kind, key in dict.fromkeys(changes):
+            document = sources[kind].get(key)
+            if document is None:
+                payload.append((kind, key, None))
+                continue
+            if kind == "event":
+                payload.append((kind, key, {"entity": tuple(document.get(column) for column in self.EVENT_COLUMNS) + (json.dumps(document),)}))
+                continue
+            columns = self.USER_COLUMNS if kind == "user" else self.GROUP_COLUMNS
+            skip = set(columns) | {"groups", "members"}
+            extra = {field: value for field, value in document.items() if field not in skip}
+            rows = {"entity": tuple(document.get(column) for column in columns) + (json.dumps(extra),)}
+            if kind == "user":
+                rows["links"] = [(key, group_id) for group_id in document.get("groups", {})]
+            else:
+                rows["links"] = [(key, username, position) for position, username in enumerate(document.get("members", []))]
+            payload.append((kind, key, rows))
+        return payload
+
+    # Method:  write
+    # Desc:    Replaces the rows of each changed user/group/event in a single transaction.
+    # Input:   payload (list): The rows produced by encode().
+    # Output:  None
+    def write(self, payload):
+        self.connect()
+        with self.connection:
+            for kind, key, rows in payload:
+                if kind == "user":
+                    self.connection.execute("DELETE FROM users WHERE username = ?", (key,))
+                    self.connection.execute("DELETE FROM user_groups WHERE username = ?", (key,))
+                elif kind == "group":
+                    self.connection.execute("DELETE FROM groups WHERE id = ?", (key,))
+                    self.connection.execute("DELETE FROM memberships WHERE group_id = ?", (key,))
+                else:
+                    self.connection.execute("DELETE FROM events WHERE id = ?", (key,))
+                if rows is None:
+                    continue
+                if kind == "user":
+                    self.connection.execute("INSERT INTO users VALUES (?, ?, ?, ?, ?)", rows["entity"])
+                    self.connection.executemany("INSERT INTO user_groups VALUES (?, ?)", rows["links"])
+                elif kind == "group":
+                    self.connection.execute("INSERT INTO groups VALUES (?, ?, ?, ?, ?, ?, ?)", rows["entity"])
+                    self.connection.executemany("INSERT OR IGNORE INTO memberships VALUES (?, ?, ?)", rows["links"])
+                else:
+                    self.connection.execute("INSERT INTO events VALUES (?, ?, ?, ?, ?)", rows["entity"])
+
+    # Method:  commit
+    # Desc:    Persists a set of changes.
+    # Input:   users (dict): All users.
+    #          groups (dict): All groups.
+    #          events (dict): All events.
+    #          changes (list[tuple[str, str]]): ("user" | "group" | "event", key) pairs that were modified.
+    # Output:  None
+    def commit(self, users, groups, events, changes):
+        self.write(self.encode(users, groups, events, changes))
+
+    # Method:  needs_snapshot
+    # Desc:    The database never needs a full snapshot.
+    # Input:   None
+    # Output:  bool: Always False.
+    def needs_snapshot(self):
+        return False
+
+    # Method:  snapshot
+    # Desc:    Does nothing; every commit is already in the database.
+    # Input:   users (dict): All users.
+    #          groups (dict): All groups.
+    #          events (dict): All events.
+    #          background (bool): Unused.
+    # Output:  None
+    def snapshot(self, users, groups, events, background:bool=False):
+        pass
+
+    # Method:  durable
+    # Desc:    Database writes are durable as soon as they are committed.
+    # Input:   None
+    # Output:  bool: Always True.
+    def durable(self):
+        return True
+
+    # Method:  poll
+    # Desc:    Does nothing; the database has no background snapshots.
+    # Input:   None
+    # Output:  None
+    def poll(self):
+        pass
+
+    # Method:  stats
+    # Desc:    Returns the snapshot metrics, which are always empty for the database.
+    # Input:   None
+    # Output:  dict: The snapshot metrics.
+    def stats(self):
+        return Snapshotter().stats()
+
+    # Method:  close
+    # Desc:    Closes the database connection.
+    # Input:   None
+    # Output:  None
+    def close(self):
+        if self.connection:
+            self.connection.close()
+            self.connection = None
+
+# Class:    ShardedStorage
+# Desc:     Stores every user, group and event in its own JSON file, so a commit only rewrites the changed
+#           documents. Files are spread over 256 subdirectories by a hash of their key, and startup
+#           loads the subdirectories in parallel. A VERSION file marks directories that already store
+#           events separately; older directories are upgraded on first load.
+# Properties:
+#   - directory (str): Root directory of the shards.
+#   - workers (int): Number of threads used to load shards at startup.
+class ShardedStorage:
+    def __init__(self, directory:str=SHARDS_DIRECTORY, workers:int=SHARD_WORKERS):
+        self.directory = directory
+        self.workers = workers
+
+    # Method:  path
+    # Desc:    Returns the file a user, group or event is stored in.
+    # Input:   kind (str): "user", "group" or "event".
+    #          key (str): The username, group ID or event ID.
+    # Output:  str: The path of the shard file.
+    def path(self, kind:str, key:str):
+        bucket = sha256(key.encode()).hexdigest()[:2]
+        return os.path.join(self.directory, f"{kind}s", bucket, quote(key, safe="") + ".json")
+
+    # Method:  load_bucket
+    # Desc:    Loads every document in one bucket directory.
+    # Input:   bucket (str): Path of the bucket directory.
+    # Output:  dict: The documents in the bucket, keyed by username, group ID or event ID.
+    def load_bucket(self, bucket:str):
+        documents = {}
+        for entry in os.scandir(bucket):
+            if not entry.name.endswith(".json"):
+                continue
+            with open(entry.path, "r") as f:
+                documents[unquote(entry.name[:-5])] = json.load(f)
+        return documents
+
+    # Method:  load
+    # Desc:    Loads all groups, plus either all users and events or lazy views of them, reading the
+    #          bucket directories in parallel.
+    # Input:   lazy_budget (int | None): If set, users and events are loaded on demand by LazyDocuments with this byte budget each.
+    # Output:  tuple[dict | LazyDocuments, dict, dict | LazyDocuments]: The users, groups and events.
+    def load(self, lazy_budget:int=None):
+        version_file = os.path.join(self.directory, SHARDS_VERSION_FILE)
+        try:
+            with open(version_file, "r") as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            version = ""
+        if version != SHARDS_VERSION:
+            self.upgrade()
+        results = {}
+        kinds = ("groups",) if lazy_budget is not None else ("users", "groups", "events")
+        with ThreadPoolExecutor(self.workers) as executor:
+            for kind in kinds:
+                documents = {}
+                for bucket in executor.map(self.load_bucket, self.buckets(kind)):
+                    documents.update(bucket)
+                results[kind] = documents
+        if lazy_budget is not None:
+            return LazyDocuments(self, "user", lazy_budget), results["groups"], LazyDocuments(self, "event", lazy_budget)
+        return results["users"], results["groups"], results["events"]
+
+    # Method:  upgrade
+    # Desc:    Upgrades shards written by an older version (see migrate), e.g. moving the event copies held
+    #          in user and group shards into event shards of their own, then writes the VERSION file.
+    # Input:   None
+    # Output:  None
+    def upgrade(self):
+        documents = {}
+        for kind in ("users", "groups"):
+            documents[kind] = {}
+            for bucket in self.buckets(kind):
+                documents[kind].update(self.load_bucket(bucket))
+        users, groups, events = documents["users"], documents["groups"], {}
+        if migrate(users, groups, events):
+            changes = [("user", key) for key in users] + [("group", key) for key in groups] + [("event", key) for key in events]
+            self.commit(users, groups, events, changes)
+        with open(os.path.join(self.directory, SHARDS_VERSION_FILE), "w") as f:
+            f.write(SHARDS_VERSION)
+
+    # Method:  buckets
+    # Desc:    Lists the bucket directories of users, groups or events.
+    # Input:   kind (str): "users", "groups" or "events".
+    # Output:  list[str]: Paths of the bucket directories.
+    def buckets(self, kind:str):
+        root = os.path.join(self.directory, kind)
+        os.makedirs(root, exist_ok=True)
+        return [entry.path for entry in os.scandir(root) if entry.is_dir()]
+
+    # Method:  keys
+    # Desc:    Lists every username or event ID from the shard file names, without reading any of the files.
+    # Input:   kind (str): "user" or "event".
+    # Output:  list[str]: The keys.
+    def keys(self, kind:str):
+        return [unquote(entry.name[:-5]) for bucket in self.buckets(f"{kind}s") for entry in os.scandir(bucket) if entry.name.endswith(".json")]
+
+    # Method:  load_document
+    # Desc:    Loads one user's or event's shard file.
+    # Input:   kind (str): "user" or "event".
+    #          key (str): The username or event ID.
+    # Output:  tuple[dict | None, int]: The document (None if missing) and its size in bytes.
+    def load_document(self, kind:str, key:str):
+        try:
+            with open(self.path(kind, key), "r") as f:
+                text = f.read()
+        except FileNotFoundError:
+            return None, 0
+        return json.loads(text), len(text)
+
+    # Method:  encode
+    # Desc:    Serialises each changed user/group/event into the contents of its shard file.
+    # Input:   users (dict): All users.
+    #          groups (dict): All groups.
+    #          events (dict): All events.
+    #          changes (list[tuple[str, str]]): ("user" | "group" | "event", key) pairs that were modified.
+    # Output:  list[tuple[str, str | None]]: (path, text) pairs; text is None for deletions.
+    def encode(self, users, groups, events, changes):
+        payload = []
+        sources = {"user": users, "group": groups, "event": events}
+        for kind, key in dict.fromkeys(changes):
+            document = sources[kind].get(key)
+            text = None if document is None else json.dumps(document, indent=4)
+            payload.append((self.path(kind, key), text))
+        return payload
+
+    # Method:  write
+    # Desc:    Writes (or deletes) each changed shard file atomically.
+    # Input:   payload (list[tuple[str, str | None]]): The shard files produced by encode().
+    # Output:  None
+    def write(self, payload):
+        for path, text in payload:
+            if text is None:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.tmp"
+            with open(temp_path, "w") as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, path)
+
+    # Method:  commit
+    # Desc:    Persists a set of changes.
+    # Input:   users (dict): All users.
+    #          groups (dict): All groups.
+    #          events (dict): All events.
+    #          changes (list[tuple[str, str]]): ("user" | "group" | "event", key) pairs that were modified.
+    # Output:  None
+    def commit(self, users, groups, events, changes):
+        self.write(self.encode(users, groups, events, changes))
+
+    # Method:  clear
+    # Desc:    Deletes every shard, leaving an empty directory in the current format.
+    # Input:   None
+    # Output:  None
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory)
+        with open(os.path.join(self.directory, SHARDS_VERSION_FILE), "w") as f:
+            f.write(SHARDS_VERSION)
+
+    # Method:  needs_snapshot
+    # Desc:    Shards never need a full snapshot.
+    # Input:   None
+    # Output:  bool: Always False.
+    def needs_snapshot(self):
+        return False
+
+    # Method:  snapshot
+    # Desc:    Does nothing; every commit is already in its shard.
+    # Input:   users (dict): All users.
+    #          groups (dict): All groups.
+    #          events (dict): All events.
+    #          background (bool): Unused.
+    # Output:  None
+    def snapshot(self, users, groups, events, background:bool=False):
+        pass
+
+    # Method:  durable
+    # Desc:    Shard writes are durable as soon as they are written.
+    # Input:   None
+    # Output:  bool: Always True.
+    def durable(self):
+        return True
+
+    # Method:  poll
+    # Desc:    Does nothing; shards have no background snapshots.
+    # Input:   None
+    # Output:  None
+    def poll(self):
+        pass
+
+    # Method:  stats
+    # Desc:    Returns the snapshot metrics, which are always empty for shards.
+    # Input:   None
+    # Output:  dict: The snapshot metrics.
+    def stats(self):
+        return Snapshotter().stats()
+
+    # Method:  close
+    # Desc:    Does nothing; no files are held open.
+    # Input:   None
+    # Output:  None
+    def close(self):
+        pass
+
+# Class:    LazyDocuments
+# Desc:     Dictionary-like view of all users (or all events) that only keeps a compact index of keys in
+#           memory. Full documents are loaded from the backend on first access and kept in an LRU cache;
+#           once the cache exceeds its byte budget, the least recently used clean documents are
+#           evicted after each flush.
+# Properties:
+#   - backend (SQLiteStorage | ShardedStorage): The backend to load documents from.
+#   - kind (str): "user" or "event".
+#   - budget (int): Approximate number of bytes of documents to keep resident.
+#   - index (set[str]): Keys of every document.
+#   - cache (OrderedDict[str, dict]): Resident documents, least recently used first.
+#   - sizes (dict[str, int]): Approximate size of each resident document.
+#   - resident_bytes (int): Approximate size of all resident documents.
+class LazyDocuments(MutableMapping):
+    def __init__(self, backend, kind:str="user", budget:int=USER_CACHE_BUDGET):
+        self.backend = backend
+        self.kind = kind
+        self.budget = budget
+        self.index = set(backend.keys(kind))
+        self.cache = OrderedDict()
+        self.sizes = {}
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __getitem__(self, key):
+        if key not in self.index:
+            raise KeyError(key)
+        if key in self.cache:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        self.misses += 1
+        document, size = self.backend.load_document(self.kind, key)
+        if document is None:
+            self.index.discard(key)
+            raise KeyError(key)
+        self.cache[key] = document
+        self.sizes[key] = size
+        self.resident_bytes += size
+        return document
+
+    def __setitem__(self, key, document):
+        self.index.add(key)
+        if key not in self.cache:
+            # Estimate from the previous size, or the size of a typical resident document
+            size = self.resident_bytes // len(self.cache) if self.cache else 1024
+            self.sizes[key] = size
+            self.resident_bytes += size
+        self.cache[key] = document
+        self.cache.move_to_end(key)
+
+    def __delitem__(self, key):
+        if key not in self.index:
+            raise KeyError(key)
+        self.index.discard(key)
+        self.cache.pop(key, None)
+        self.resident_bytes -= self.sizes.pop(key, 0)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    # Method:  scan
+    # Desc:    Yields every document, e.g. to build an index, without caching those that aren't resident.
+    #          Resident documents are yielded from the cache, as they may not have been flushed yet (dirty
+    #          documents are never evicted, so the backend's copy of the others is current).
+    # Input:   None
+    # Output:  Iterator[tuple[str, dict]]: (key, document) pairs.
+    def scan(self):
+        for key in list(self.index):
+            document = self.cache.get(key)
+            if document is None:
+                document, _ = self.backend.load_document(self.kind, key)
+            if document is not None:
+                yield key, document
+
+    # Method:  trim
+    # Desc:    Evicts least recently used documents until the cache fits its budget.
+    # Input:   keep (Collection[tuple[str, str]]): Dirty ("user" | "group" | "event", key) pairs that must stay resident.
+    # Output:  None
+    def trim(self, keep=()):
+        for key in list(self.cache):
+            if self.resident_bytes <= self.budget:
+                break
+            if (self.kind, key) in keep:
+                continue
+            del self.cache[key]
+            self.resident_bytes -= self.sizes.pop(key, 0)
+
+    # Method:  stats
+    # Desc:    Returns cache metrics.
+    # Input:   None
+    # Output:  dict: The cache metrics.
+    def stats(self):
+        return {
+            f"{self.kind}s": len(self.index),
+            "resident": len(self.cache),
+            "resident_bytes": self.resident_bytes,
+            "budget": self.budget,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+# Class:    Flusher
+# Desc:     Collects changed users/groups/events from request handlers and writes them in batches from a
+#           background task, so handlers never block on disk. Changes are flushed every interval, or
+#           sooner once threshold entities are dirty. With "flush" durability, mark() flushes as soon as
+#           possible and only returns once the batch containing the change is on disk; with "immediate", it
+#           returns straight away.
+# Properties:
+#   - backend: The storage backend to write to.
+#   - users (dict): All users.
+#   - groups (dict): All groups.
+#   - events (dict): All events.
+#   - interval (float): Maximum number of seconds between flushes.
+#   - threshold (int): Number of dirty entities that triggers an early flush.
+#   - durability (str): "flush" (acknowledge after writing) or "immediate" (acknowledge straight away).
+#   - dirty (dict): Insertion-ordered set of dirty ("user" | "group" | "event", key) pairs.
+class Flusher:
+    def __init__(self, backend, users:dict, groups:dict, events:dict, interval:float=FLUSH_INTERVAL, threshold:int=FLUSH_THRESHOLD, durability:str="immediate"):
+        if durability not in ("flush", "immediate"):
+            raise ValueError(f"Unknown durability: {durability}")
+        self.backend = backend
+        self.users = users
+        self.groups = groups
+        self.events = events
+        self.interval = interval
+        self.threshold = threshold
+        self.durability = durability
+        self.dirty = {}
+        self.waiters = []
+        self.wake = asyncio.Event()
+        self.lock = asyncio.Lock()
+        self.task = None
+
+    # Method:  start
+    # Desc:    Starts the background flush task.
+    # Input:   None
+    # Output:  None
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    # Method:  stop
+    # Desc:    Stops the background task and forces a final flush.
+    # Input:   None
+    # Output:  None
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        await self.flush()
+
+    # Method:  mark
+    # Desc:    Marks users/groups/events as dirty, waiting for them to be written if durability is "flush".
+    #          A waiting request wakes the flusher straight away rather than waiting out the interval; the
+    #          changes marked while a batch is being written are grouped into the next one.
+    # Input:   changes (list[tuple[str, str]]): ("user" | "group" | "event", key) pairs that were modified.
+    # Output:  None
+    async def mark(self, changes):
+        self.dirty.update(dict.fromkeys(changes))
+        if len(self.dirty) >= self.threshold:
+            self.wake.set()
+        if self.durability == "flush":
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            self.wake.set()
+            await waiter
+
+    # Method:  run
+    # Desc:    Background loop that flushes every interval, or early when woken.
+    # Input:   None
+    # Output:  None
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wake.clear()
+            self.backend.poll()
+            try:
+                await self.flush()
+            except Exception as error:
+                print("Flush failed:", error)
+
+    # Method:  flush
+    # Desc:    Writes every dirty entity in one batch. Documents are encoded on the event loop so the
+    #          batch is a consistent view, then written to disk in a worker thread.
+    # Input:   None
+    # Output:  None
+    async def flush(self):
+        async with self.lock:
+            changes, self.dirty = list(self.dirty), {}
+            waiters, self.waiters = self.waiters, []
+            try:
+                if changes:
+                    payload = self.backend.encode(self.users, self.groups, self.events, changes)
+                    await asyncio.to_thread(self.backend.write, payload)
+                if self.backend.needs_snapshot():
+                    self.backend.snapshot(self.users, self.groups, self.events, background=True)
+                # Evict cold documents now their changes are on disk, keeping any marked dirty since
+                for documents in (self.users, self.events):
+                    if isinstance(documents, LazyDocuments):
+                        documents.trim(self.dirty)
+                # Writes deferred to a forked snapshot are only acknowledged once it has finished
+                while waiters and not self.backend.durable():
+                    await asyncio.sleep(0.01)
+                    if self.backend.needs_snapshot():
+                        self.backend.snapshot(self.users, self.groups, self.events, background=True)
+            except Exception as error:
+                # Keep the changes so the next flush retries them
+                self.dirty = dict.fromkeys(changes) | self.dirty
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(error)
+                raise
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+
+# Function: replay
+# Desc:    Applies every record in a journal file to the given users, groups and events.
+#          Lines that can't be decoded (a torn line from a crash mid-append) are skipped.
+# Input:   path (str): The journal file.
+#          users (dict): The users dictionary to update.
+#          groups (dict): The groups dictionary to update.
+#          events (dict): The events dictionary to update.
+# Output:  int: The number of records applied.
+def replay(path, users, groups, events):
+    count = 0
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.decoder.JSONDecodeError:
+                    continue
+                apply(record, users, groups, events)
+                count += 1
+    except FileNotFoundError:
+        pass
+    return count
+
+# Function: repair
+# Desc:    Truncates a journal file after its last complete line, dropping a torn record left by a crash
+#          mid-append. Only the end of the file is read.
+# Input:   path (str): The journal file.
+# Output:  None
+def repair(path):
+    try:
+        with open(path, "r+b") as f:
+            end = f.seek(0, os.SEEK_END)
+            position = end
+            while position > 0:
+                start = max(0, position - REPAIR_BLOCK)
+                f.seek(start)
+                newline = f.read(position - start).rfind(b"\n")
+                if newline >= 0:
+                    position = start + newline + 1
+                    break
+                position = start
+            if position < end:
+                f.truncate(position)
+    except FileNotFoundError:
+        pass
+
+# Function: apply
+# Desc:    Applies a single journal record to the given users, groups and events. Records that don't hold a
+#          document (change feed entries for replicas) are skipped.
+# Input:   record (dict): The journal record.
+#          users (dict): The users dictionary to update.
+#          groups (dict): The groups dictionary to update.
+#          events (dict): The events dictionary to update.
+# Output:  None
+def apply(record, users, groups, events):
+    target = {"user": users, "group": groups, "event": events}.get(record["type"])
+    if target is None:
+        return
+    if record["data"] is None:
+        target.pop(record["key"], None)
+    else:
+        target[record["key"]] = record["data"]
+
+# Function: create
+# Desc:    Creates a storage backend by name.
+# Input:   mode (str): "json", "journal", "sqlite" or "sharded".
+#          fork (bool): Whether JSON snapshots are written from a forked child process.
+#          binary (bool): Whether JSON and journal snapshots use the binary format.
+# Output:  The storage backend.
+def create(mode:str, fork:bool=False, binary:bool=False):
+    if mode == "json":
+        return JSONStorage(fork=fork, binary=binary)
+    if mode == "journal":
+        return JournalStorage(fork=fork, binary=binary)
+    if mode == "sqlite":
+        return SQLiteStorage()
+    if mode == "sharded":
+        return ShardedStorage()
+    raise ValueError(f"Unknown storage mode: {mode}")
+
+# Function: migrate
+# Desc:    Upgrades documents from older formats, in place. Users used to hold a full copy of every event
+#          on their calendar and groups a copy of every shared event; now each event is stored in events
+#          and referenced from its owner's "events", other users' "saved" and its group's "events"
+#          ({event_id: True}). The owner's copy wins; other copies are only kept if the owner no longer
+#          has the event. Group members used to be a list; now they are an insertion-ordered set
+#          ({username: True}) with a member_count. Documents already in the current format are left alone.
+# Input:   users (dict): All users.
+#          groups (dict): All groups.
+#          events (dict): All events, added to.
+# Output:  bool: Whether anything was upgraded.
+def migrate(users, groups, events):
+    migrated = False
+    copies = []
+    for username, user in users.items():
+        if "saved" in user:
+            continue
+        migrated = True
+        owned = {}
+        saved = {}
+        for event_id, event in user.get("events", {}).items():
+            if event.get("owner", username) == username:
+                events[event_id] = dict(event, owner=username)
+                owned[event_id] = True
+            else:
+                copies.append(event)
+                saved[event_id] = True
+        user["events"] = owned
+        user["saved"] = saved
+    for group_id, group in groups.items():
+        if isinstance(group.get("members"), list) or "member_count" not in group:
+            migrated = True
+            group["members"] = dict.fromkeys(group.get("members") or (), True)
+            group["member_count"] = len(group["members"])
+        group_events = group.get("events") or {}
+        # Some older handlers saved a group's events as a list
+        if isinstance(group_events, list):
+            group_events = {event["id"]: event for event in group_events}
+        elif all(value is True for value in group_events.values()) and "events" in group:
+            continue
+        migrated = True
+        for event in group_events.values():
+            if event is not True:
+                copies.append(dict(event, group_id=event.get("group_id") or group_id))
+        group["events"] = dict.fromkeys(group_events, True)
+    for event in copies:
+        events.setdefault(event["id"], event)
+    return migrated
+
+# Function: import_json
+# Desc:    One-shot import of users.json/groups.json/events.json into a SQLite database or shard directory, replacing its contents.
+# Input:   backend (SQLiteStorage | ShardedStorage): The backend to import into.
+#          users_file (str): Path to the users file.
+#          groups_file (str): Path to the groups file.
+#          events_file (str): Path to the events file (missing for data from before events were stored separately).
+# Output:  tuple[int, int, int]: The number of users, groups and events imported.
+def import_json(backend, users_file:str=USERS_FILE, groups_file:str=GROUPS_FILE, events_file:str=EVENTS_FILE):
+    users, groups, events = JSONStorage(users_file, groups_file, events_file=events_file).load()
+    backend.clear()
+    changes = [("user", username) for username in users] + [("group", group_id) for group_id in groups] + [("event", event_id) for event_id in events]
+    backend.commit(users, groups, events, changes)
+    backend.close()
+    return len(users), len(groups), len(events)
+
+# Import JSON data into SQLite or shards
+if __name__ == "__main__":
+    if sys.argv[1:2] != ["import"] or sys.argv[2:3] not in (["sqlite"], ["sharded"]):
+        print("Usage: python storage.py import sqlite|sharded [users.json] [groups.json] [events.json]")
+        sys.exit(1)
+    user_count, group_count, event_count = import_json(create(sys.argv[2]), *sys.argv[3:6])
+    print(f"Imported {user_count} users, {group_count} groups and {event_count} events")
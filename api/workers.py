@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# File:     workers.py
+# Program:  trackademic
+# Desc:     Runs the trackademic API as several processes so it can use more than one core. All state lives
+#           in memory, so plain `uvicorn --workers N` would give each worker its own diverging copy writing
+#           over the others' files. Instead, one writer process owns the data and its journal (on
+#           WRITER_PORT), and N reader processes share the public port: each keeps a replica by following the
+#           writer's journal, serves reads from it and forwards writes to the writer. Run from the directory
+#           holding the data files, e.g. `python workers.py 4`. A hot standby for a single primary is started
+#           the same way, e.g. `python workers.py --standby` next to a primary on PORT.
+#
+# Author:   Brendan Liang
+# Created:  17-10-2026
+# Modified: 17-10-2026
+
+import os
+import socket
+import subprocess
+import sys
+import time
+import main
+
+# Constants
+# Directory holding main.py, for uvicorn to import the app from
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+# Seconds to wait for the writer to start listening
+WRITER_START_TIMEOUT = 30
+
+# Function: start
+# Desc:    Starts the writer and, once it is listening (and has journaled its epoch), the readers, which all
+#          accept connections from one shared listening socket.
+# Input:   readers (int): The number of reader processes.
+#          directory (str | None): The directory holding the data files, or None for the current one.
+# Output:  list[subprocess.Popen]: The writer and reader processes.
+def start(readers:int, directory:str=None):
+    writer = spawn("writer", main.WRITER_PORT, directory)
+    processes = [writer]
+    try:
+        wait_for_port(main.HOST, main.WRITER_PORT, writer)
+        listener = socket.create_server((main.HOST, main.PORT), backlog=1024)
+        listener.set_inheritable(True)
+        for _ in range(readers):
+            reader = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--reader", str(listener.fileno())], cwd=directory, env=dict(os.environ, TRACKADEMIC_ROLE="reader"), pass_fds=(listener.fileno(),))
+            processes.append(reader)
+        # The readers hold their own copies of the socket; connections queue on it until they are ready
+        listener.close()
+    except Exception:
+        stop(processes)
+        raise
+    return processes
+
+# Function: spawn
+# Desc:    Starts a uvicorn process serving the app in some role on its own port.
+# Input:   role (str): The worker role (see main.WORKER_ROLES).
+#          port (int): The port to listen on.
+#          directory (str | None): The directory holding the data files, or None for the current one.
+# Output:  subprocess.Popen: The process.
+def spawn(role:str, port:int, directory:str=None):
+    command = [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", API_DIR, "--log-level", "warning", "--host", main.HOST, "--port", str(port)]
+    return subprocess.Popen(command, cwd=directory, env=dict(os.environ, TRACKADEMIC_ROLE=role))
+
+# Function: serve_reader
+# Desc:    Entry point of a reader process: serves the app on the listening socket inherited from start().
+#          (uvicorn's --fd option assumes a Unix socket, which leaves Nagle's algorithm on for TCP clients.)
+# Input:   fd (int): The inherited socket's file descriptor.
+# Output:  None
+def serve_reader(fd:int):
+    import uvicorn
+    config = uvicorn.Config("main:app", log_level="warning")
+    uvicorn.Server(config).run(sockets=[socket.socket(fileno=fd)])
+
+# Function: wait_for_port
+# Desc:    Waits until a port accepts connections.
+# Input:   host (str): The host.
+#          port (int): The port.
+#          process (subprocess.Popen): The process that should be listening, which mustn't exit meanwhile.
+# Output:  None
+def wait_for_port(host:str, port:int, process):
+    deadline = time.monotonic() + WRITER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Worker exited with code {process.returncode}")
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"Nothing listening on {host}:{port}")
+
+# Function: stop
+# Desc:    Stops the readers, then the writer, so the writer flushes everything forwarded to it.
+# Input:   processes (list[subprocess.Popen]): The writer and reader processes.
+# Output:  None
+def stop(processes):
+    for process in reversed(processes):
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+# Run the writer and readers (or a standby) until interrupted
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--reader"]:
+        serve_reader(int(sys.argv[2]))
+        sys.exit()
+    if sys.argv[1:2] == ["--standby"]:
+        processes = [spawn("standby", main.STANDBY_PORT)]
+        print(f"Standby on {main.HOST}:{main.STANDBY_PORT}; promote with POST /promote once the primary has stopped")
+    else:
+        processes = start(int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count())
+        print(f"Serving on {main.HOST}:{main.PORT} with {len(processes) - 1} readers; writer on port {main.WRITER_PORT}")
+    try:
+        processes[0].wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop(processes)
@@ -7,7 +7,7 @@
 #
 # Author:       Brendan Liang
 # Created:      19-07-2025
-# Modified:     17-08-2025
+# Modified:     17-10-2026
 
 # Import UI libraries
 import customtkinter as ctk
@@ -15,12 +15,11 @@ from tkinter import Event, messagebox
 
 # Import custom modules
 from screens import sidebar
-from utils import colour, icon, account, api
+from utils import colour, icon, account, api, stream
 from utils.components import HEntry, TimeInput, DateInput, SelectInput, Textbox, CalendarEvent
 
 # Import other libraries
 import datetime
-from hashlib import sha256
 
 # Declare globals
 frame_mini_calendar = None
@@ -42,6 +41,8 @@ inp_reminder = None
 inp_class = None
 inp_visibility = None
 inp_desc = None
+# Colours of the user's classes, by ID, for events assigned to them
+class_colours = {}
 
 def load_events():
     global visible_events, frame_calendar, cur_date
@@ -50,26 +51,62 @@ def load_events():
         event.destroy()
     visible_events.clear()
 
-    # Get events from API
-    account.pull_updates()
-    user_events = account.get("events")
+    # Get this week's events from API (with group names resolved)
+    week_start = cur_date - datetime.timedelta(days=cur_date.weekday())
+    week_end = week_start + datetime.timedelta(days=6)
+    result = api.get(f"users/{account.get('username')}/events?from={week_start.isoformat()}&to={week_end.isoformat()}")
+    if "error" in result:
+        return
+    user_events = result["events"]
     
     # Create calendar events
     for event_id, event_data in user_events.items():
-        if not event_data.get("date"):
-            continue  # Skip events without a date
-        date = datetime.date.fromisoformat(event_data["date"])
-        
-        if not (cur_date - datetime.timedelta(days=cur_date.weekday()) <= date <= cur_date + datetime.timedelta(days=6 - cur_date.weekday())):
-            continue # Skip events not in current week
-        
+        place_event(event_id, event_data)
+
+# Function: place_event
+# Desc:     Show an event on the calendar, or move and update it if it is already shown
+# Inputs:   event_id (str): The event's ID
+#           event_data (dict): The event
+# Outputs:  None
+def place_event(event_id:str, event_data:dict):
+    global visible_events, frame_calendar
+    date = datetime.date.fromisoformat(event_data["date"])
+    frame_event = visible_events.get(event_id)
+    if frame_event:
+        frame_event.update_event(event_data)
+    else:
         frame_event = CalendarEvent(frame_calendar, event_id, event_data, on_click=lambda e, f: event_clicked(e, f), placeholder=False)
-        row = event_data.get("start_time", 0) + 2  # Adjust for header rows
-        col = date.weekday() + 1  # +1 for the time marker column
-        frame_event.grid(row=row, column=col, sticky="nsew", padx=1, pady=1)
-    
+    row = event_data.get("start_time", 0) + 2  # Adjust for header rows
+    col = date.weekday() + 1  # +1 for the time marker column
+    frame_event.grid(row=row, column=col, sticky="nsew", padx=1, pady=1)
 
-        visible_events[event_id] = frame_event
+    visible_events[event_id] = frame_event
+
+# Function: apply_changes
+# Desc:     Apply changes pushed by the API to the events shown, without reloading the week
+# Inputs:   changes (dict): The changes since the last sync (see account.apply_updates)
+#           notifications (list[dict]): The notifications that prompted the sync
+# Outputs:  None
+def apply_changes(changes:dict, notifications:list):
+    global visible_events, frame_calendar, cur_date, selected_event
+    if not frame_calendar or not frame_calendar.winfo_exists():
+        return
+    if changes.get("reset"):
+        load_events()
+        return
+    week_start = cur_date - datetime.timedelta(days=cur_date.weekday())
+    week_end = week_start + datetime.timedelta(days=6)
+    for event_id, event_data in changes.get("events", {}).items():
+        # Leave the event being edited alone
+        if selected_event and selected_event.id == event_id:
+            continue
+        if week_start <= datetime.date.fromisoformat(event_data["date"]) <= week_end:
+            place_event(event_id, event_data)
+        elif event_id in visible_events:
+            visible_events.pop(event_id).destroy()
+    for event_id in changes.get("deleted_events", []):
+        if event_id in visible_events and not (selected_event and selected_event.id == event_id):
+            visible_events.pop(event_id).destroy()
         
 
 # Function: select_date
@@ -246,18 +283,10 @@ def form_updated(*args):
     #     event_reminder = int(event_reminder_str.split(" ")[0])
     # Class
     event_class_id = inp_class.get_value()
-    # Validate class_id
-    result = api.get(f"groups/{event_class_id}")
-    if result.get("error"):
+    # Validate class_id against the classes fetched when the calendar was built
+    if event_class_id not in class_colours:
         event_class_id = ""
-    event_colour = colour.ACC[0]
-    if event_class_id and event_class_id != "Select Class":    
-        # Get class data
-        event_class_data = api.get(f"groups/{event_class_id}")
-        if not event_class_data or event_class_data.get("error"):
-            messagebox.showerror("Error", "Failed to retrieve class data. Please try again later.", icon="error")
-            return
-        event_colour = event_class_data.get("colour", colour.ACC[0])
+    event_colour = class_colours.get(event_class_id, colour.ACC[0])
     # Visibility
     event_visibility_str = inp_visibility.get_value() or "Private"
     event_visible = event_visibility_str == "Share with class"
@@ -306,24 +335,32 @@ def form_updated(*args):
     if selected_event.placeholder:
         selected_event.placeholder = False
     
-    # Save to API
-    account.pull_updates()
-    user_events = account.get("events")
-    # If event already exists, update, else, create new event
-    target_event = user_events.get(selected_event.id)
-    # print(event_data)
-    if target_event:
-        # Update existing event
-        result = api.post(f"users/{account.get('username')}/events/edit", event_data)
-        if result.get("error"):
-            messagebox.showerror("Error", "Failed to update event. Please try again later.", icon="error")
-            return
-    else:
-        # Event should already exist
-        pass
+    # Save to API, unless the event was changed elsewhere meanwhile, and apply the changes it returns
+    result = api.post(api.versioned(account.synced(f"users/{account.get('username')}/events/edit"), selected_event.event_data.get("version")), event_data)
+    account.apply_response(result)
+    # Events that don't exist yet are skipped; they should already exist
+    if api.conflict(result):
+        account.pull_updates()
+        messagebox.showwarning("Warning", "This event was changed on another device, so your edit wasn't saved. Please check it and try again.", icon="warning")
+        show_latest(selected_event.id)
+        return
+    if result.get("error") and result.get("error") != "Event not found":
+        messagebox.showerror("Error", "Failed to update event. Please try again later.", icon="error")
+        return
 
+    event_data["version"] = result.get("version")
     selected_event.update_event(event_data)
 
+# Function: show_latest
+# Desc:     Show the latest synced version of an event (e.g. after a change to it was rejected)
+# Inputs:   event_id (str): The event's ID
+# Outputs:  None
+def show_latest(event_id:str):
+    latest = (account.get("events") or {}).get(event_id)
+    if latest:
+        place_event(event_id, latest)
+        update_form(latest)
+
 
 def event_clicked(clickEvent:Event, event:CalendarEvent):
     global selected_event, frame_cover, inp_title, inp_date, inp_type, inp_start_time, inp_end_time, inp_reminder, inp_class, inp_visibility, inp_desc
@@ -431,18 +468,17 @@ def calendar_clicked(clickEvent:Event):
         "description": ""
     }
 
-    # Generate event_id
-    account.pull_updates()
+    # Push event to API, which assigns its ID
     username = account.get("username")
-    user_events = account.get("events")
-    numerical_id = max([event.get("numerical_id") for event in user_events.values()] + [0]) + 1
-    event_id = sha256(f"{username}{numerical_id}".encode()).hexdigest()
+    result = api.post(account.synced(f"users/{username}/events/create"), event_data)
+    if "error" in result:
+        return
+    event_id = result["event_id"]
     # Add event_id to event_data
     event_data["id"] = event_id
-    event_data["numerical_id"] = numerical_id
-    # Push event to API
-    api.post(f"users/{username}/events/create", event_data)
-    account.pull_updates()
+    event_data["numerical_id"] = result["numerical_id"]
+    event_data["version"] = result.get("version")
+    account.apply_response(result)
     
     frame_event = CalendarEvent(frame_calendar, event_id, event_data, on_click=lambda e, f: event_clicked(e, f))
     frame_event.grid(row=time, column=day+1, sticky="nsew", padx=1, pady=1)
@@ -463,16 +499,21 @@ def delete_event():
     if not selected_event:
         return
     
+    # Remove from API, unless the event was changed elsewhere meanwhile
+    username = account.get("username")
+    result = api.get(api.versioned(account.synced(f"users/{username}/events/delete/{selected_event.id}"), selected_event.event_data.get("version")))
+    account.apply_response(result)
+    if api.conflict(result):
+        account.pull_updates()
+        messagebox.showwarning("Warning", "This event was changed on another device, so it wasn't deleted. Please check it and try again.", icon="warning")
+        show_latest(selected_event.id)
+        return
+
     # Remove from visible events
     del visible_events[selected_event.id]
     
     # Remove from calendar
     selected_event.destroy()
-
-    # Remove from API
-    username = account.get("username")
-    api.get(f"users/{username}/events/delete/{selected_event.id}")
-    pull_updates = account.pull_updates()
     
     # Reset selected event
     selected_event = None
@@ -503,7 +544,8 @@ def update_date_labels(date:datetime.date=datetime.date.today()):
 def construct(app:ctk.CTk) -> ctk.CTkFrame:
     # Import globals
     global date_labels, frame_calendar, frame_mini_calendar, cur_date, frame_cover, \
-    inp_title, inp_date, inp_type, inp_start_time, inp_end_time, inp_date, inp_reminder, inp_class, inp_visibility, inp_desc, visible_events
+    inp_title, inp_date, inp_type, inp_start_time, inp_end_time, inp_date, inp_reminder, inp_class, inp_visibility, inp_desc, visible_events, \
+    class_colours
 
     # Initialize globals
     date_labels = [None] * 7
@@ -599,12 +641,17 @@ def construct(app:ctk.CTk) -> ctk.CTkFrame:
     # Turn classes into list of names
     class_names = []
     class_ids = []
+    # Fetch all the classes in one round trip
+    class_colours = {}
+    batch = api.Batch()
     for group_id in classes.keys():
-        group = api.get(f"groups/{group_id}")
+        batch.get(f"groups/{group_id}")
+    for group_id, group in zip(classes.keys(), batch.flush()):
         if not group or group.get("error"):
             continue
         class_ids.append(group_id)
         class_names.append(group.get("name"))
+        class_colours[group_id] = group.get("colour", colour.ACC[0])
     inp_class = SelectInput(frame_form, values=class_names, default_value="Select Class", on_change=form_updated, hidden_values=class_ids)
     inp_class.grid(row=4, column=1, sticky="nsew", padx=5, pady=5)
 
@@ -670,8 +717,10 @@ def construct(app:ctk.CTk) -> ctk.CTkFrame:
     # Bind click event to create event
     frame_calendar.bind("<Button-1>", calendar_clicked)
     
-    # Load existing events
+    # Load existing events, then keep them up to date with changes pushed by the API
     load_events()
+    stream.listeners["calendar"] = apply_changes
+    stream.start(app)
     
     # Construct sidebar
     sidebar_weight = sidebar.get_mode()
@@ -7,16 +7,24 @@
 #
 # Author:       Brendan Liang
 # Created:      19-07-2025
-# Modified:     16-08-2025
+# Modified:     17-10-2026
 
 import customtkinter as ctk
 from screens import sidebar
-from utils import colour, icon, api, account
+from utils import colour, icon, api, account, reference, stream
 from utils.components import clear_frame, SelectInput
 from tkinter import messagebox, Event
+from urllib.parse import quote
 
 loaded_classes = {}
 
+# Constants
+# Number of members fetched per page in the class details modal
+MEMBER_PAGE_SIZE = 50
+# Number of classes fetched per page, and the fields the class tiles need
+CLASS_PAGE_SIZE = 100
+TILE_FIELDS = "id,name,school,colour,member_count"
+
 # Globals
 search_entry = None
 content_frame = None
@@ -55,7 +63,7 @@ def create_class_tile(parent, class_data, row, col):
     members_label = ctk.CTkLabel(info_frame, 
                                 image=icon.icon("group"),
                                 compound="left",
-                                text=f" {len(class_data.get('members'))} Members", 
+                                text=f" {class_data.get('member_count', len(class_data.get('members', [])))} Members", 
                                 font=("sans-serif", 12), 
                                 text_color=colour.TXT, anchor="w")
     members_label.grid(row=0, column=0, sticky="w")
@@ -89,7 +97,7 @@ def create_class_tile(parent, class_data, row, col):
     details_btn.pack(side="left", padx=(0, 10))
     
     # Action button (Join/Leave)
-    joined = account.get("username") in class_data.get("members", [])
+    joined = class_data.get("id") in (account.get("groups") or {})
     button_text = "LEAVE" if joined else "JOIN"
     button_color = "#FF6B6B" if joined else "#4A90E2"
     
@@ -111,26 +119,28 @@ def detail_close(details_cover, class_data):
     # Close popup
     details_cover.destroy()
     # Update class group on user (whether to save events or not)
-    user = account.get()
-    print(user)
-    # This is a bool because it used to represent whether to show events or not, but
-    # that feature was removed.
-    user.get("groups", {})[class_data["id"]] = True
-    # Update user in API & locally
-    api.post("users/update", user)
-    account.pull_updates()
+    # Update user in API & locally in one round trip, trying again with the latest user if it changed meanwhile
+    for attempt in range(2):
+        user = account.get()
+        # This is a bool because it used to represent whether to show events or not, but
+        # that feature was removed.
+        user.get("groups", {})[class_data["id"]] = True
+        result = api.post(api.versioned(account.synced("users/update"), user.get("version")), user)
+        account.apply_response(result)
+        if not api.conflict(result):
+            break
+        account.pull_updates()
 
     # Update groups UI
-    loaded_classes = api.get("groups")
-    # Updated local user
     filter_classes()
     
 
-def handle_class_details(class_data):
+def handle_class_details(class_data, fetched=False):
     global loaded_classes
 
-    # Update class_data
-    class_data = api.get(f"groups/{class_data.get('id')}")
+    # Update class_data, unless the caller just fetched it
+    if not fetched:
+        class_data = api.get(f"groups/{class_data.get('id')}")
     if class_data.get("error") or not class_data:
         messagebox.showerror("Error", "Failed to load class details. Please try again later.", icon="error")
         return
@@ -173,7 +183,7 @@ def handle_class_details(class_data):
     members_frame = ctk.CTkFrame(header_frame, fg_color="transparent")
     members_frame.grid(row=0, column=1, sticky="e", padx=30, pady=20)
     
-    members_title = ctk.CTkLabel(members_frame, text=f"Members ({len(class_data.get('members', []))})",
+    members_title = ctk.CTkLabel(members_frame, text=f"Members ({class_data.get('member_count', len(class_data.get('members', [])))})",
                                 font=("sans-serif", 16, "bold"), text_color="white")
     members_title.pack(anchor="e", padx=(0, 60))
     
@@ -208,25 +218,37 @@ def handle_class_details(class_data):
     members_scroll = ctk.CTkScrollableFrame(right_info, fg_color="transparent", height=100)
     members_scroll.pack(fill="both", expand=True, padx=10, pady=10)
     
-    # Add member list
-    for member in class_data.get('members', []):
-        member_frame = ctk.CTkFrame(members_scroll, fg_color="transparent")
-        member_frame.pack(fill="x", pady=2)
-        
-        member_icon = ctk.CTkLabel(member_frame,
-                                  image=icon.icon("group"), 
-                                  text="", width=20, height=20)
-        member_icon.pack(side="left", padx=(0, 8))
-        
-        name = member
-        if class_data.get("owner") == member:
-            name += " (Owner)"
-        if member == account.get("username"):
-            name += " (You)"
-        member_name = ctk.CTkLabel(member_frame, text=name,
-                                  font=("sans-serif", 12),
-                                  text_color=colour.TXT, anchor="w")
-        member_name.pack(side="left", fill="x", expand=True)
+    # Add member list, a page at a time so big classes don't render thousands of rows
+    def load_members(cursor=""):
+        page = api.get(f"groups/{class_data['id']}/members?cursor={quote(cursor)}&limit={MEMBER_PAGE_SIZE}")
+        if page.get("error"):
+            return
+        for member in page.get("members", []):
+            member_frame = ctk.CTkFrame(members_scroll, fg_color="transparent")
+            member_frame.pack(fill="x", pady=2)
+            
+            member_icon = ctk.CTkLabel(member_frame,
+                                      image=icon.icon("group"), 
+                                      text="", width=20, height=20)
+            member_icon.pack(side="left", padx=(0, 8))
+            
+            name = member
+            if class_data.get("owner") == member:
+                name += " (Owner)"
+            if member == account.get("username"):
+                name += " (You)"
+            member_name = ctk.CTkLabel(member_frame, text=name,
+                                      font=("sans-serif", 12),
+                                      text_color=colour.TXT, anchor="w")
+            member_name.pack(side="left", fill="x", expand=True)
+        # Button to load the next page
+        if page.get("next_cursor"):
+            more_btn = ctk.CTkButton(members_scroll, text="Load more",
+                                     fg_color="transparent", text_color="#4A90E2",
+                                     height=24, corner_radius=5)
+            more_btn.configure(command=lambda: (more_btn.destroy(), load_members(page["next_cursor"])))
+            more_btn.pack(pady=2)
+    load_members()
     
     # Events section
     events_main_frame = ctk.CTkFrame(details_frame, fg_color="transparent")
@@ -371,59 +393,39 @@ def handle_class_details(class_data):
     def save_event_to_calendar(event_data):
         """Save event to user's personal calendar"""
         messagebox.showinfo("Save Event", f"Event '{event_data.get('title')}' saved to your calendar!")
-        # Check event is not already saved
-        account.pull_updates()
-        user_events = account.get("events")
-        if not user_events:
-            user_events = {}
-        if event_data.get("id") in user_events:
+        # Add event to user's personal calendar, updating local user data from the response
+        result = api.get(account.synced(f"users/{account.get('username')}/events/save/{event_data.get('id')}"))
+        account.apply_response(result)
+        if result.get("error") == "Event already saved":
             messagebox.showwarning("Save Event", "This event is already saved to your calendar.")
             return
-        # Add event to user's personal calendar
-        user_events[event_data.get("id")] = event_data
-        # Update user data in API
-        user = account.get()
-        user["events"] = user_events
-        api.post("users/update", user)
-        # Update local user data
-        account.pull_updates()
+        if result.get("error"):
+            messagebox.showerror("Save Event", "Failed to save event. Please try again later.", icon="error")
+            return
         # Show success message
         messagebox.showinfo("Save Event", f"Event '{event_data.get('title')}' saved to your calendar!")
-        # Reload details to reflect changes
+        # Reload details to reflect changes; saving doesn't change the class
         details_cover.destroy()
-        new_event_data = api.get(f"groups/{class_data.get('id')}")
-        if new_event_data.get("error") or not new_event_data:
-            messagebox.showerror("Error", "Failed to load class details. Please try again later.", icon="error")
-            return
-        handle_class_details(new_event_data)
+        handle_class_details(class_data, fetched=True)
         
         return
     
     def unsave_event(event_data):
         """Remove event from user's personal calendar"""
-        # Check if event is saved
-        account.pull_updates()
-        user_events = account.get("events")
-        if not user_events or event_data.get("id") not in user_events:
+        # Remove event from user's personal calendar, updating local user data from the response
+        result = api.get(account.synced(f"users/{account.get('username')}/events/unsave/{event_data.get('id')}"))
+        account.apply_response(result)
+        if result.get("error") == "Event not found":
             messagebox.showwarning("Unsave Event", "This event is not saved in your calendar.")
             return
-        # Remove event from user's personal calendar
-        del user_events[event_data.get("id")]
-        # Update user data in API
-        user = account.get()
-        user["events"] = user_events
-        api.post("users/update", user)
-        # Update local user data
-        account.pull_updates()
+        if result.get("error"):
+            messagebox.showerror("Unsave Event", "Failed to unsave event. Please try again later.", icon="error")
+            return
         # Show success message
         messagebox.showinfo("Unsave Event", f"Event '{event_data.get('title')}' removed from your calendar!")
-        # Reload details to reflect changes
+        # Reload details to reflect changes; unsaving doesn't change the class
         details_cover.destroy()
-        new_event_data = api.get(f"groups/{class_data.get('id')}")
-        if new_event_data.get("error") or not new_event_data:
-            messagebox.showerror("Error", "Failed to load class details. Please try again later.", icon="error")
-            return
-        handle_class_details(new_event_data)
+        handle_class_details(class_data, fetched=True)
         
         return
 
@@ -436,18 +438,24 @@ def handle_class_details(class_data):
         if not group_id:
             messagebox.showerror("Error", "Could not delete event. Try again later.", icon="error")
             return
-        result = api.get(f"groups/{group_id}/events/delete/{event_data.get('id')}")
-        if result.get("error"):
+        # Delete the event, update local user data and reload the class in one round trip
+        batch = api.Batch()
+        delete = batch.get(api.versioned(f"groups/{group_id}/events/delete/{event_data.get('id')}", event_data.get("version")))
+        pull = account.pull_updates(batch)
+        group = batch.get(f"groups/{group_id}")
+        results = batch.flush()
+        account.apply_updates(results[pull])
+        if api.conflict(results[delete]):
+            messagebox.showwarning("Delete Event", "This event was changed by someone else, so it wasn't deleted. Please check it and try again.")
+            details_cover.destroy()
+            handle_class_details(results[group], fetched=True)
+            return
+        if results[delete].get("error"):
             messagebox.showerror("Error", "Could not delete event. Try again later.", icon="error")
             return
-        account.pull_updates()
         # Refresh details after deletion
         details_cover.destroy()
-        new_data = api.get(f"groups/{class_data.get('id')}")
-        if new_data.get("error") or not new_data:
-            messagebox.showerror("Error", "Failed to load class details. Please try again later.", icon="error")
-            return
-        handle_class_details(new_data)
+        handle_class_details(results[group], fetched=True)
             
     
     # Sample events data (replace with actual API call)
@@ -463,11 +471,10 @@ def handle_class_details(class_data):
         
     # Leave/join class button
     def join_leave_handler():
-        handle_class_action(class_data)
+        new_data = handle_class_action(class_data)
         # Refresh details after action
         details_cover.destroy()
-        new_data = api.get(f"groups/{class_data.get('id')}")
-        handle_class_details(new_data)
+        handle_class_details(new_data, fetched=True)
     joined = account.get("username") in class_data.get("members", [])
     leave_class_btn = ctk.CTkButton(button_section, text=("Leave Class" if joined else "Join Class"),
                                    fg_color=("#FF6B6B" if joined else "#4A90E2"), text_color=colour.TXT,
@@ -482,18 +489,21 @@ def handle_class_details(class_data):
         confirm = messagebox.askokcancel("Delete Class", "Are you sure you want to delete this class for all users? (This action is destructive!)")
         if not confirm:
             return
-        # Actually delete class
-        result = api.get(f"groups/{class_data["id"]}/delete")
-        if result.get("error"):
+        # Actually delete class, updating local user data in the same round trip
+        batch = api.Batch()
+        delete = batch.get(api.versioned(f"groups/{class_data["id"]}/delete", class_data.get("version")))
+        pull = account.pull_updates(batch)
+        results = batch.flush()
+        if api.conflict(results[delete]):
+            messagebox.showwarning("Delete Class", "This class was changed by someone else, so it wasn't deleted. Please check it and try again.")
+        elif results[delete].get("error"):
             messagebox.showwarning("Delete Class", "Could not delete class; try again later.")
         
         # Close details and update API
-        account.pull_updates()
+        account.apply_updates(results[pull])
         # Close popup
         details_cover.destroy()
         # Update groups UI
-        loaded_classes = api.get("groups")
-        # Updated local user
         filter_classes()
 
     if account.get("username") == class_data.get("owner"):
@@ -506,19 +516,32 @@ def handle_class_details(class_data):
 
 def handle_class_action(class_data):
     global loaded_classes
-    joined = account.get("username") in class_data.get("members", [])
-    if joined:
-        # Leaving
-        success = api.post(f"groups/{class_data.get('id')}/leave", account.get())
+    joined = class_data.get("id") in (account.get("groups") or {})
+    # Join or leave; the response has the updated class and the changes to the local user
+    action = "leave" if joined else "join"
+    result = api.post(account.synced(f"groups/{class_data.get('id')}/{action}"), account.get())
+    if result.get("error"):
+        messagebox.showerror("Error", "Failed to update class membership. Please try again later.", icon="error")
+        return class_data
+    # Update local user, then groups UI
+    account.apply_response(result)
+    patch_class(result["group"])
+    return result["group"]
+
+# Function: patch_class
+# Desc:     Update a class's tile from a copy of the class returned by the API, without fetching the classes again
+# Inputs:   group (dict): The class
+# Outputs:  None
+def patch_class(group:dict):
+    global loaded_classes
+    tile = {field: group.get(field) for field in TILE_FIELDS.split(",")}
+    # Classes the user left drop out of "My Classes"
+    if filter_select.get_value() == "My Classes" and group["id"] not in (account.get("groups") or {}):
+        loaded_classes.pop(group["id"], None)
     else:
-        # Joining
-        success = api.post(f"groups/{class_data.get('id')}/join", account.get())
-    # Update groups UI
-    loaded_classes = api.get("groups")
-    # Updated local user
-    account.pull_updates()
-    print(account.get("groups"))
-    filter_classes()
+        loaded_classes[group["id"]] = tile
+    if content_frame and content_frame.winfo_exists():
+        fill_classes(content_frame, loaded_classes)
 
     
 
@@ -528,34 +551,52 @@ def handle_class_action(class_data):
 # Outputs:  None
 def filter_classes(*args):
     global search_entry, content_frame, loaded_classes, filter_select
-    loaded_classes = api.get("groups")
-    search_text = search_entry.get().strip().lower()
-    classes = []
-    final_classes = {}
-    # Check for search matches
-    for group in loaded_classes.values():
-        if search_text in group["name"].lower() or search_text in group["school"].lower():
-            classes.append(group)
-    # Check for filter matches
+    # Fetch only the classes matching the filter, and only the fields the tiles show
     filter_value = filter_select.get_value()
+    search_text = search_entry.get().strip()
     if filter_value == "My Classes":
-        username = account.get("username")
-        for group in classes:
-            if username in group.get("members", []):
-                final_classes[group.get("id")] = group
-    elif filter_value == "Same School":
-        school = account.get("school")
-        print(school)
-        for group in classes:
-            if group.get("school") == school:
-                final_classes[group.get("id")] = group
-    # This was code that would overwrite all the filtering previously done
-    # for group in classes:
-    #     final_classes[group.get("id")] = group
+        loaded_classes = fetch_classes(f"member={quote(account.get('username') or '')}")
+        # A user's own classes are few, so they are searched here
+        search_text = search_text.lower()
+        loaded_classes = {group_id: group for group_id, group in loaded_classes.items()
+                          if search_text in group["name"].lower() or search_text in group["school"].lower()}
+    elif search_text:
+        # Let the server's search index find and rank matches
+        result = api.get(f"groups/search?q={quote(search_text)}&school={quote(account.get('school') or '')}&limit={CLASS_PAGE_SIZE}&fields={TILE_FIELDS}")
+        loaded_classes = result.get("groups", {})
+    else:
+        loaded_classes = fetch_classes(f"school={quote(account.get('school') or '')}")
     # Clear and fill content frame with filtered classes
-    fill_classes(content_frame, final_classes)
+    fill_classes(content_frame, loaded_classes)
     return
 
+# Function: apply_changes
+# Desc:     Refresh the class tiles when changes pushed by the API affect classes
+# Inputs:   changes (dict): The changes since the last sync (see account.apply_updates)
+#           notifications (list[dict]): The notifications that prompted the sync
+# Outputs:  None
+def apply_changes(changes:dict, notifications:list):
+    if not content_frame or not content_frame.winfo_exists():
+        return
+    if changes.get("reset") or changes.get("groups") or changes.get("left_groups") or any(message.get("kind") == "group" for message in notifications):
+        filter_classes()
+
+# Function: fetch_classes
+# Desc:     Fetches every page of a filtered class listing, with just the fields the class tiles need
+# Inputs:   query (str): The filter query string, e.g. "school=..." or "member=..."
+# Outputs:  dict: The classes keyed by ID (empty if the request failed)
+def fetch_classes(query):
+    classes = {}
+    cursor = ""
+    while True:
+        page = api.get(f"groups?{query}&fields={TILE_FIELDS}&limit={CLASS_PAGE_SIZE}&cursor={quote(cursor)}")
+        if page.get("error"):
+            return classes
+        classes.update(page.get("groups", {}))
+        cursor = page.get("next_cursor")
+        if not cursor:
+            return classes
+
 def create_new_class(app:ctk.CTk):
     global loaded_classes
     # Create form cover
@@ -607,7 +648,7 @@ def create_new_class(app:ctk.CTk):
     subject_frame = ctk.CTkFrame(form_frame, fg_color="transparent", height=30, corner_radius=5)
     subject_frame.grid(row=2, column=0, sticky="ew", padx=30, pady=10)
 
-    subjects = api.get("subjects").get("subjects", [])
+    subjects = reference.subjects()
     subject_input = SelectInput(subject_frame, subjects, "Select Subject")
     subject_input.configure(fg_color=colour.GREY)
     subject_input.place(relx=0.5, rely=0.5, anchor="center", relheight=1, relwidth=0.9)
@@ -683,23 +724,19 @@ def create_new_class(app:ctk.CTk):
         }
         
         # Send to API
-        response = api.post("groups/create", new_class)
+        response = api.post(account.synced("groups/create"), new_class)
         if not response.get("success"):
             if response.get("error") == "Group already exists":
                 messagebox.showerror("Error", "Group with the same subject and school already exist.")
             else:
                 messagebox.showerror("Error", "Failed to create class. Please try again.")
             return
-        loaded_classes = api.get("groups")
-        print(new_class)
         # Close the form
         cover.destroy()
         messagebox.showinfo("Success", "Class created successfully!")
-        # Refresh
-        account.pull_updates()
-        global content_frame
-        loaded_classes = api.get("groups")
-        fill_classes(content_frame, loaded_classes)
+        # Refresh from the response
+        account.apply_response(response)
+        patch_class(response["group"])
         return
         
         
@@ -757,9 +794,10 @@ def construct(app:ctk.CTk) -> ctk.CTkFrame:
     content_frame.columnconfigure(0, weight=1)
     content_frame.columnconfigure(1, weight=1)
     
-    # Generate class tiles dynamically
-    groups = api.get("groups")
+    # Generate class tiles dynamically, refreshing them when classes change
     filter_classes()
+    stream.listeners["groups"] = apply_changes
+    stream.start(app)
     
     # Construct sidebar
     sidebar_weight = sidebar.get_mode()
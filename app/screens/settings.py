@@ -7,11 +7,11 @@
 #
 # Author:       Brendan Liang
 # Created:      19-07-2025
-# Modified:     17-08-2025
+# Modified:     17-10-2026
 
 import customtkinter as ctk
 from screens import sidebar, signin
-from utils import colour, icon, api, account, validation, config
+from utils import colour, icon, api, account, validation, config, reference
 from utils.components import clear_frame, SelectInput
 from tkinter import messagebox
 
@@ -45,10 +45,8 @@ def save_settings():
     if not school_valid:
         return
     # Further school validation
-    valid_schools = api.get("schools")
-    if valid_schools.get("schools"):
-        valid_schools = valid_schools.get("schools", [])
-    else:
+    valid_schools = reference.schools()
+    if not valid_schools:
         messagebox.showwarning("Warning", "Error getting schools. Please try again later.", icon="warning")
         return
     
@@ -59,12 +57,16 @@ def save_settings():
     account.pull_updates()
     user_data = account.get()
     user_data["school"] = new_school
-    success = api.post("users/update", user_data)
+    success = api.post(api.versioned(account.synced("users/update"), user_data.get("version")), user_data)
+    if api.conflict(success):
+        account.pull_updates()
+        messagebox.showwarning("Warning", "Your account was changed on another device. Please check your settings and try again.", icon="warning")
+        return
     if not success:
         messagebox.showerror("Error", "Failed to update user data. Please try again later.", icon="error")
         return
     # Update config
-    account.pull_updates()
+    account.apply_response(success)
 
 def construct(app:ctk.CTk) -> ctk.CTkFrame:
     global entry_username, entry_school
@@ -81,11 +83,7 @@ def construct(app:ctk.CTk) -> ctk.CTkFrame:
     # entry_username = ctk.CTkEntry(frame_form, placeholder_text="", font=("sans-serif", 18))
     # entry_username.pack(side="top", fill="x", padx=30, pady=5)
 
-    schools = api.get("schools")
-    if schools:
-        schools = schools.get("schools", [])
-    else:
-        schools = []
+    schools = reference.schools()
     label_school = ctk.CTkLabel(frame_form, text="School", anchor="w", font=("sans-serif", 18))
     label_school.pack(side="top", fill="x", padx=30, pady=(30, 5))
     entry_school = SelectInput(frame_form, schools, "")
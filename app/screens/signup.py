@@ -7,14 +7,14 @@
 #
 # Author:       Brendan Liang
 # Created:      19-07-2025
-# Modified:     17-08-2025
+# Modified:     17-10-2026
 
 # Import UI libraries
 import customtkinter as ctk
 from tkinter import messagebox
 
 # Import custom modules
-from utils import colour, account, validation, api
+from utils import colour, account, validation, api, reference
 from utils.components import HEntry, clear_frame, SelectInput
 from screens import signin, sidebar, calendar
 
@@ -61,9 +61,7 @@ def construct(app:ctk.CTk) -> ctk.CTkFrame:
     label_title.grid(row=0, column=0, padx=10, sticky="sew")
 
 
-    schools = api.get("schools")
-    if schools:
-        schools = schools.get("schools", [])
+    schools = reference.schools()
     entry_confirm = HEntry(frame_form, "Confirm Password", "Type here...", censor=True, on_submit=lambda: try_signup(app, frame_main))
     entry_confirm.grid(row=4, column=0, sticky="nsew", padx=30)
     entry_pass = HEntry(frame_form, "Password", "Type here...", censor=True, on_submit=entry_confirm.entry.focus)
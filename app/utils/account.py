@@ -7,7 +7,7 @@
 #
 # Author:       Brendan Liang
 # Created:      19-07-2025
-# Modified:     16-08-2025
+# Modified:     17-10-2026
 
 # Import libraries
 from hashlib import sha256
@@ -51,8 +51,11 @@ def signin(username, password_hash=None, password=None):
         "password_hash": password_hash,
         "school": result.get("school", ""),
         "groups": result.get("groups", {}),
-        "events": result.get("events", {})
+        "events": result.get("events", {}),
+        "version": result.get("version")
     }
+    # The next pull_updates fetches the whole user to start syncing from
+    data.pop("syncVersion", None)
     config.write(data)
 
     return True, result
@@ -86,8 +89,10 @@ def signup(username, display_name, password, school):
         "password_hash": password_hash,
         "school": school,
         "groups": {},
-        "events": {}
+        "events": {},
+        "version": result.get("version")
     }
+    data.pop("syncVersion", None)
     config.write(data)
     
     return True
@@ -131,28 +136,82 @@ def get(key=None):
         return logged_in_user
     return None
 
-# Function: pull_updates
-# Desc:     Pull updates for the logged in user from the API
+# Function: changes_endpoint
+# Desc:     Get the endpoint that returns what changed for the logged in user since the last sync
 # Inputs:   None
-# Outputs:  bool: Whether the pull was successful
-def pull_updates():
-    user = get()
+# Outputs:  str | None: The endpoint, or None if no user is logged in
+def changes_endpoint():
+    data = config.read()
+    user = data.get("loggedInUser")
     if not user:
+        return None
+    return f"users/{user.get('username')}/changes?since={data.get('syncVersion', '')}"
+
+# Function: synced
+# Desc:     Add the logged in user's sync version to a change's endpoint, so the response includes what changed
+#           for the user since the last sync (apply it with apply_response) and no pull is needed afterwards
+# Inputs:   endpoint (str): The API endpoint
+# Outputs:  str: The endpoint with the sync version
+def synced(endpoint) -> str:
+    return f"{endpoint}{'&' if '?' in endpoint else '?'}since={config.read().get('syncVersion', '')}"
+
+# Function: apply_response
+# Desc:     Apply the changes returned with a change's response (see synced) to the logged in user
+# Inputs:   result (dict): The change's response
+# Outputs:  bool: Whether changes were applied
+def apply_response(result):
+    if "changes" not in result:
         return False
-    username = user.get("username")
-    result = api.get(f"users/{username}")
-    if result.get("error"):
-        return False
-    # Update config with new user data
+    return apply_updates(result["changes"])
+
+# Function: apply_updates
+# Desc:     Apply the changes returned by the changes endpoint to the logged in user
+# Inputs:   result (dict): The changes endpoint's response
+# Outputs:  bool: Whether the changes were applied
+def apply_updates(result):
     data = config.read()
-    # Save password hash since API does not return it
-    password_hash = data["loggedInUser"].get("password_hash", "")
-    result["password_hash"] = password_hash
-    # Save updated user data
-    data["loggedInUser"] = result
-    config.write(data)
+    user = data.get("loggedInUser")
+    if not user or result.get("error"):
+        return False
+    if result.get("reset"):
+        # Replace the whole user, keeping the password hash since API does not return it
+        new_user = result.get("user", {})
+        new_user["password_hash"] = user.get("password_hash", "")
+        data["loggedInUser"] = new_user
+    else:
+        # Apply the changes in place
+        events = user.setdefault("events", {})
+        events.update(result.get("events", {}))
+        for event_id in result.get("deleted_events", []):
+            events.pop(event_id, None)
+        groups = user.setdefault("groups", {})
+        groups.update(result.get("groups", {}))
+        for group_id in result.get("left_groups", []):
+            groups.pop(group_id, None)
+        user.update(result.get("profile", {}))
+    # The user's version can change without anything the client keeps changing
+    user_changed = "user_version" in result and result["user_version"] != user.get("version")
+    if user_changed:
+        data["loggedInUser"]["version"] = result["user_version"]
+    # Only rewrite config.json if something changed
+    if result.get("version") != data.get("syncVersion") or result.get("reset") or user_changed:
+        data["syncVersion"] = result.get("version", "")
+        config.write(data)
     return True
 
+# Function: pull_updates
+# Desc:     Pull updates for the logged in user from the API, applying only what changed since the last sync
+# Inputs:   batch (api.Batch): A batch to queue the pull on instead of sending it now (optional)
+# Outputs:  bool | int: Whether the pull was successful, or the position of its result in the batch
+#           (pass that result to apply_updates once the batch is flushed)
+def pull_updates(batch=None):
+    endpoint = changes_endpoint()
+    if batch is not None:
+        return batch.get(endpoint or "404")
+    if not endpoint:
+        return False
+    return apply_updates(api.get(endpoint))
+
 def get_all_events():
     user = get()
     if not user:
@@ -7,17 +7,26 @@
 #
 # Author:       Brendan Liang
 # Created:      19-07-2025
-# Modified:     16-08-2025
+# Modified:     17-10-2026
 
 # Import libraries
 import requests
 import json
+import os
+from hashlib import sha256
 from tkinter import messagebox
 
 # Constants
 # Define the host and port for the API server
 HOST = "127.0.0.1"
 PORT = 8000
+# Directory where GET responses are kept with their ETags, so unchanged responses can be revalidated
+CACHE_DIR = "cache"
+# Status of a change rejected because the user, group or event changed since the version sent with it
+CONFLICT = 409
+
+# Cached GET responses by URL: {"etag": str, "body": str}
+cache = {}
 
 # Function: post
 # Desc:     Make a POST request to the API
@@ -28,6 +37,9 @@ def post(endpoint, data) -> dict:
     url = f"http://{HOST}:{PORT}/{endpoint}"
     try:
         response = requests.post(url, json=data)
+        # A conflict's body has the current version
+        if response.status_code == CONFLICT:
+            return response.json()
         if response.status_code != 200:
             return {"error": "network"}
         return response.json()
@@ -35,17 +47,132 @@ def post(endpoint, data) -> dict:
         messagebox.showerror("Error", "Failed to connect to the server. Please check your network connection.", icon="error")
         return {"error": "network"}
     
+# Function: versioned
+# Desc:     Add the version of the user, group or event a change was made to, so the API rejects the change if
+#           it was changed since (e.g. from another device)
+# Inputs:   endpoint (str): The API endpoint
+#           version (int | None): The version last fetched, or None not to check
+# Outputs:  str: The endpoint with the version
+def versioned(endpoint, version) -> str:
+    if version is None:
+        return endpoint
+    return f"{endpoint}{'&' if '?' in endpoint else '?'}version={version}"
+
+# Function: conflict
+# Desc:     Check whether a response is a version conflict
+# Inputs:   result (dict): The response
+# Outputs:  bool: Whether the change was rejected because of a newer version
+def conflict(result) -> bool:
+    return result.get("error") == "Version conflict"
+
+# Function: cache_path
+# Desc:     Get the file a URL's cached response is kept in
+# Inputs:   url (str): The request URL
+# Outputs:  str: The cache file path
+def cache_path(url) -> str:
+    return os.path.join(CACHE_DIR, f"{sha256(url.encode()).hexdigest()}.json")
+
+# Function: cached
+# Desc:     Get the cached response for a URL, loading it from disk if needed
+# Inputs:   url (str): The request URL
+# Outputs:  dict | None: The cached {"etag", "body"}, or None if there isn't one
+def cached(url):
+    if url not in cache:
+        try:
+            with open(cache_path(url), "r") as file:
+                cache[url] = json.load(file)
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            return None
+    return cache[url]
+
+# Function: store
+# Desc:     Cache a response with its ETag, in memory and on disk
+# Inputs:   url (str): The request URL
+#           etag (str): The response's ETag
+#           body (str): The response body
+# Outputs:  None
+def store(url, etag, body):
+    cache[url] = {"etag": etag, "body": body}
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(cache_path(url), "w") as file:
+            json.dump(cache[url], file)
+    except OSError:
+        pass
+
 # Function: get
-# Desc:     Make a GET request to the API
+# Desc:     Make a GET request to the API, revalidating any cached copy so unchanged responses aren't resent
 # Inputs:   endpoint (str): The API endpoint to get data from
 # Outputs:  dict: The JSON response from the API
 def get(endpoint) -> dict:
     url = f"http://{HOST}:{PORT}/{endpoint}"
+    entry = cached(url)
+    headers = {"If-None-Match": entry["etag"]} if entry else {}
     try:
-        response = requests.get(url)
+        response = requests.get(url, headers=headers)
+        # Not modified, so use the cached copy; parse it again so callers can't change the cache
+        if response.status_code == 304 and entry:
+            return json.loads(entry["body"])
+        if response.status_code == CONFLICT:
+            return response.json()
         if response.status_code != 200:
             return {"error": "network"}
+        if "ETag" in response.headers:
+            store(url, response.headers["ETag"], response.text)
         return response.json()
     except requests.exceptions.ConnectionError:
         messagebox.showerror("Error", "Failed to connect to the server. Please check your network connection.", icon="error")
-        return {"error": "network"}
\ No newline at end of file
+        return {"error": "network"}
+
+# Class:    Batch
+# Desc:     Queues several API calls and sends them to the API in one round trip, run in order
+# Properties:
+#   - requests (list[dict]): The queued calls
+class Batch:
+    def __init__(self):
+        self.requests = []
+
+    # Method:   get
+    # Desc:     Queue a GET request, revalidating any cached copy like get() does
+    # Inputs:   endpoint (str): The API endpoint to get data from
+    # Outputs:  int: The position of the call's result in flush()'s results
+    def get(self, endpoint) -> int:
+        entry = cached(f"http://{HOST}:{PORT}/{endpoint}")
+        headers = {"If-None-Match": entry["etag"]} if entry else {}
+        self.requests.append({"method": "GET", "path": endpoint, "headers": headers})
+        return len(self.requests) - 1
+
+    # Method:   post
+    # Desc:     Queue a POST request
+    # Inputs:   endpoint (str): The API endpoint to post to
+    #           data (dict): The data to send in the request body
+    # Outputs:  int: The position of the call's result in flush()'s results
+    def post(self, endpoint, data) -> int:
+        self.requests.append({"method": "POST", "path": endpoint, "body": data})
+        return len(self.requests) - 1
+
+    # Method:   flush
+    # Desc:     Send the queued calls in one request and empty the queue
+    # Inputs:   None
+    # Outputs:  list[dict]: The JSON response of each call, in the order they were queued
+    def flush(self) -> list:
+        queued, self.requests = self.requests, []
+        if not queued:
+            return []
+        response = post("batch", {"requests": queued})
+        if response.get("error"):
+            return [{"error": "network"} for _ in queued]
+        results = []
+        for request, result in zip(queued, response.get("results", [])):
+            url = f"http://{HOST}:{PORT}/{request['path']}"
+            if result["status"] == 304 and cached(url):
+                results.append(json.loads(cached(url)["body"]))
+            elif result["status"] == CONFLICT:
+                results.append(result["body"])
+            elif result["status"] != 200:
+                results.append({"error": "network"})
+            else:
+                if request["method"] == "GET" and result.get("etag"):
+                    store(url, result["etag"], json.dumps(result["body"]))
+                results.append(result["body"])
+        return results
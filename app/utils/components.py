@@ -7,7 +7,7 @@
 #
 # Author:       Brendan Liang
 # Created:      19-07-2025
-# Modified:     16-08-2025
+# Modified:     16-10-2026
 
 # Import UI libraries
 import customtkinter as ctk
@@ -698,15 +698,7 @@ class CalendarEvent(ctk.CTkFrame):
         self.label_title.pack(side="top", fill="x", padx=5, pady=(2, 0))
         self.label_title.bind("<Button-1>", lambda e: on_click(e, self))
 
-        class_id = event_data.get("class", None)
-        class_name = "No Class"
-        if class_id:
-            class_data = api.get(f"groups/{class_id}")
-            print(class_data)
-            if not class_data.get("error"):
-                class_name = class_data.get("name", "No Class")
-
-        self.label_class = ctk.CTkLabel(self, text=class_name, text_color=colour.TXT, font=("sans-serif", 8), width=1, height=1, wraplength=80)
+        self.label_class = ctk.CTkLabel(self, text="No Class", text_color=colour.TXT, font=("sans-serif", 8), width=1, height=1, wraplength=80)
         self.label_class.pack(side="top", fill="x", padx=5, pady=(0, 2))
         self.label_class.pack_propagate(False)
         self.label_class.bind("<Button-1>", lambda e: on_click(e, self))
@@ -735,6 +727,22 @@ class CalendarEvent(ctk.CTkFrame):
             self.configure(border_color=event_colour, border_width=1)
         return True
 
+    # Method:   class_name
+    # Desc:     Returns the name of an event's class, using the name resolved by the API when present
+    #           and only fetching the group otherwise (e.g. for events edited locally)
+    # Inputs:   event_data (dict): The event
+    # Outputs:  str: The class name, or "No Class"
+    def class_name(self, event_data:dict) -> str:
+        class_id = event_data.get("class", event_data.get("group_id"))
+        if not class_id:
+            return "No Class"
+        if event_data.get("group_name") and class_id == event_data.get("group_id"):
+            return event_data["group_name"]
+        class_data = api.get(f"groups/{class_id}")
+        if class_data.get("error"):
+            return "No Class"
+        return class_data.get("name", "No Class")
+
     def update_event(self, event_data:dict):
         self.event_data = event_data
         # Title
@@ -742,14 +750,7 @@ class CalendarEvent(ctk.CTkFrame):
         # Type
         self.label_type.configure(text=event_data.get("type", "SAC"))
         # Class
-        class_id = event_data.get("class", None)
-        class_name = "No Class"
-        if class_id:
-            class_data = api.get(f"groups/{class_id}")
-            print(class_data)
-            if not class_data.get("error"):
-                class_name = class_data.get("name", "No Class")
-        self.label_class.configure(text=class_name)
+        self.label_class.configure(text=self.class_name(event_data))
         # Update visual
         height = self.event_data.get("end_time", 1) - self.event_data.get("start_time", 0)
         self.grid(row=self.event_data.get("start_time", 0) + 2, rowspan=height, sticky="nsew")
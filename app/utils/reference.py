@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# File:         reference.py
+# Program:      trackademic
+# Desc:         Reference data (subjects and schools) shared by the signup, settings and class screens
+#
+# Author:       Brendan Liang
+# Created:      17-10-2026
+# Modified:     17-10-2026
+
+# Import libraries
+from urllib.parse import quote
+from utils import api, config
+
+# Globals
+# The subjects and schools with their version, fetched once per session
+data: dict = None
+
+# Function: load
+# Desc:     Get the reference data, fetching it on first use (revalidating the copy cached by api.get). The
+#           version last fetched is sent with the request, so an unchanged response may be cached indefinitely
+# Inputs:   None
+# Outputs:  dict: The reference data, or an empty dict if it couldn't be fetched
+def load() -> dict:
+    global data
+    if data is None:
+        settings = config.read()
+        version = settings.get("referenceVersion", "")
+        response = api.get(f"reference?version={quote(version)}" if version else "reference")
+        if "error" in response:
+            return {}
+        data = response
+        if data.get("version", "") != version:
+            settings["referenceVersion"] = data.get("version", "")
+            config.write(settings)
+    return data
+
+# Function: subjects
+# Desc:     Get the subjects classes can be created for
+# Inputs:   None
+# Outputs:  list[str]: The subjects
+def subjects() -> list:
+    return load().get("subjects", [])
+
+# Function: schools
+# Desc:     Get the schools users can belong to
+# Inputs:   None
+# Outputs:  list[str]: The schools
+def schools() -> list:
+    return load().get("schools", [])
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# File:         stream.py
+# Program:      trackademic
+# Desc:         Listens for change notifications pushed by the API and applies them to the open screens
+#
+# Author:       Brendan Liang
+# Created:      17-10-2026
+# Modified:     17-10-2026
+
+# Import libraries
+import json
+import queue
+import threading
+import time
+import requests
+from utils import api, account, config
+
+# Constants
+# Seconds to wait before reconnecting after the stream drops
+RETRY_DELAY = 5
+# Milliseconds between checks for notifications on the UI thread
+POLL_INTERVAL = 250
+
+# Globals
+# Notifications received by the listener thread, waiting to be applied on the UI thread
+notifications = queue.Queue()
+# Callbacks of the open screens, by name: callback(changes (dict), notifications (list[dict]))
+listeners = {}
+listener_thread: threading.Thread = None
+
+# Function: listen
+# Desc:     Read change notifications from the API for the logged in user, reconnecting whenever the stream
+#           drops (e.g. for falling behind); runs on the listener thread
+# Inputs:   None
+# Outputs:  None
+def listen():
+    while True:
+        # The config is read here too, and may be caught mid-write by the UI thread; just try again later
+        try:
+            username = account.get("username")
+            if username:
+                # Let the server tell us if we missed anything since the last sync
+                headers = {"Accept": "text/event-stream", "Last-Event-ID": config.read().get("syncVersion", "")}
+                with requests.get(f"http://{api.HOST}:{api.PORT}/users/{username}/stream", headers=headers, stream=True, timeout=(5, None)) as response:
+                    if response.headers.get("content-type", "").startswith("text/event-stream"):
+                        for line in response.iter_lines(decode_unicode=True):
+                            if line and line.startswith("data:"):
+                                notifications.put(json.loads(line[5:]))
+        except (requests.exceptions.RequestException, json.decoder.JSONDecodeError, OSError):
+            pass
+        time.sleep(RETRY_DELAY)
+
+# Function: apply
+# Desc:     Pull the changes behind any received notifications and pass them to the open screens; runs on the
+#           UI thread
+# Inputs:   app (ctk.CTk): The app, to schedule the next check on
+# Outputs:  None
+def apply(app):
+    received = []
+    while not notifications.empty():
+        received.append(notifications.get())
+    if received:
+        endpoint = account.changes_endpoint()
+        changes = api.get(endpoint) if endpoint else {"error": "signed out"}
+        if account.apply_updates(changes):
+            for listener in list(listeners.values()):
+                listener(changes, received)
+    app.after(POLL_INTERVAL, apply, app)
+
+# Function: start
+# Desc:     Start listening for changes, if not already listening
+# Inputs:   app (ctk.CTk): The app
+# Outputs:  None
+def start(app):
+    global listener_thread
+    if listener_thread:
+        return
+    listener_thread = threading.Thread(target=listen, daemon=True)
+    listener_thread.start()
+    app.after(POLL_INTERVAL, apply, app)